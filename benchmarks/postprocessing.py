@@ -0,0 +1,530 @@
+"""
+Benchmarks for the postprocessing implementations.
+
+Runs every implementation registered in image_workflows, one step at a time, and
+the confounds workflow with each engine, on synthetic data of several sizes. Each
+case is timed over a number of repeats, with the CPU time and peak memory of its
+nodes recorded by the postprocessing NodeProfiler. Cases whose implementation
+needs an external binary which isn't installed are skipped.
+
+The report is JSON, keyed by case, so two reports can be compared for
+regressions:
+
+    python benchmarks/postprocessing.py run -size small -size medium -o new.json
+    python benchmarks/postprocessing.py compare baseline.json new.json
+"""
+
+import json
+import logging
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import click
+import psutil
+
+from synthetic import TR, SIZES, make_dataset
+
+from clpipe.config.options import PostProcessingOptions
+from clpipe.postprocutils.confounds_native import ENGINE_NATIVE
+from clpipe.postprocutils.confounds_workflows import build_confounds_processing_workflow
+from clpipe.postprocutils.image_workflows import *
+from clpipe.postprocutils.profiling import BYTES_PER_MB, NodeProfiler
+
+SCHEMA_VERSION = 1
+ENGINE_NIPYPE = "nipype"
+WORKFLOW_IMAGE = "image"
+WORKFLOW_CONFOUNDS = "confounds"
+
+STATUS_OK = "ok"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+FSL_MATHS = ["fslmaths", "fslstats"]
+TEMPORAL_FILTERING_BINARIES = {
+    IMPLEMENTATION_BUTTERWORTH: [],
+    IMPLEMENTATION_FSLMATHS: ["fslmaths"],
+    IMPLEMENTATION_FSLMATHS_NATIVE: [],
+    IMPLEMENTATION_AFNI_3DTPROJECT: ["3dTproject"],
+    IMPLEMENTATION_PROJECTION: [],
+}
+"""Temporal filter implementations, with the binaries each one runs."""
+
+
+@dataclass
+class Case:
+    """A single workflow to benchmark."""
+
+    workflow: str
+    step: str
+    implementation: str
+    binaries: list = field(default_factory=list)
+    options: dict = field(default_factory=dict)
+
+    def case_id(self, size: str) -> str:
+        return f"{self.workflow}/{self.step}/{self.implementation}/{size}"
+
+
+IMAGE_CASES = [
+    *(
+        Case(
+            WORKFLOW_IMAGE,
+            STEP_TEMPORAL_FILTERING,
+            implementation,
+            binaries,
+            {"temporal_filtering.implementation": implementation},
+        )
+        for implementation, binaries in TEMPORAL_FILTERING_BINARIES.items()
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_INTENSITY_NORMALIZATION,
+        IMPLEMENTATION_10000_GLOBAL_MEDIAN,
+        FSL_MATHS,
+        {"intensity_normalization.implementation": IMPLEMENTATION_10000_GLOBAL_MEDIAN},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_SPATIAL_SMOOTHING,
+        IMPLEMENTATION_SUSAN,
+        ["susan"] + FSL_MATHS,
+        {"spatial_smoothing.implementation": IMPLEMENTATION_SUSAN},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_AROMA_REGRESSION,
+        IMPLEMENTATION_FSL_REGFILT,
+        ["fsl_regfilt"],
+        {"aroma_regression.implementation": IMPLEMENTATION_FSL_REGFILT},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_AROMA_REGRESSION,
+        IMPLEMENTATION_FSL_REGFILT_R,
+        ["Rscript"],
+        {"aroma_regression.implementation": IMPLEMENTATION_FSL_REGFILT_R},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_CONFOUND_REGRESSION,
+        IMPLEMENTATION_FSL_GLM,
+        ["fsl_glm"],
+        {"confound_regression.implementation": IMPLEMENTATION_FSL_GLM},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_CONFOUND_REGRESSION,
+        IMPLEMENTATION_AFNI_3DTPROJECT,
+        ["3dTproject"],
+        {"confound_regression.implementation": IMPLEMENTATION_AFNI_3DTPROJECT},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_CONFOUND_REGRESSION,
+        IMPLEMENTATION_PROJECTION,
+        [],
+        {"confound_regression.implementation": IMPLEMENTATION_PROJECTION},
+    ),
+    Case(WORKFLOW_IMAGE, STEP_APPLY_MASK, "fslmaths", ["fslmaths"]),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_TRIM_TIMEPOINTS,
+        "native",
+        [],
+        {"trim_timepoints.from_beginning": 4, "trim_timepoints.from_end": 2},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_SCRUB_TIMEPOINTS,
+        "InsertNA",
+        [],
+        {"scrub_timepoints.insert_na": True},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_SCRUB_TIMEPOINTS,
+        "Remove",
+        [],
+        {"scrub_timepoints.insert_na": False},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_SCRUB_TIMEPOINTS,
+        "Interpolate",
+        [],
+        {"scrub_timepoints.interpolate": True},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_RESAMPLE,
+        IMPLEMENTATION_FLIRT,
+        ["flirt"],
+        {"resample.implementation": IMPLEMENTATION_FLIRT},
+    ),
+    Case(
+        WORKFLOW_IMAGE,
+        STEP_RESAMPLE,
+        IMPLEMENTATION_NATIVE,
+        [],
+        {"resample.implementation": IMPLEMENTATION_NATIVE},
+    ),
+    Case(WORKFLOW_IMAGE, STEP_BETA_SERIES, "LSS", []),
+]
+
+CONFOUNDS_CASES = [
+    Case(
+        WORKFLOW_CONFOUNDS,
+        STEP_TEMPORAL_FILTERING,
+        f"{engine}_{implementation}",
+        binaries if engine == ENGINE_NIPYPE else [],
+        {
+            "temporal_filtering.implementation": implementation,
+            "engine": engine,
+        },
+    )
+    for engine in (ENGINE_NATIVE, ENGINE_NIPYPE)
+    for implementation, binaries in TEMPORAL_FILTERING_BINARIES.items()
+    # The native engine hands afni_3dTproject back to nipype
+    if not (
+        engine == ENGINE_NATIVE and implementation == IMPLEMENTATION_AFNI_3DTPROJECT
+    )
+]
+
+CASES = IMAGE_CASES + CONFOUNDS_CASES
+
+
+def build_options(case: Case, dataset) -> PostProcessingOptions:
+    """Get postprocessing options which run only the case's step."""
+    options = PostProcessingOptions()
+    options.processing_steps = [case.step]
+    step_options = options.processing_step_options
+    step_options.resample.reference_image = str(dataset.reference_file)
+    # A band-pass, so every filter runs both its high and low-pass paths
+    step_options.temporal_filtering.filtering_high_pass = 0.01
+    step_options.temporal_filtering.filtering_low_pass = 0.1
+
+    for name, value in case.options.items():
+        if name == "engine":
+            options.confound_options.engine = value
+            continue
+        step_name, option_name = name.split(".")
+        setattr(getattr(step_options, step_name), option_name, value)
+
+    return options
+
+
+def build_workflow(case: Case, dataset, base_dir: Path):
+    """Build the case's workflow on the dataset, working in base_dir."""
+    options = build_options(case, dataset)
+
+    if case.workflow == WORKFLOW_CONFOUNDS:
+        return build_confounds_processing_workflow(
+            options,
+            confounds_file=dataset.confounds_file,
+            export_file=base_dir / "confounds.tsv",
+            tr=TR,
+            name="confounds_wf",
+            base_dir=base_dir,
+            crashdump_dir=base_dir,
+        )
+
+    # The native resampler otherwise caches under the default working directory
+    options.working_directory = str(base_dir)
+    return build_image_postprocessing_workflow(
+        options,
+        in_file=dataset.image_file,
+        export_path=base_dir / "postprocessed.nii.gz",
+        name="image_wf",
+        mask_file=dataset.mask_file,
+        mixing_file=dataset.mixing_file,
+        noise_file=dataset.noise_file,
+        confounds_file=dataset.processed_confounds_file,
+        tr=TR,
+        scrub_vector=dataset.scrub_vector,
+        events_file=dataset.events_file,
+        base_dir=base_dir,
+        crashdump_dir=base_dir,
+    )
+
+
+def run_case(case: Case, dataset, work_dir: Path, repeats: int) -> dict:
+    """Time a case over a number of repeats, each in a new working directory so
+    that nipype doesn't reuse the previous run's results."""
+    result = {
+        "id": case.case_id(dataset.size),
+        "workflow": case.workflow,
+        "step": case.step,
+        "implementation": case.implementation,
+        "size": dataset.size,
+        "voxels": dataset.n_voxels,
+        "volumes": dataset.n_volumes,
+    }
+
+    missing = [binary for binary in case.binaries if shutil.which(binary) is None]
+    if missing:
+        return {
+            **result,
+            "status": STATUS_SKIPPED,
+            "reason": f"Not installed: {', '.join(missing)}",
+        }
+
+    wall_times, cpu_times, peak_rss, peak_rss_delta = [], [], [], []
+    for repeat in range(repeats):
+        base_dir = work_dir / result["id"].replace("/", "_") / str(repeat)
+        profiler = NodeProfiler()
+        baseline_rss = psutil.Process().memory_info().rss / BYTES_PER_MB
+        try:
+            workflow = build_workflow(case, dataset, base_dir)
+            start = time.perf_counter()
+            workflow.run(plugin="Linear", plugin_args={"status_callback": profiler})
+            wall_times.append(time.perf_counter() - start)
+        except Exception as error:
+            return {
+                **result,
+                "status": STATUS_FAILED,
+                "reason": f"{type(error).__name__}: {error}".strip(),
+            }
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+        cpu_times.append(sum(record["cpu_time"] for record in profiler.records))
+        node_peak = max(
+            (record["peak_rss_mb"] for record in profiler.records), default=0
+        )
+        peak_rss.append(node_peak)
+        peak_rss_delta.append(max(node_peak - baseline_rss, 0))
+
+    return {
+        **result,
+        "status": STATUS_OK,
+        "reason": None,
+        "wall_time": statistics.median(wall_times),
+        "wall_times": wall_times,
+        "cpu_time": statistics.median(cpu_times),
+        "peak_rss_mb": max(peak_rss),
+        "peak_rss_delta_mb": max(peak_rss_delta),
+    }
+
+
+def environment() -> dict:
+    """Describe where a report was run, so reports from different machines
+    aren't mistaken for regressions."""
+    import nibabel
+    import nipype
+    import numpy
+    import scipy
+
+    from clpipe.config.package import VERSION
+
+    binaries = sorted(
+        {binary for case in CASES for binary in case.binaries},
+    )
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": psutil.cpu_count(),
+        "memory_mb": psutil.virtual_memory().total / BYTES_PER_MB,
+        "versions": {
+            "clpipe": VERSION,
+            "nipype": nipype.__version__,
+            "nibabel": nibabel.__version__,
+            "numpy": numpy.__version__,
+            "scipy": scipy.__version__,
+        },
+        "binaries": {binary: shutil.which(binary) for binary in binaries},
+    }
+
+
+def select_cases(steps: tuple, workflows: tuple) -> list:
+    cases = CASES
+    if steps:
+        cases = [case for case in cases if case.step in steps]
+    if workflows:
+        cases = [case for case in cases if case.workflow in workflows]
+    return cases
+
+
+def compare_reports(
+    baseline: dict, current: dict, threshold: float, min_time: float, min_memory: float
+) -> list:
+    """Compare the results two reports share by id.
+
+    A result regresses when its wall time or peak memory grows by more than the
+    threshold, as a fraction of the baseline, and by more than the minimum
+    difference, or when a case which ran in the baseline now fails.
+    """
+    baseline_results = {result["id"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        previous = baseline_results.get(result["id"])
+        if previous is None:
+            continue
+        row = {
+            "id": result["id"],
+            "baseline_status": previous["status"],
+            "status": result["status"],
+            "regressions": [],
+        }
+        if previous["status"] == STATUS_OK and result["status"] == STATUS_FAILED:
+            row["regressions"].append("failed")
+        if previous["status"] == STATUS_OK and result["status"] == STATUS_OK:
+            for metric, min_difference in (
+                ("wall_time", min_time),
+                ("peak_rss_delta_mb", min_memory),
+            ):
+                before, after = previous[metric], result[metric]
+                row[metric] = (before, after)
+                if after > before * (1 + threshold) and after - before > min_difference:
+                    row["regressions"].append(metric)
+        rows.append(row)
+
+    return rows
+
+
+@click.group()
+def cli():
+    """Benchmark the postprocessing implementations."""
+
+
+@cli.command()
+@click.option(
+    "-size",
+    "sizes",
+    multiple=True,
+    default=["small", "medium"],
+    show_default=True,
+    help=f"Image size to run: one of {', '.join(SIZES)}, or XxYxZxT. May be repeated.",
+)
+@click.option(
+    "-step",
+    "steps",
+    multiple=True,
+    help="Only run this processing step. May be repeated.",
+)
+@click.option(
+    "-workflow",
+    "workflows",
+    multiple=True,
+    type=click.Choice([WORKFLOW_IMAGE, WORKFLOW_CONFOUNDS]),
+    help="Only run image or confounds workflows. May be repeated.",
+)
+@click.option(
+    "-repeats", default=3, show_default=True, help="Runs of each case to time."
+)
+@click.option(
+    "-work_dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Where to write the synthetic data and working files. "
+    "Defaults to a temporary directory.",
+)
+@click.option(
+    "-output_file",
+    "-o",
+    type=click.Path(dir_okay=False),
+    default="benchmark_report.json",
+    show_default=True,
+    help="Where to save the report.",
+)
+def run(sizes, steps, workflows, repeats, work_dir, output_file):
+    """Run the benchmarks and save a report."""
+    cases = select_cases(steps, workflows)
+    if not cases:
+        raise click.UsageError("No benchmark cases match the given steps.")
+    # Node-by-node logging would bury the results
+    logging.getLogger("nipype.workflow").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        temp_dir = Path(temp_dir)
+        results = []
+        for size in sizes:
+            dataset = make_dataset(size, temp_dir / "data" / size)
+            for case in cases:
+                result = run_case(case, dataset, temp_dir / "work", repeats)
+                results.append(result)
+                click.echo(_format_result(result))
+
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {"sizes": list(sizes), "repeats": repeats},
+        "results": sorted(results, key=lambda result: result["id"]),
+    }
+    with open(output_file, "w") as file_to_write:
+        json.dump(report, file_to_write, indent=4)
+    click.echo(f"Report saved to {output_file}")
+
+
+@cli.command()
+@click.argument("baseline_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("report_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-threshold",
+    default=0.25,
+    show_default=True,
+    help="Relative increase in wall time or memory counted as a regression.",
+)
+@click.option(
+    "-min_time",
+    default=0.5,
+    show_default=True,
+    help="Smallest increase in wall time, in seconds, counted as a regression.",
+)
+@click.option(
+    "-min_memory",
+    default=50.0,
+    show_default=True,
+    help="Smallest increase in peak memory, in MB, counted as a regression.",
+)
+def compare(baseline_file, report_file, threshold, min_time, min_memory):
+    """Compare a report against a baseline report. Exits with status 1 if any
+    case regressed."""
+    with open(baseline_file) as file_to_read:
+        baseline = json.load(file_to_read)
+    with open(report_file) as file_to_read:
+        current = json.load(file_to_read)
+
+    rows = compare_reports(baseline, current, threshold, min_time, min_memory)
+    for row in rows:
+        click.echo(_format_comparison(row))
+
+    regressed = [row for row in rows if row["regressions"]]
+    click.echo(f"{len(rows)} cases compared, {len(regressed)} regressed.")
+    if regressed:
+        sys.exit(1)
+
+
+def _format_result(result: dict) -> str:
+    if result["status"] != STATUS_OK:
+        return f"{result['id']:<60} {result['status']}: {result['reason']}"
+    return (
+        f"{result['id']:<60} {result['wall_time']:8.2f}s "
+        f"{result['cpu_time']:8.2f}s cpu {result['peak_rss_delta_mb']:8.1f}MB"
+    )
+
+
+def _format_comparison(row: dict) -> str:
+    if "wall_time" not in row:
+        status = f"{row['baseline_status']} -> {row['status']}"
+        flag = " REGRESSED" if row["regressions"] else ""
+        return f"{row['id']:<60} {status}{flag}"
+
+    time_before, time_after = row["wall_time"]
+    memory_before, memory_after = row["peak_rss_delta_mb"]
+    flag = f" REGRESSED: {', '.join(row['regressions'])}" if row["regressions"] else ""
+    return (
+        f"{row['id']:<60} {time_before:8.2f}s -> {time_after:8.2f}s "
+        f"{memory_before:8.1f}MB -> {memory_after:8.1f}MB{flag}"
+    )
+
+
+if __name__ == "__main__":
+    cli()
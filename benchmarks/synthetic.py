@@ -0,0 +1,210 @@
+"""
+Synthetic inputs for the postprocessing benchmarks.
+
+Each dataset is a 4D BOLD-like image with a brain-shaped mask, an fMRIPrep-style
+confounds file, the same confounds after processing, AROMA mixing and noise
+files, an events file and a coarser reference image. The data are generated from
+a seed, so every run benchmarks the same inputs.
+"""
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+
+TR = 2.0
+N_COMPONENTS = 20
+N_NOISE_COMPONENTS = 8
+CONFOUND_COLUMNS = [
+    "csf",
+    "csf_derivative1",
+    "white_matter",
+    "white_matter_derivative1",
+]
+MOTION_COLUMNS = ["trans_x", "trans_y", "trans_z", "rot_x", "rot_y", "rot_z"]
+
+SIZES = {
+    "small": ((24, 24, 16), 120),
+    "medium": ((48, 48, 32), 200),
+    "large": ((64, 64, 40), 300),
+}
+"""Named sizes, as ((x, y, z), volumes)."""
+
+
+@dataclass
+class Dataset:
+    """Paths to a synthetic dataset's files."""
+
+    size: str
+    shape: tuple
+    n_volumes: int
+    image_file: Path
+    mask_file: Path
+    confounds_file: Path
+    processed_confounds_file: Path
+    mixing_file: Path
+    noise_file: Path
+    events_file: Path
+    reference_file: Path
+    scrub_vector: list
+
+    @property
+    def n_voxels(self) -> int:
+        return int(np.prod(self.shape))
+
+
+def parse_size(size: str) -> tuple:
+    """Get the (x, y, z) shape and volumes of a named size, or of a size written
+    as XxYxZxT, such as 32x32x24x150."""
+    if size in SIZES:
+        return SIZES[size]
+    try:
+        x, y, z, t = (int(dim) for dim in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(
+            f"Unknown size: {size}. Use one of {list(SIZES)}, or XxYxZxT."
+        ) from None
+    return (x, y, z), t
+
+
+def make_dataset(size: str, out_dir: os.PathLike, seed: int = 0) -> Dataset:
+    """Write a synthetic dataset of the given size to out_dir."""
+    shape, n_volumes = parse_size(size)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    mask = _ellipsoid_mask(shape)
+    confounds = _confounds(n_volumes, rng)
+    mixing = rng.standard_normal((n_volumes, N_COMPONENTS))
+    data = _bold_data(shape, n_volumes, mask, confounds, mixing, rng)
+
+    affine = np.diag([3.0, 3.0, 3.5, 1.0])
+    affine[:3, 3] = -np.array(shape) * affine.diagonal()[:3] / 2
+
+    image_file = out_dir / "sub-bench_task-bench_desc-preproc_bold.nii.gz"
+    image = nib.Nifti1Image(data, affine)
+    image.header.set_xyzt_units("mm", "sec")
+    image.header.set_zooms(tuple(affine.diagonal()[:3]) + (TR,))
+    nib.save(image, image_file)
+
+    mask_file = out_dir / "sub-bench_task-bench_desc-brain_mask.nii.gz"
+    nib.save(nib.Nifti1Image(mask.astype(np.uint8), affine), mask_file)
+
+    # A coarser grid over the same field of view
+    reference_affine = affine.copy()
+    reference_affine[:3, :3] *= 1.5
+    reference_shape = tuple(int(np.ceil(dim / 1.5)) for dim in shape)
+    reference_file = out_dir / "reference.nii.gz"
+    nib.save(
+        nib.Nifti1Image(np.zeros(reference_shape, dtype=np.float32), reference_affine),
+        reference_file,
+    )
+
+    confounds_file = out_dir / "sub-bench_task-bench_desc-confounds_timeseries.tsv"
+    confounds.to_csv(confounds_file, sep="\t", index=False, na_rep="n/a")
+    processed_confounds_file = out_dir / "processed_confounds.tsv"
+    confounds[CONFOUND_COLUMNS].fillna(0).to_csv(
+        processed_confounds_file, sep="\t", index=False
+    )
+
+    mixing_file = out_dir / "desc-MELODIC_mixing.tsv"
+    np.savetxt(mixing_file, mixing, delimiter="\t")
+    noise_file = out_dir / "AROMAnoiseICs.csv"
+    noise = rng.choice(N_COMPONENTS, N_NOISE_COMPONENTS, replace=False) + 1
+    noise_file.write_text(",".join(str(ic) for ic in sorted(noise)))
+
+    events_file = out_dir / "sub-bench_task-bench_events.tsv"
+    onsets = np.arange(10, n_volumes * TR - 20, 12.0)
+    pd.DataFrame(
+        {
+            "onset": onsets,
+            "duration": 2.0,
+            "trial_type": np.where(np.arange(len(onsets)) % 2, "go", "stop"),
+        }
+    ).to_csv(events_file, sep="\t", index=False)
+
+    scrub_vector = (confounds["framewise_displacement"] > 0.5).astype(int).tolist()
+
+    return Dataset(
+        size=size,
+        shape=shape,
+        n_volumes=n_volumes,
+        image_file=image_file,
+        mask_file=mask_file,
+        confounds_file=confounds_file,
+        processed_confounds_file=processed_confounds_file,
+        mixing_file=mixing_file,
+        noise_file=noise_file,
+        events_file=events_file,
+        reference_file=reference_file,
+        scrub_vector=scrub_vector,
+    )
+
+
+def _ellipsoid_mask(shape: tuple) -> np.ndarray:
+    grid = np.indices(shape, dtype=np.float32)
+    centre = (np.array(shape, dtype=np.float32) - 1) / 2
+    radii = np.array(shape, dtype=np.float32) * 0.4
+    distance = sum(((grid[i] - centre[i]) / radii[i]) ** 2 for i in range(3))
+    return distance <= 1
+
+
+def _confounds(n_volumes: int, rng: np.random.Generator) -> pd.DataFrame:
+    times = np.arange(n_volumes) * TR
+    confounds = {}
+    for column, baseline in (("csf", 330.0), ("white_matter", 240.0)):
+        signal = baseline + np.cumsum(rng.standard_normal(n_volumes)) * 0.5
+        signal += 2 * np.sin(2 * np.pi * 0.005 * times)
+        confounds[column] = signal
+        confounds[f"{column}_derivative1"] = np.r_[np.nan, np.diff(signal)]
+    confounds["global_signal"] = (
+        confounds["csf"] * 0.3 + confounds["white_matter"] * 0.7
+    )
+    for column in MOTION_COLUMNS:
+        confounds[column] = np.cumsum(rng.standard_normal(n_volumes)) * 0.01
+
+    # Mostly still, with a few large movements to scrub
+    displacement = np.abs(rng.normal(0.1, 0.05, n_volumes))
+    spikes = rng.choice(n_volumes, max(1, n_volumes // 20), replace=False)
+    displacement[spikes] = rng.uniform(0.6, 1.5, spikes.size)
+    displacement[0] = np.nan
+    confounds["framewise_displacement"] = displacement
+
+    return pd.DataFrame(confounds)
+
+
+def _bold_data(
+    shape: tuple,
+    n_volumes: int,
+    mask: np.ndarray,
+    confounds: pd.DataFrame,
+    mixing: np.ndarray,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Build a float32 image with a brain-like baseline in the mask, drift,
+    confound and component signals, and noise."""
+    n_brain = int(mask.sum())
+    nuisance = np.column_stack(
+        [
+            confounds[CONFOUND_COLUMNS].fillna(0).to_numpy(),
+            np.linspace(-1, 1, n_volumes),
+            mixing,
+        ]
+    )
+    nuisance = (nuisance - nuisance.mean(axis=0)) / (nuisance.std(axis=0) + 1e-6)
+
+    weights = rng.standard_normal((nuisance.shape[1], n_brain)).astype(np.float32)
+    brain = nuisance.astype(np.float32) @ weights * 5
+    brain += rng.standard_normal((n_volumes, n_brain), dtype=np.float32) * 10
+    brain += rng.uniform(600, 1200, n_brain).astype(np.float32)
+
+    data = np.zeros(shape + (n_volumes,), dtype=np.float32)
+    data[mask] = brain.T
+    data[~mask] = np.abs(
+        rng.standard_normal((int((~mask).sum()), n_volumes), dtype=np.float32)
+    )
+    return data
@@ -4,7 +4,6 @@ import sys
 import glob
 import pandas
 import numpy
-import nipy.modalities.fmri.hrf
 import matplotlib.pyplot as plt
 from nipy import load_image
 from subprocess import call
@@ -12,8 +11,8 @@ from nipy.core.image.image import Image
 from nipy import save_image
 import scipy.stats
 from scipy.ndimage import convolve1d
-from scipy.sparse import spdiags
-from scipy.linalg import toeplitz
+from clpipe.postprocutils.beta_series import highpass_filter, lss_betas
+from clpipe.postprocutils.hrf import event_regressors
 
 
 pandas.options.mode.chained_assignment = None
@@ -450,44 +449,9 @@ for i in targets:
             # TODO: Add in code to remove particular types of stimuli from the analysis.
             TR = float(args.TR)
             ntp = len(targetConfounds)
-            time_res = TR / 16.0
-            timeCourse = numpy.arange(0, 32 + TR / 16.0, (TR / 16.0))
-            time_up = numpy.arange(0, TR * ntp, TR / 16.0)
-            n_up = len(time_up)
-            hrf = nipy.modalities.fmri.hrf.spm_hrf_compat(timeCourse)
-            eventArray = numpy.zeros((len(targetConfounds), len(onsetData)))
-            indexSample = numpy.arange(0, TR * ntp / (TR / 16.0), TR / (TR / 16.0))
-            indexSample = indexSample.astype("int")
-
-            sigN2 = ((100 / TR) / (numpy.sqrt(2.0))) ** 2.0
-            K = toeplitz(
-                1
-                / numpy.sqrt(2.0 * numpy.pi * sigN2)
-                * numpy.exp((-1 * numpy.array(range(ntp)) ** 2.0 / (2 * sigN2)))
+            eventArray = event_regressors(
+                onsetData["onset"].to_numpy(), onsetData["duration"].to_numpy(), ntp, TR
             )
-            K = spdiags(1.0 / numpy.sum(K.T, 0).T, 0, ntp, ntp) * K
-            H = numpy.zeros((ntp, ntp))  # Smoothing matrix, s.t. H*y is smooth line
-            X = numpy.hstack(
-                (numpy.ones((ntp, 1)), numpy.arange(1, ntp + 1).T[:, numpy.newaxis])
-            )
-            for k in range(ntp):
-                W = numpy.diag(K[k, :])
-                Hat = numpy.dot(numpy.dot(X, numpy.linalg.pinv(numpy.dot(W, X))), W)
-                H[k, :] = Hat[k, :]
-
-            F = numpy.eye(ntp) - H
-
-            for index, row in onsetData.iterrows():
-                ev_loop = numpy.zeros(n_up)
-                index1 = numpy.logical_and(
-                    (time_up >= row["onset"]),
-                    (time_up <= row["onset"] + row["duration"]),
-                )
-                ev_loop[index1] = 1
-                ev_loop = numpy.convolve(ev_loop, hrf)
-                ev_loop = ev_loop[: -(len(hrf) - 1)]
-                ev_loop = ev_loop[indexSample]
-                eventArray[:, index] = ev_loop
             image = load_image(i)
             data = image.get_data()
             orgImageShape = data.shape[:-1]
@@ -497,30 +461,20 @@ for i in targets:
 
             data = data - data.mean(axis=0)
             data = numpy.nan_to_num(data)
-            data = numpy.dot(F, data)
+            data = highpass_filter(data, TR)
             bits2 = i.split(args.targetsuffix)
             nonniibit = args.targetsuffix.split(".nii.gz")[0]
             outputFile = bits2[0] + nonniibit + "_" + args.suffix + ".nii.gz"
             betaDim = orgImageShape + (eventArray.shape[1],)
-            betas = numpy.zeros(betaDim)
-            for trial in numpy.arange(0, eventArray.shape[1]):
-                print(trial)
-                regressor = numpy.transpose(
-                    numpy.stack(
-                        [
-                            eventArray[:, trial],
-                            eventArray.sum(axis=1) - eventArray[:, trial],
-                        ],
-                        0,
-                    )
-                )
-                regressor = numpy.concatenate((regressor, targetConfounds), 1)
-                regressor = numpy.dot(F, regressor)
-                A = numpy.linalg.pinv(regressor)
-                beta = (numpy.matmul(A, data))[0, :]
-                beta[abs(beta) < 0.00000000000001] = 0
-                beta = beta.reshape(orgImageShape)
-                betas[:, :, :, trial] = beta
+            # The filter is linear, so filtering each trial's design is the same
+            # as filtering the trial and confound regressors once
+            betas = lss_betas(
+                data,
+                highpass_filter(eventArray, TR),
+                highpass_filter(targetConfounds.to_numpy(dtype=float), TR),
+            )
+            betas[abs(betas) < 0.00000000000001] = 0
+            betas = betas.T.reshape(betaDim)
             betaImage = Image(betas, coordMap)
             outputFile = targetRegs = "_".join(bits) + "_betaSeries.nii.gz"
             save_image(betaImage, outputFile)
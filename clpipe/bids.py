@@ -6,6 +6,7 @@ from pathlib import Path
 
 import re
 from .errors import (
+    EventsFileNotFoundError,
     MixingFileNotFoundError,
     NoImagesFoundError,
     NoSubjectsFoundError,
@@ -266,3 +267,23 @@ def get_confounds(bids, query_params, logger):
         return confounds
     except IndexError:
         logger.warn(f"Confound file for query {query_params} not found.")
+
+
+def get_events(bids, query_params, logger):
+    # Find the image's events file in the raw BIDS dataset
+    logger.info("Searching for events file")
+    try:
+        events_file = bids.get(
+            **query_params,
+            suffix="events",
+            extension=".tsv",
+            return_type="filename",
+            scope="raw",
+        )[0]
+        logger.info(f"Events file found: {events_file}")
+
+        return events_file
+    except IndexError:
+        raise EventsFileNotFoundError(
+            f"Events file for query {query_params} not found."
+        )
@@ -72,6 +72,27 @@ class OrderedHelpGroup(click.Group):
         return super().add_command(cmd, name)
 
 
+class DefaultCommandGroup(OrderedHelpGroup):
+    """
+    An OrderedHelpGroup which passes its arguments to a default sub command when
+    they don't start with the name of a sub command. This allows sub commands to
+    be added to an existing command without changing how it is called.
+    """
+
+    def __init__(self, *args, default_command: str = None, **kwargs):
+        self.default_command = default_command
+        super(DefaultCommandGroup, self).__init__(*args, **kwargs)
+
+    def parse_args(self, ctx, args):
+        if (
+            args
+            and args[0] not in self.commands
+            and args[0] not in ctx.help_option_names
+        ):
+            args.insert(0, self.default_command)
+        return super(DefaultCommandGroup, self).parse_args(ctx, args)
+
+
 @click.group(
     cls=OrderedHelpGroup, context_settings=CONTEXT_SETTINGS, invoke_without_command=True
 )
@@ -142,13 +163,29 @@ def config_cli():
     """Configuration-related commands."""
 
 
+@click.group(
+    POSTPROCESS_COMMAND_NAME,
+    cls=DefaultCommandGroup,
+    default_command=POSTPROCESS_RUN_COMMAND_NAME,
+)
+def postprocess_group_cli():
+    """Additional processing for GLM or connectivity analysis.
+
+    Run postprocessing by listing your SUBJECTS, or none for all subjects:
+
+    > clpipe postprocess 123 124 125 ... -c clpipe_config.json
+
+    Please choose one of the commands below for more information.
+    """
+
+
 def _add_commands():
     cli.add_command(project_setup_cli, help_priority=0)
     cli.add_command(convert2bids_cli, help_priority=10)
     cli.add_command(bids_validate_cli, help_priority=15)
     cli.add_command(templateflow_setup_cli, help_priority=17, hidden=True)
     cli.add_command(fmriprep_process_cli, help_priority=20)
-    cli.add_command(postprocess_cli, help_priority=35)
+    cli.add_command(postprocess_group_cli, help_priority=35)
     cli.add_command(flywheel_sync_cli, help_priority=55)
     cli.add_command(config_cli, help_priority=95)
 
@@ -157,16 +194,24 @@ def _add_commands():
 
     bids_cli.add_command(bids_validate_cli)
 
+    postprocess_group_cli.add_command(postprocess_cli, help_priority=1)
+    postprocess_group_cli.add_command(postprocess_profile_cli, help_priority=2)
+    postprocess_group_cli.add_command(postprocess_qc_cli, help_priority=3)
+
     # setup command hidden due to deprecation
     glm_cli.add_command(glm_prepare_cli, help_priority=3)
     glm_cli.add_command(glm_launch_cli, help_priority=4)
     glm_cli.add_command(glm_apply_mumford_workaround_cli, help_priority=5)
+    glm_cli.add_command(glm_native_l1_cli, help_priority=6, hidden=True)
+    glm_cli.add_command(glm_native_l2_cli, help_priority=6, hidden=True)
     glm_cli.add_command(fsl_onset_extract_cli, help_priority=2)
     glm_cli.add_command(report_outliers_cli, help_priority=7)
     glm_cli.add_command(get_glm_config_cli, help_priority=20)
 
     roi_cli.add_command(get_available_atlases_cli, help_priority=1)
     roi_cli.add_command(fmri_roi_extraction_cli, help_priority=2)
+    roi_cli.add_command(fmri_roi_merge_cli, help_priority=3)
+    roi_cli.add_command(fmri_roi_connectivity_cli, help_priority=4)
 
     reports_cli.add_command(get_fmriprep_reports_cli)
 
@@ -456,7 +501,7 @@ def get_fmri_process_check_cli(config_file, output_file=None, debug=False):
     fmri_process_check(config_file, output_file, debug)
 
 
-@click.command(POSTPROCESS_COMMAND_NAME, no_args_is_help=True)
+@click.command(POSTPROCESS_RUN_COMMAND_NAME, no_args_is_help=True)
 @click.argument("subjects", nargs=-1, required=False, default=None)
 @click.option(
     "-config_file", "-c", type=CLICK_FILE_TYPE_EXISTS, required=True, help=CONFIG_HELP
@@ -518,7 +563,7 @@ def postprocess_cli(
     Providing no SUBJECTS will default to all subjects.
     List subject IDs in SUBJECTS to process specific subjects:
 
-    > clpipe postprocess2 123 124 125 ...
+    > clpipe postprocess 123 124 125 ...
     """
     from .postprocess import postprocess_subjects
 
@@ -538,6 +583,94 @@ def postprocess_cli(
     )
 
 
+@click.command(POSTPROCESS_PROFILE_COMMAND_NAME, no_args_is_help=True)
+@click.option(
+    "-config_file", "-c", type=CLICK_FILE_TYPE_EXISTS, required=True, help=CONFIG_HELP
+)
+@click.option(
+    "-processing_stream",
+    "-p",
+    default=DEFAULT_PROCESSING_STREAM,
+    required=False,
+    help=PROCESSING_STREAM_HELP,
+)
+@click.option(
+    "-log_dir",
+    type=CLICK_DIR_TYPE_EXISTS,
+    default=None,
+    required=False,
+    help=PROFILE_LOG_DIR_HELP,
+)
+@click.option(
+    "-output_file",
+    "-o",
+    type=CLICK_FILE_TYPE,
+    default=None,
+    required=False,
+    help=PROFILE_OUTPUT_HELP,
+)
+@click.option("-debug", "-d", is_flag=True, default=False, help=DEBUG_HELP)
+def postprocess_profile_cli(
+    config_file, processing_stream, log_dir, output_file, debug
+):
+    """Show the time and memory used by each postprocessing step.
+
+    Aggregates the profiles recorded for each image of a processing stream.
+    """
+    from .postprocess import postprocess_profile
+
+    postprocess_profile(
+        config_file=config_file,
+        processing_stream=processing_stream,
+        log_dir=log_dir,
+        output_file=output_file,
+        debug=debug,
+    )
+
+
+@click.command(POSTPROCESS_QC_COMMAND_NAME, no_args_is_help=True)
+@click.option(
+    "-config_file", "-c", type=CLICK_FILE_TYPE_EXISTS, required=True, help=CONFIG_HELP
+)
+@click.option(
+    "-processing_stream",
+    "-p",
+    default=DEFAULT_PROCESSING_STREAM,
+    required=False,
+    help=PROCESSING_STREAM_HELP,
+)
+@click.option(
+    "-output_dir",
+    type=CLICK_DIR_TYPE_EXISTS,
+    default=None,
+    required=False,
+    help=QC_OUTPUT_DIR_HELP,
+)
+@click.option(
+    "-output_file",
+    "-o",
+    type=CLICK_FILE_TYPE,
+    default=None,
+    required=False,
+    help=QC_OUTPUT_HELP,
+)
+@click.option("-debug", "-d", is_flag=True, default=False, help=DEBUG_HELP)
+def postprocess_qc_cli(config_file, processing_stream, output_dir, output_file, debug):
+    """Combine the QC metrics of each postprocessed image into a cohort table.
+
+    QC metrics are saved for each image when QCOptions is included.
+    """
+    from .postprocess import postprocess_qc
+
+    postprocess_qc(
+        config_file=config_file,
+        processing_stream=processing_stream,
+        output_dir=output_dir,
+        output_file=output_file,
+        debug=debug,
+    )
+
+
 @click.command()
 @click.argument("run_config_file", type=CLICK_FILE_TYPE)
 @click.argument("image_file", type=CLICK_FILE_TYPE)
@@ -669,6 +802,14 @@ def glm_l2_preparefsf_cli(glm_config_file, l2_name, debug):
     default=False,
     help="Remove reg_standard folders (generated by L2) in addition to reg.",
 )
+@click.option(
+    "-mode",
+    type=click.Choice(["copy", "link"]),
+    default="copy",
+    show_default=True,
+    help=MUMFORD_MODE_HELP,
+)
+@click.option("-n_threads", type=int, default=8, help=MUMFORD_N_THREADS_HELP)
 @click.option(
     "-debug",
     "-d",
@@ -677,7 +818,7 @@ def glm_l2_preparefsf_cli(glm_config_file, l2_name, debug):
     help="Flag to enable detailed error messages and traceback",
 )
 def glm_apply_mumford_workaround_cli(
-    glm_config_file, l1_feat_folders_path, remove_reg_standard, debug
+    glm_config_file, l1_feat_folders_path, remove_reg_standard, mode, n_threads, debug
 ):
     """
     Apply the Mumford registration workaround to L1 FEAT folders.
@@ -702,6 +843,8 @@ def glm_apply_mumford_workaround_cli(
         l1_feat_folders_path=l1_feat_folders_path,
         debug=debug,
         remove_reg_standard=remove_reg_standard,
+        mode=mode,
+        n_threads=n_threads,
     )
 
 
@@ -716,14 +859,28 @@ def glm_apply_mumford_workaround_cli(
     help=CONFIG_HELP,
 )
 @click.option("-test_one", is_flag=True, help=TEST_ONE_HELP)
+@click.option(
+    "-engine",
+    type=click.Choice(["feat", "native"]),
+    default="feat",
+    help=ENGINE_HELP,
+)
+@click.option(
+    "-fsfs_per_job", type=click.IntRange(min=1), default=1, help=FSFS_PER_JOB_HELP
+)
 @click.option("-submit", "-s", is_flag=True, help=SUBMIT_HELP)
 @click.option("-debug", "-d", is_flag=True, help=DEBUG_HELP)
-def glm_launch_cli(level, model, glm_config_file, test_one, submit, debug):
+def glm_launch_cli(
+    level, model, glm_config_file, test_one, engine, fsfs_per_job, submit, debug
+):
     """Launch all prepared .fsf files for L1 or L2 GLM analysis.
 
     LEVEL is the level of anlaysis, L1 or L2
 
     MODEL must be a a corresponding L1 or L2 model from your GLM configuration file.
+
+    .fsf files whose FEAT output already has a completed report.html are skipped,
+    so relaunching after partial failures only reruns what is missing.
     """
     from .glm_launch import glm_launch
 
@@ -734,6 +891,64 @@ def glm_launch_cli(level, model, glm_config_file, test_one, submit, debug):
         test_one=test_one,
         submit=submit,
         debug=debug,
+        engine=engine,
+        fsfs_per_job=fsfs_per_job,
+    )
+
+
+@click.command(GLM_NATIVE_L1_COMMAND_NAME, no_args_is_help=True)
+@click.argument("model")
+@click.argument("images", nargs=-1, type=CLICK_FILE_TYPE_EXISTS)
+@click.option(
+    "-glm_config_file",
+    "-g",
+    type=CLICK_FILE_TYPE_EXISTS,
+    required=True,
+    help=CONFIG_HELP,
+)
+@click.option("-debug", "-d", is_flag=True, help=DEBUG_HELP)
+def glm_native_l1_cli(model, images, glm_config_file, debug):
+    """Fit an L1 model with the native GLM engine.
+
+    MODEL must be a corresponding L1 model from your GLM configuration file.
+
+    Used by the launch command's native engine, which distributes images across
+    jobs. Not usually called directly.
+    """
+    from .glm_native import glm_native_l1
+
+    glm_native_l1(
+        glm_config_file=glm_config_file, model=model, images=images, debug=debug
+    )
+
+
+@click.command(GLM_NATIVE_L2_COMMAND_NAME, no_args_is_help=True)
+@click.argument("model")
+@click.argument("fsf_names", nargs=-1)
+@click.option(
+    "-glm_config_file",
+    "-g",
+    type=CLICK_FILE_TYPE_EXISTS,
+    required=True,
+    help=CONFIG_HELP,
+)
+@click.option("-debug", "-d", is_flag=True, help=DEBUG_HELP)
+def glm_native_l2_cli(model, fsf_names, glm_config_file, debug):
+    """Fit an L2 fixed-effects model with the native GLM engine.
+
+    MODEL must be a corresponding L2 model from your GLM configuration file.
+    FSF_NAMES selects groups of the model's subject file to fit, defaulting to all.
+
+    Used by the launch command's native engine, which bundles many groups into
+    each job. Not usually called directly.
+    """
+    from .glm_native import glm_native_l2
+
+    glm_native_l2(
+        glm_config_file=glm_config_file,
+        model=model,
+        fsf_names=fsf_names,
+        debug=debug,
     )
 
 
@@ -894,6 +1109,13 @@ def fsl_onset_extract_cli(config_file, glm_config_file, debug):
     default=False,
     help="Flag to directly run command. Used internally.",
 )
+@click.option(
+    "-manifest",
+    "manifest_file",
+    type=CLICK_FILE_TYPE_EXISTS,
+    default=None,
+    help="A manifest of the images to process. Used internally.",
+)
 @click.option(
     "-debug",
     "-d",
@@ -918,6 +1140,7 @@ def fmri_roi_extraction_cli(
     overlap_ok,
     debug,
     overwrite,
+    manifest_file,
 ):
     """Extract ROIs with a given atlas."""
     from .roi_extractor import fmri_roi_extraction
@@ -940,6 +1163,84 @@ def fmri_roi_extraction_cli(
         overlap_ok=overlap_ok,
         debug=debug,
         overwrite=overwrite,
+        manifest_file=manifest_file,
+    )
+
+
+@click.command(ROI_MERGE_COMMAND_NAME, no_args_is_help=True)
+@click.option(
+    "-config_file",
+    "-c",
+    type=CLICK_FILE_TYPE_EXISTS,
+    required=True,
+    help=CONFIG_HELP,
+)
+@click.option("-atlas_name", default=None, help=ROI_MERGE_ATLAS_HELP)
+@click.option(
+    "-remove_shards", is_flag=True, default=False, help=ROI_MERGE_REMOVE_SHARDS_HELP
+)
+@click.option("-debug", "-d", is_flag=True, help=DEBUG_HELP)
+def fmri_roi_merge_cli(config_file, atlas_name, remove_shards, debug):
+    """Merge ROI timeseries shards into one store per atlas.
+
+    Only applies when ROI extraction uses the 'npz' output format.
+    """
+    from .roi_extractor import fmri_roi_merge
+
+    fmri_roi_merge(
+        config_file=config_file,
+        atlas_name=atlas_name,
+        remove_shards=remove_shards,
+        debug=debug,
+    )
+
+
+@click.command(ROI_CONNECTIVITY_COMMAND_NAME, no_args_is_help=True)
+@click.option(
+    "-config_file",
+    "-c",
+    type=CLICK_FILE_TYPE_EXISTS,
+    required=True,
+    help=CONFIG_HELP,
+)
+@click.option("-atlas_name", default=None, help=ROI_CONNECTIVITY_ATLAS_HELP)
+@click.option(
+    "-output_dir",
+    "-o",
+    type=CLICK_DIR_TYPE,
+    default=None,
+    help=ROI_CONNECTIVITY_OUTPUT_DIR_HELP,
+)
+@click.option(
+    "-measure",
+    "measures",
+    multiple=True,
+    type=click.Choice(ROI_CONNECTIVITY_MEASURES),
+    help=ROI_CONNECTIVITY_MEASURE_HELP,
+)
+@click.option("-n_procs", type=int, default=1, help=ROI_CONNECTIVITY_N_PROCS_HELP)
+@click.option(
+    "-batch_size", type=int, default=64, help=ROI_CONNECTIVITY_BATCH_SIZE_HELP
+)
+@click.option("-debug", "-d", is_flag=True, help=DEBUG_HELP)
+def fmri_roi_connectivity_cli(
+    config_file, atlas_name, output_dir, measures, n_procs, batch_size, debug
+):
+    """Compute connectivity matrices from extracted ROI timeseries.
+
+    Saves one file per atlas, holding a stacked (runs x ROI x ROI) array for each
+    connectivity measure.
+    """
+    from .roi_connectivity import fmri_roi_connectivity
+
+    fmri_roi_connectivity(
+        config_file=config_file,
+        atlas_name=atlas_name,
+        output_dir=output_dir,
+        measures=measures,
+        n_procs=n_procs,
+        batch_size=batch_size,
+        debug=debug,
     )
 
 
@@ -94,12 +94,31 @@ INDEX_HELP = "Give the path to an existing pybids index database."
 REFRESH_INDEX_HELP = (
     "Refresh the pybids index database to reflect new fmriprep artifacts."
 )
+POSTPROCESS_RUN_COMMAND_NAME = "run"
+POSTPROCESS_PROFILE_COMMAND_NAME = "profile"
+PROFILE_LOG_DIR_HELP = (
+    "Where your postprocessing logs are. If a configuration file is provided "
+    "with a log directory, this argument is not necessary."
+)
+PROFILE_OUTPUT_HELP = "Save the table of step costs to this TSV file."
+POSTPROCESS_QC_COMMAND_NAME = "qc"
+QC_OUTPUT_DIR_HELP = (
+    "Where your postprocessed images are. If a configuration file is provided "
+    "with an output directory, this argument is not necessary."
+)
+QC_OUTPUT_HELP = "Save the cohort QC table to this TSV file."
 
 
 # GLM Help
 L1_PREPARE_FSF_COMMAND_NAME = "l1_prepare_fsf"
 L2_PREPARE_FSF_COMMAND_NAME = "l2_prepare_fsf"
 APPLY_MUMFORD_COMMAND_NAME = "apply_mumford"
+MUMFORD_MODE_HELP = (
+    "How the identity matrix and mean_func image are placed into each reg folder. "
+    "'link' hardlinks them, or symlinks them where a hardlink is not possible, "
+    "instead of copying."
+)
+MUMFORD_N_THREADS_HELP = "Number of L1 FEAT folders to process at once."
 ONSET_EXTRACT_COMMAND_NAME = "fsl_onset_extract"
 OUTLIERS_COMMAND_NAME = "report_outliers"
 
@@ -113,6 +132,43 @@ L2_MODEL_HELP = "Name of your L2 model"
 LEVEL_HELP = "Level of your model, L1 or L2"
 MODEL_HELP = "Name of your model"
 TEST_ONE_HELP = "Only submit one job for testing purposes."
+ENGINE_HELP = (
+    "Which engine fits the model. 'feat' launches the prepared .fsf files with "
+    "FSL's FEAT. 'native' fits the model with clpipe's own GLM engine, which "
+    "does not need prepared .fsf files. Native L2 models are fit with fixed "
+    "effects."
+)
+FSFS_PER_JOB_HELP = (
+    "Number of .fsf files to bundle into each FEAT job. Bundled files are run "
+    "concurrently, up to the model's NThreads at a time."
+)
+
+# GLM Native Help
+GLM_NATIVE_L1_COMMAND_NAME = "native_l1"
+GLM_NATIVE_L2_COMMAND_NAME = "native_l2"
+
+# ROI Help
+ROI_MERGE_COMMAND_NAME = "merge"
+ROI_MERGE_ATLAS_HELP = (
+    "Only merge the shards of this atlas. If not given, all atlases with shards "
+    "in the ROI output directory are merged."
+)
+ROI_MERGE_REMOVE_SHARDS_HELP = "Delete each atlas's shards once they are merged."
+ROI_CONNECTIVITY_COMMAND_NAME = "connectivity"
+ROI_CONNECTIVITY_MEASURES = ["pearson", "partial", "fisher_z"]
+ROI_CONNECTIVITY_ATLAS_HELP = (
+    "Only compute connectivity for this atlas. If not given, every atlas in the "
+    "ROI output directory is used."
+)
+ROI_CONNECTIVITY_OUTPUT_DIR_HELP = (
+    "Where to save the connectivity arrays. Defaults to the ROI output directory."
+)
+ROI_CONNECTIVITY_MEASURE_HELP = (
+    "Connectivity measure to compute. Can be given more than once. "
+    "Computes all measures if not given."
+)
+ROI_CONNECTIVITY_N_PROCS_HELP = "Number of processes used to compute connectivity."
+ROI_CONNECTIVITY_BATCH_SIZE_HELP = "Number of runs computed together in each batch."
 
 # Other Help
 STATUS_COMMAND_NAME = "status"
@@ -467,7 +467,10 @@ class TemporalFiltering(Option):
     Also applied to confounds."""
 
     implementation: str = field(default="fslmaths", metadata={"required": True})
-    """Available implementations: fslmaths, afni_3dTproject"""
+    """Available implementations: fslmaths, fslmaths_native, afni_3dTproject,
+    Butterworth, Projection. fslmaths_native gives the results of fslmaths without
+    running FSL. Projection leaves timepoints scrubbed by a later ScrubTimepoints
+    step out of the filter's fit."""
 
     filtering_high_pass: float = field(default=0.008, metadata={"required": True})
     """Values below this threshold are filtered. Defaults to .08 Hz. Set to -1 to disable."""
@@ -523,10 +526,12 @@ class ScrubColumn(Option):
     """Any timepoint of the target variable exceeding this value will be scrubbed"""
 
     scrub_ahead: int = field(default=0, metadata={"required": True})
-    """Set the number of timepoints to scrub ahead of target timepoints"""
+    """Set the number of timepoints to scrub ahead of target timepoints. Exactly
+    this many timepoints after each target are scrubbed."""
 
     scrub_behind: int = field(default=0, metadata={"required": True})
-    """Set the number of timepoints to scrub behind target timepoints"""
+    """Set the number of timepoints to scrub behind target timepoints. Exactly
+    this many timepoints before each target are scrubbed."""
 
     scrub_contiguous: int = field(default=0, metadata={"required": True})
     """Scrub everything between scrub targets up to this far apart"""
@@ -561,6 +566,24 @@ class ScrubTimepoints(Option):
     )
     """A list of columns to be scrubbed."""
 
+    interpolate: bool = field(default=False, metadata={"required": False})
+    """Set true to replace scrubbed timepoints with values spectrally interpolated
+    from the remaining timepoints, instead of scrubbing them. Place the step before
+    TemporalFiltering so that scrubbed timepoints don't spread through the filtered
+    timeseries."""
+
+    oversampling_freq: int = field(default=8, metadata={"required": False})
+    """The oversampling frequency used by interpolation."""
+
+    percent_freq_sample: float = field(default=1.0, metadata={"required": False})
+    """The highest frequency used by interpolation, as a fraction of the
+    Nyquist frequency."""
+
+    spectral_interpolation_bin_size: int = field(
+        default=5000, metadata={"required": False}
+    )
+    """How many voxels to interpolate at once. Lower this to reduce memory usage."""
+
     def __iter__(self):
         return iter(self.scrub_columns)
 
@@ -580,6 +603,15 @@ class Resample(Option):
     )
     """Path to an image against which to resample - often a template"""
 
+    implementation: str = field(default="flirt", metadata={"required": False})
+    """Available implementations: flirt, native. native resamples without FSL,
+    mapping voxels through the images' affines as flirt does, and caches the
+    mapping for each pair of image grids."""
+
+    cache_directory: str = field(default="", metadata={"required": False})
+    """Where the native implementation caches its mappings, to share them across
+    subjects. Defaults to a folder in the postprocessing working directory."""
+
 
 @dataclass
 class TrimTimepoints(Option):
@@ -600,7 +632,22 @@ class ConfoundRegression(Option):
     they will be applied first."""
 
     implementation: str = field(default="afni_3dTproject", metadata={"required": True})
-    """Currently limited to "afni_3dTproject"""
+    """Available implementations: afni_3dTproject, Projection. Projection also
+    applies TemporalFiltering in the same regression when TemporalFiltering
+    uses the Projection implementation too."""
+
+
+@dataclass
+class BetaSeries(Option):
+    """Estimate a beta series from the image, with one beta per trial of the
+    image's BIDS events file. Each trial's beta is fit by least-squares-separate
+    regression, alongside a regressor for all other trials and the image's
+    processed confounds. Must be the last processing step."""
+
+    exclude_trial_types: List[str] = field(
+        default_factory=list, metadata={"required": True}
+    )
+    """Trial types of the events file to leave out of the beta series."""
 
 
 @dataclass
@@ -631,6 +678,9 @@ class ProcessingStepOptions(Option):
     trim_timepoints: TrimTimepoints = field(
         default_factory=TrimTimepoints, metadata={"required": True}
     )
+    beta_series: BetaSeries = field(
+        default_factory=BetaSeries, metadata={"required": False}
+    )
 
 
 @dataclass
@@ -685,6 +735,28 @@ class ConfoundOptions(Option):
     )
     """Options specific to motion outliers."""
 
+    engine: str = field(default="native", metadata={"required": False})
+    """Set to 'native' to process confounds in a single step, or 'nipype' to run
+    them through the image processing workflows. Confounds are always processed
+    with 'nipype' when TemporalFiltering uses afni_3dTproject."""
+
+
+@dataclass
+class QCOptions(Option):
+    """Quality control metrics computed for each image as it is postprocessed."""
+
+    include: bool = field(default=False, metadata={"required": False})
+    """Set 'true' to save each image's tSNR, DVARS, global signal, mean framewise
+    displacement and percent scrubbed, before and after postprocessing."""
+
+    fd_column: str = field(
+        default="framewise_displacement", metadata={"required": False}
+    )
+    """Which confounds column holds framewise displacement."""
+
+    carpet_rows: int = field(default=1000, metadata={"required": False})
+    """How many voxels to sample for each image's carpet plot data."""
+
 
 @dataclass
 class BatchOptions(Option):
@@ -753,11 +825,20 @@ class PostProcessingOptions(Option):
     )
     """Configuration for each processing step."""
 
+    dtype: str = field(default="float32", metadata={"required": False})
+    """Datatype of your postprocessed images: float32, or int16 to save scaled
+    integers at half the size. Processing itself always uses float32."""
+
     confound_options: ConfoundOptions = field(
         default_factory=ConfoundOptions, metadata={"required": True}
     )
     """Options related to the outputted confounds file."""
 
+    qc_options: QCOptions = field(
+        default_factory=QCOptions, metadata={"required": False}
+    )
+    """Options for quality control metrics."""
+
     batch_options: BatchOptions = field(
         default_factory=BatchOptions, metadata={"required": True}
     )
@@ -890,6 +971,11 @@ class ROIExtractOptions(Option):
     overlap_ok: bool = field(default=False, metadata={"required": True})
     """Are overlapping ROIs allowed?"""
 
+    output_format: str = field(default="csv", metadata={"required": False})
+    """Format of the extracted timeseries. 'csv' writes a CSV file for each image.
+    'npz' writes one binary shard per subject and atlas, which can be merged into a
+    single store per atlas with 'clpipe roi merge'."""
+
     memory_usage: str = field(default="20G", metadata={"required": True})
     time_usage: str = field(default="2:0:0", metadata={"required": True})
     n_threads: str = field(default="1", metadata={"required": True})
@@ -1124,6 +1210,8 @@ KEY_MAP = {
     "log_directory": "LogDirectory",
     "fmriprep": "FMRIPrepOptions",
     "working_directory": "WorkingDirectory",
+    "cache_directory": "CacheDirectory",
+    "dtype": "DataType",
     "output_directory": "OutputDirectory",
     "fmriprep_path": "FMRIPrepPath",
     "freesurfer_license_path": "FreesurferLicensePath",
@@ -1160,9 +1248,14 @@ KEY_MAP = {
     "from_end": "FromEnd",
     "from_beginning": "FromBeginning",
     "confound_regression": "ConfoundRegression",
+    "beta_series": "BetaSeries",
     "confound_options": "ConfoundOptions",
     "columns": "Columns",
     "motion_outliers": "MotionOutliers",
+    "engine": "Engine",
+    "qc_options": "QCOptions",
+    "fd_column": "FDColumn",
+    "carpet_rows": "CarpetRows",
     "include": "Include",
     "scrub_var": "ScrubVar",
     "threshold": "Threshold",
@@ -1189,6 +1282,7 @@ KEY_MAP = {
     "require_mask": "RequireMask",
     "prop_voxels": "PropVoxels",
     "overlap_ok": "OverlapOk",
+    "output_format": "OutputFormat",
     "reho_extraction": "ReHoExtraction",
     "exclusion_file": "ExclusionFile",
     "mask_directory": "MaskDirectory",
@@ -1199,6 +1293,10 @@ KEY_MAP = {
     "batch_config_path": "BatchConfig",
     "target_variable": "TargetVariable",
     "insert_na": "InsertNA",
+    "interpolate": "Interpolate",
+    "oversampling_freq": "OversamplingFreq",
+    "percent_freq_sample": "PercentFreqSample",
+    "spectral_interpolation_bin_size": "SpectralInterpolationBinSize",
     "scrub_columns": "scrub_columns",
     "stream_name": "ProcessingStream",
     "processing_stream_options": "ProcessingStreamOptions",
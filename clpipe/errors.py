@@ -39,6 +39,10 @@ class NoiseFileNotFoundError(FileNotFoundError):
     pass
 
 
+class EventsFileNotFoundError(FileNotFoundError):
+    pass
+
+
 class ImplementationNotFoundError(ValueError):
     pass
 
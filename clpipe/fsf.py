@@ -0,0 +1,44 @@
+"""
+Parsing of FSL .fsf design files, shared by the FEAT launcher and the native GLM
+engine.
+"""
+
+import os
+import re
+
+import numpy as np
+
+FSF_SETTING = re.compile(r'^set fmri\(([^)]+)\)\s+"?([^"\n]*)"?')
+
+
+def read_fsf_settings(fsf_file: os.PathLike) -> dict:
+    """Read the 'set fmri(...)' settings of an .fsf file into a dict."""
+    settings = {}
+    with open(fsf_file) as f:
+        for line in f:
+            match = FSF_SETTING.match(line)
+            if match:
+                settings[match.group(1)] = match.group(2).strip()
+    return settings
+
+
+def get_fsf_contrasts(fsf_settings: dict, ev_names: list):
+    """Get the contrasts of an .fsf file's original EVs.
+
+    If the .fsf file defines no contrasts, one contrast per EV is used instead.
+
+    Returns:
+        A list of contrast names and a (contrasts x EVs) matrix.
+    """
+    n_evs = len(ev_names)
+    n_contrasts = int(fsf_settings.get("ncon_orig", 0))
+    if n_contrasts == 0:
+        return list(ev_names), np.eye(n_evs)
+
+    names = []
+    contrasts = np.zeros((n_contrasts, n_evs))
+    for c in range(n_contrasts):
+        names.append(fsf_settings.get(f"conname_orig.{c + 1}", f"C{c + 1}"))
+        for e in range(n_evs):
+            contrasts[c, e] = float(fsf_settings.get(f"con_orig{c + 1}.{e + 1}", 0))
+    return names, contrasts
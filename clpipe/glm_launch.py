@@ -3,6 +3,8 @@ import sys
 from pathlib import Path
 
 from .config.glm import *
+from .errors import ModelNotFoundError
+from .fsf import read_fsf_settings
 from .job_manager import JobManagerFactory
 from .utils import get_logger
 
@@ -21,6 +23,26 @@ STEP_NAME = "glm-launch"
 # Unset PYTHONPATH to ensure FSL uses its own internal python
 #   libraries
 SUBMISSION_STRING_TEMPLATE = "unset PYTHONPATH; feat {fsf_file}"
+# Bundled .fsf files are run by xargs, at most n_threads at a time
+BUNDLE_SUBMISSION_STRING_TEMPLATE = (
+    "unset PYTHONPATH; echo {fsf_files} | xargs -n 1 -P {n_threads} feat"
+)
+FEAT_REPORT_FILE = "report.html"
+# FEAT's report auto-refreshes until the analysis finishes
+FEAT_RUNNING_MARKERS = ["http-equiv=refresh", "still running"]
+NATIVE_L1_SUBMISSION_STRING_TEMPLATE = (
+    "clpipe glm native_l1 {model} -glm_config_file={glm_config_file} {images}"
+)
+NATIVE_L2_SUBMISSION_STRING_TEMPLATE = (
+    "clpipe glm native_l2 {model} -glm_config_file={glm_config_file} {fsf_names}"
+)
+# Native L1 jobs index the EV and confound directories once for all of their
+# images, so images are bundled to keep those scans few
+NATIVE_L1_IMAGES_PER_JOB = 20
+# Fixed effects are cheap to fit, so native L2 groups are bundled into few jobs
+NATIVE_L2_GROUPS_PER_JOB = 50
+ENGINE_FEAT = "feat"
+ENGINE_NATIVE = "native"
 DEPRECATION_MSG = "Using deprecated GLM setup file."
 
 
@@ -31,6 +53,8 @@ def glm_launch(
     test_one: bool = False,
     submit: bool = False,
     debug: bool = False,
+    engine: str = ENGINE_FEAT,
+    fsfs_per_job: int = 1,
 ):
     glm_config = GLMOptions(glm_config_file)
 
@@ -48,7 +72,11 @@ def glm_launch(
         logger.error(f"Level must be {L1} or {L2}")
         sys.exit(1)
 
-    logger.info(f"Setting up {level} .fsf launch using model: {model}")
+    if engine not in (ENGINE_FEAT, ENGINE_NATIVE):
+        logger.error(f"Engine must be {ENGINE_FEAT} or {ENGINE_NATIVE}")
+        sys.exit(1)
+
+    logger.info(f"Setting up {level} {engine} launch using model: {model}")
 
     block = [x for x in glm_config.config[setup] if x["ModelName"] == str(model)]
     if len(block) is not 1:
@@ -77,8 +105,6 @@ def glm_launch(
         batch_config_path = DEFAULT_BATCH_CONFIG_PATH
         email = None
 
-    fsf_dir = model_options["FSFDir"]
-    logger.info(f"Targeting .fsfs in dir: {fsf_dir}")
     out_dir = model_options["OutputDir"]
     logger.info(f"Output dir: {out_dir}")
 
@@ -99,12 +125,43 @@ def glm_launch(
         email=email
     )
 
-    submission_strings = _create_submission_strings(fsf_dir, test_one=test_one)
+    if engine == ENGINE_NATIVE and level == L1:
+        from .glm_prepare import find_l1_images, get_task_and_reference
+
+        task_name, _, _ = get_task_and_reference(glm_config)
+        images = find_l1_images(model_options, task_name, logger)
+        logger.info(f"Targeting {len(images)} image(s) for native L1 fit")
+        submission_strings = _create_native_l1_submission_strings(
+            images, model, glm_config_file, test_one=test_one
+        )
+    elif engine == ENGINE_NATIVE and level == L2:
+        from .glm_prepare import read_l2_sublist
+
+        try:
+            fsf_names = read_l2_sublist(model_options, logger).fsf_name.unique()
+        except ModelNotFoundError as mnfe:
+            logger.error(mnfe)
+            sys.exit(1)
+        logger.info(f"Targeting {len(fsf_names)} group(s) for native L2 fit")
+        submission_strings = _create_native_l2_submission_strings(
+            fsf_names, model, glm_config_file, test_one=test_one
+        )
+    else:
+        fsf_dir = model_options["FSFDir"]
+        logger.info(f"Targeting .fsfs in dir: {fsf_dir}")
+        fsf_files = sorted(Path(fsf_dir).iterdir())
+        fsf_files = _filter_completed_fsfs(fsf_files, level, logger)
+        submission_strings = _create_submission_strings(
+            fsf_files,
+            test_one=test_one,
+            fsfs_per_job=fsfs_per_job,
+            n_threads=n_threads,
+        )
 
     num_jobs = len(submission_strings)
 
     for key in submission_strings.keys():
-        batch_manager.addjob(key, submission_strings[key])
+        batch_manager.add_job(key, submission_strings[key])
 
     if submit:
         logger.info(f"Running {num_jobs} job(s) in batch mode")
@@ -113,13 +170,30 @@ def glm_launch(
         batch_manager.print_jobs()
     sys.exit(0)
 
-def _create_submission_strings(fsf_files: os.PathLike, test_one: bool = False):
+def _create_submission_strings(
+    fsf_files: list,
+    test_one: bool = False,
+    fsfs_per_job: int = 1,
+    n_threads: int = 1,
+):
     submission_strings = {}
 
-    for fsf in Path(fsf_files).iterdir():
-        key = f"{str(fsf.stem)}"
+    if isinstance(fsf_files, (str, os.PathLike)):
+        fsf_files = sorted(Path(fsf_files).iterdir())
+    fsf_files = [Path(fsf) for fsf in fsf_files]
+
+    for start in range(0, len(fsf_files), fsfs_per_job):
+        bundle = fsf_files[start : start + fsfs_per_job]
+        key = f"{str(bundle[0].stem)}"
 
-        submission_string = SUBMISSION_STRING_TEMPLATE.format(fsf_file=fsf)
+        if len(bundle) == 1:
+            submission_string = SUBMISSION_STRING_TEMPLATE.format(fsf_file=bundle[0])
+        else:
+            key += f"_bundle-{len(bundle)}"
+            submission_string = BUNDLE_SUBMISSION_STRING_TEMPLATE.format(
+                fsf_files=" ".join(str(fsf) for fsf in bundle),
+                n_threads=n_threads,
+            )
 
         # if python_path:
         #     submission_string += f"{python_path};"
@@ -129,3 +203,81 @@ def _create_submission_strings(fsf_files: os.PathLike, test_one: bool = False):
         if test_one:
             break
     return submission_strings
+
+
+def _filter_completed_fsfs(fsf_files: list, level: str, logger) -> list:
+    """Drop .fsf files whose FEAT output already has a completed report."""
+    remaining = []
+    for fsf in fsf_files:
+        if _feat_completed(fsf, level):
+            logger.debug(f"Skipping completed .fsf: {fsf}")
+        else:
+            remaining.append(fsf)
+
+    n_completed = len(fsf_files) - len(remaining)
+    if n_completed > 0:
+        logger.info(f"Skipping {n_completed} .fsf file(s) with completed output")
+    return remaining
+
+
+def _feat_completed(fsf_file: os.PathLike, level: str) -> bool:
+    """Check whether the FEAT output directory of an .fsf file has a report.html
+    which is no longer marked as running."""
+    output_dir = read_fsf_settings(fsf_file).get("outputdir")
+    if not output_dir:
+        return False
+
+    # FEAT adds the output extension if it is missing
+    extension = ".feat" if level == L1 else ".gfeat"
+    if not output_dir.endswith((".feat", ".gfeat")):
+        output_dir += extension
+
+    report = Path(output_dir) / FEAT_REPORT_FILE
+    if not report.is_file():
+        return False
+    report_text = report.read_text(errors="ignore").lower().replace('"', "")
+    return not any(marker in report_text for marker in FEAT_RUNNING_MARKERS)
+
+
+def _create_native_l1_submission_strings(
+    images: list,
+    model: str,
+    glm_config_file: os.PathLike,
+    test_one: bool = False,
+    images_per_job: int = NATIVE_L1_IMAGES_PER_JOB,
+):
+    submission_strings = {}
+
+    if test_one:
+        images = images[:1]
+    for start in range(0, len(images), images_per_job):
+        job_images = images[start : start + images_per_job]
+        key = f"{model}_native_l1_{start // images_per_job + 1}"
+        submission_strings[key] = NATIVE_L1_SUBMISSION_STRING_TEMPLATE.format(
+            model=model,
+            glm_config_file=os.path.abspath(glm_config_file),
+            images=" ".join(os.path.abspath(image) for image in job_images),
+        )
+    return submission_strings
+
+
+def _create_native_l2_submission_strings(
+    fsf_names: list,
+    model: str,
+    glm_config_file: os.PathLike,
+    test_one: bool = False,
+    groups_per_job: int = NATIVE_L2_GROUPS_PER_JOB,
+):
+    submission_strings = {}
+
+    if test_one:
+        fsf_names = fsf_names[:1]
+    for start in range(0, len(fsf_names), groups_per_job):
+        job_fsf_names = fsf_names[start : start + groups_per_job]
+        key = f"{model}_native_l2_{start // groups_per_job + 1}"
+        submission_strings[key] = NATIVE_L2_SUBMISSION_STRING_TEMPLATE.format(
+            model=model,
+            glm_config_file=os.path.abspath(glm_config_file),
+            fsf_names=" ".join(job_fsf_names),
+        )
+    return submission_strings
@@ -0,0 +1,497 @@
+"""
+Native GLM engine, an alternative to FEAT for fitting models on already
+postprocessed data.
+
+The L1 engine builds each image's design from its EV files by HRF convolution,
+prewhitens with a voxelwise AR(1) estimate and solves all voxels with a few
+vectorized least-squares passes. Outputs are written in FEAT's .feat directory
+layout, so they can be used by L2 models in the same way as FEAT's.
+
+The L2 engine computes fixed effects across each group of L1 .feat directories
+listed in an L2 model's SubjectFile, as an inverse-variance weighted average of
+their copes. L1 outputs are streamed in one at a time, so memory use does not
+grow with the number of runs, and many groups can be fit in one job.
+
+Unlike FEAT, no preprocessing, high-pass filtering or registration is done -
+images are expected to have already been postprocessed.
+"""
+
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .config.glm import *
+from .errors import *
+from .fsf import get_fsf_contrasts, read_fsf_settings
+from .glm_prepare import (
+    find_l1_images,
+    get_ev_confound_mat,
+    get_task_and_reference,
+    index_ev_confound_dirs,
+    read_l2_sublist,
+)
+from .postprocutils.hrf import HRF_OVERSAMPLING, event_regressors
+from .utils import get_logger
+
+STEP_NAME = "glm-native"
+
+AR1_BINS = 100
+MAX_AR1 = 0.99
+
+
+
+def glm_native_l1(
+    glm_config_file: str = None,
+    model: str = None,
+    images: list = None,
+    debug: bool = False,
+):
+    """Fit an L1 model natively on the given images, or on all images targeted by
+    the model if none are given."""
+    glm_config = GLMOptions(glm_config_file)
+    logger = get_logger(
+        STEP_NAME, debug=debug, log_dir=glm_config.parent_options.get_logs_dir()
+    )
+    task_name, _, _ = get_task_and_reference(glm_config)
+
+    block = [x for x in glm_config.config["Level1Setups"] if x["ModelName"] == model]
+    if len(block) != 1:
+        logger.error("Model not found, or multiple entries found.")
+        sys.exit(1)
+    l1_block = block[0]
+
+    if not images:
+        images = find_l1_images(l1_block, task_name, logger)
+    logger.info(f"Fitting L1 model {model} natively on {len(images)} image(s)")
+
+    fsf_settings = {}
+    if Path(l1_block["FSFPrototype"]).is_file():
+        fsf_settings = read_fsf_settings(l1_block["FSFPrototype"])
+    ev_names = [Path(suffix).stem for suffix in l1_block["EVFileSuffices"]]
+    contrast_names, contrasts = get_fsf_contrasts(fsf_settings, ev_names)
+    tr = float(fsf_settings["tr"]) if "tr" in fsf_settings else None
+
+    ev_index, confound_index = index_ev_confound_dirs(l1_block)
+
+    error_count = 0
+    for image in images:
+        file_name = os.path.basename(image)
+        try:
+            ev_conf = get_ev_confound_mat(image, l1_block, ev_index, confound_index)
+        except (EVFileNotFoundError, ConfoundsNotFoundError) as nfe:
+            logger.warn(nfe)
+            error_count += 1
+            continue
+
+        out_dir = os.path.join(
+            l1_block["OutputDir"],
+            file_name.replace("_" + l1_block["TargetSuffix"], ".feat"),
+        )
+        logger.info(f"Fitting image: {file_name}")
+        # One image failing to fit should not stop the rest of the job's images
+        try:
+            fit_l1_image(
+                image,
+                ev_conf["EVs"],
+                out_dir,
+                confounds_file=ev_conf.get("Confounds"),
+                contrasts=contrasts,
+                contrast_names=contrast_names,
+                tr=tr,
+                design_fsf=l1_block["FSFPrototype"] if fsf_settings else None,
+            )
+        except Exception as err:
+            logger.error(f"Failed to fit image {file_name}: {err}")
+            error_count += 1
+            continue
+        logger.info(f"Outputs saved to: {out_dir}")
+
+    if error_count > 0:
+        logger.error(f"Job completed with {error_count} error(s)")
+        sys.exit(1)
+    logger.info("Job completed")
+
+
+def glm_native_l2(
+    glm_config_file: str = None,
+    model: str = None,
+    fsf_names: list = None,
+    debug: bool = False,
+):
+    """Fit an L2 fixed-effects model natively for the given groups of its
+    SubjectFile, identified by fsf_name, or for all of the model's groups if
+    none are given."""
+    glm_config = GLMOptions(glm_config_file)
+    logger = get_logger(
+        STEP_NAME, debug=debug, log_dir=glm_config.parent_options.get_logs_dir()
+    )
+
+    block = [x for x in glm_config.config["Level2Setups"] if x["ModelName"] == model]
+    if len(block) != 1:
+        logger.error("Model not found, or multiple entries found.")
+        sys.exit(1)
+    l2_block = block[0]
+
+    try:
+        sub_tab = read_l2_sublist(l2_block, logger)
+    except ModelNotFoundError as mnfe:
+        logger.error(mnfe)
+        sys.exit(1)
+
+    groups = sub_tab.groupby("fsf_name", sort=False).feat_folders.apply(list)
+    if fsf_names:
+        groups = groups.loc[groups.index.isin(fsf_names)]
+    logger.info(f"Fitting L2 model {model} natively for {len(groups)} group(s)")
+
+    error_count = 0
+    for fsf_name, feat_folders in groups.items():
+        out_dir = os.path.join(l2_block["OutputDir"], f"{fsf_name}.gfeat")
+        logger.info(f"Fitting fixed effects for {fsf_name}: {len(feat_folders)} run(s)")
+        try:
+            fit_l2_fixed_effects(feat_folders, out_dir)
+        except FileNotFoundError as err:
+            logger.warn(err)
+            error_count += 1
+            continue
+        logger.info(f"Outputs saved to: {out_dir}")
+
+    error_msg = ""
+    if error_count > 0:
+        error_msg = f" with {error_count} error(s)"
+    logger.info(f"Job completed{error_msg}")
+
+
+def fit_l1_image(
+    image_file: os.PathLike,
+    ev_files: list,
+    out_dir: os.PathLike,
+    confounds_file: os.PathLike = None,
+    contrasts: np.ndarray = None,
+    contrast_names: list = None,
+    tr: float = None,
+    design_fsf: os.PathLike = None,
+):
+    """Fit an L1 model to one image and save its outputs as a .feat directory.
+
+    Args:
+        image_file: The 4D image to model.
+        ev_files: FSL-style EV files, in 3-column (onset, duration, amplitude) or
+            1-column (one value per volume) format.
+        out_dir: The .feat directory to save outputs to.
+        confounds_file: Optional confounds to add to the design as nuisance
+            regressors. May have a header row.
+        contrasts: A (contrasts x EVs) matrix. Defaults to one contrast per EV.
+        contrast_names: Names of the contrasts.
+        tr: Repetition time in seconds. Defaults to the image header's value.
+        design_fsf: Optional .fsf file to copy to the output as design.fsf.
+    """
+    image = nib.load(str(image_file))
+    data = np.asarray(image.dataobj, dtype=np.float32)
+    n_timepoints = data.shape[3]
+    if tr is None:
+        tr = get_image_tr(image)
+
+    design = build_l1_design(ev_files, n_timepoints, tr)
+    n_evs = design.shape[1]
+    if confounds_file:
+        design = np.column_stack([design, load_confounds(confounds_file, n_timepoints)])
+
+    if contrasts is None:
+        contrasts = np.eye(n_evs)
+    contrasts = np.atleast_2d(contrasts)
+    if contrast_names is None:
+        contrast_names = [f"C{i + 1}" for i in range(contrasts.shape[0])]
+    # Confound regressors are never part of a contrast
+    contrasts = np.pad(contrasts, ((0, 0), (0, design.shape[1] - contrasts.shape[1])))
+
+    mask = np.all(np.isfinite(data), axis=3) & np.any(data != 0, axis=3)
+    results = fit_glm(data[mask].T, design, contrasts)
+
+    out_dir = Path(out_dir)
+    stats_dir = out_dir / "stats"
+    stats_dir.mkdir(parents=True, exist_ok=True)
+
+    def save(values, path):
+        _save_masked(values, mask, image, path)
+
+    for i, pe in enumerate(results["pe"]):
+        save(pe, stats_dir / f"pe{i + 1}.nii.gz")
+    for i in range(contrasts.shape[0]):
+        save(results["cope"][i], stats_dir / f"cope{i + 1}.nii.gz")
+        save(results["varcope"][i], stats_dir / f"varcope{i + 1}.nii.gz")
+        save(results["tstat"][i], stats_dir / f"tstat{i + 1}.nii.gz")
+        save(results["zstat"][i], stats_dir / f"zstat{i + 1}.nii.gz")
+        save(
+            np.full(mask.sum(), results["dof"], dtype=np.float32),
+            stats_dir / f"tdof_t{i + 1}.nii.gz",
+        )
+    save(results["sigmasquareds"], stats_dir / "sigmasquareds.nii.gz")
+    (stats_dir / "dof").write_text(f"{results['dof']}\n")
+
+    mean_func = data.mean(axis=3)
+    _save_volume(mask.astype(np.float32), image, out_dir / "mask.nii.gz")
+    _save_volume(mean_func, image, out_dir / "mean_func.nii.gz")
+    _save_volume(data[..., n_timepoints // 2], image, out_dir / "example_func.nii.gz")
+
+    write_vest(out_dir / "design.mat", design, "NumPoints")
+    write_vest(out_dir / "design.con", contrasts, "NumContrasts", contrast_names)
+    if design_fsf:
+        shutil.copyfile(design_fsf, out_dir / "design.fsf")
+
+
+def fit_l2_fixed_effects(feat_dirs: list, out_dir: os.PathLike):
+    """Combine L1 .feat directories with fixed effects and save the results as a
+    .gfeat directory.
+
+    Each L1 contrast is combined separately, with every run weighted by the
+    inverse of its varcope. Outputs follow FEAT's layout, with one
+    cope<N>.feat/stats directory per L1 contrast. Voxels are only kept where
+    every run has a positive varcope. The degrees of freedom are the sum of the
+    runs' L1 degrees of freedom.
+
+    Args:
+        feat_dirs: The L1 .feat directories to combine.
+        out_dir: The .gfeat directory to save outputs to.
+    """
+    feat_dirs = [Path(feat_dir) for feat_dir in feat_dirs]
+    for feat_dir in feat_dirs:
+        if not feat_dir.exists():
+            raise FileNotFoundError(
+                f"ERROR: Could not find L1 FEAT directory: {feat_dir}"
+            )
+
+    n_copes = len(list((feat_dirs[0] / "stats").glob("cope*.nii.gz")))
+    if n_copes == 0:
+        raise FileNotFoundError(f"ERROR: No copes found in: {feat_dirs[0] / 'stats'}")
+    dof = sum(
+        float((feat_dir / "stats" / "dof").read_text().split()[0])
+        for feat_dir in feat_dirs
+    )
+
+    out_dir = Path(out_dir)
+    group_mask = None
+    for c in range(1, n_copes + 1):
+        sum_weights = sum_weighted_copes = mask = reference = None
+        for feat_dir in feat_dirs:
+            cope_image = nib.load(str(feat_dir / "stats" / f"cope{c}.nii.gz"))
+            cope = np.asarray(cope_image.dataobj, dtype=np.float64)
+            varcope = np.asarray(
+                nib.load(str(feat_dir / "stats" / f"varcope{c}.nii.gz")).dataobj,
+                dtype=np.float64,
+            )
+            valid = np.isfinite(cope) & np.isfinite(varcope) & (varcope > 0)
+            weights = np.divide(1.0, varcope, out=np.zeros_like(varcope), where=valid)
+
+            if reference is None:
+                reference = cope_image
+                sum_weights = np.zeros(cope.shape)
+                sum_weighted_copes = np.zeros(cope.shape)
+                mask = valid
+            mask &= valid
+            sum_weights += weights
+            sum_weighted_copes += weights * np.where(valid, cope, 0.0)
+
+        varcope = np.divide(1.0, sum_weights, out=np.zeros(mask.shape), where=mask)
+        cope = np.where(mask, sum_weighted_copes * varcope, 0.0)
+        tstat = np.divide(cope, np.sqrt(varcope), out=np.zeros(mask.shape), where=mask)
+        zstat = np.where(mask, t_to_z(tstat, dof), 0.0)
+
+        cope_dir = out_dir / f"cope{c}.feat"
+        stats_dir = cope_dir / "stats"
+        stats_dir.mkdir(parents=True, exist_ok=True)
+        _save_volume(cope, reference, stats_dir / "cope1.nii.gz")
+        _save_volume(varcope, reference, stats_dir / "varcope1.nii.gz")
+        _save_volume(tstat, reference, stats_dir / "tstat1.nii.gz")
+        _save_volume(zstat, reference, stats_dir / "zstat1.nii.gz")
+        _save_volume(np.where(mask, dof, 0.0), reference, stats_dir / "tdof_t1.nii.gz")
+        _save_volume(mask.astype(np.float32), reference, cope_dir / "mask.nii.gz")
+
+        group_mask = mask if group_mask is None else group_mask & mask
+
+    _save_volume(group_mask.astype(np.float32), reference, out_dir / "mask.nii.gz")
+
+
+def fit_glm(
+    data: np.ndarray,
+    design: np.ndarray,
+    contrasts: np.ndarray,
+    ar1: bool = True,
+    bins: int = AR1_BINS,
+) -> dict:
+    """Fit a GLM to many timeseries at once.
+
+    The data and design are mean-centered, so the design needs no intercept. With
+    ar1, an OLS fit is used to estimate each timeseries' lag-1 autocorrelation.
+    Estimates are rounded into bins, and each bin is prewhitened and refit
+    together, so the GLS fit costs one least-squares solve per bin.
+
+    Args:
+        data: A (time x voxels) array.
+        design: A (time x regressors) array.
+        contrasts: A (contrasts x regressors) array.
+
+    Returns:
+        A dict of (regressors x voxels) 'pe', (contrasts x voxels) 'cope',
+        'varcope', 'tstat' and 'zstat', (voxels) 'sigmasquareds', and 'dof'.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    design = np.asarray(design, dtype=np.float64)
+    contrasts = np.atleast_2d(contrasts)
+    data = data - data.mean(axis=0)
+    design = design - design.mean(axis=0)
+
+    n_timepoints, n_voxels = data.shape
+    dof = n_timepoints - np.linalg.matrix_rank(design) - 1
+
+    if ar1:
+        pe = np.linalg.pinv(design) @ data
+        residuals = data - design @ pe
+        sum_squares = (residuals**2).sum(axis=0)
+        rho = (residuals[1:] * residuals[:-1]).sum(axis=0) / np.where(
+            sum_squares > 0, sum_squares, 1.0
+        )
+        rho = np.clip(np.round(rho * bins) / bins, -MAX_AR1, MAX_AR1)
+    else:
+        rho = np.zeros(n_voxels)
+
+    pe = np.empty((design.shape[1], n_voxels))
+    sigmasquareds = np.empty(n_voxels)
+    contrast_variance = np.empty((contrasts.shape[0], n_voxels))
+    for rho_bin in np.unique(rho):
+        in_bin = rho == rho_bin
+        design_w = ar1_whiten(design, rho_bin)
+        data_w = ar1_whiten(data[:, in_bin], rho_bin)
+
+        design_pinv = np.linalg.pinv(design_w)
+        pe[:, in_bin] = design_pinv @ data_w
+        residuals = data_w - design_w @ pe[:, in_bin]
+        sigmasquareds[in_bin] = (residuals**2).sum(axis=0) / dof
+
+        unscaled_cov = design_pinv @ design_pinv.T
+        contrast_variance[:, in_bin] = np.einsum(
+            "cp,pq,cq->c", contrasts, unscaled_cov, contrasts
+        )[:, np.newaxis]
+
+    cope = contrasts @ pe
+    varcope = contrast_variance * sigmasquareds
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tstat = np.where(varcope > 0, cope / np.sqrt(varcope), 0.0)
+
+    return {
+        "pe": pe,
+        "cope": cope,
+        "varcope": varcope,
+        "tstat": tstat,
+        "zstat": t_to_z(tstat, dof),
+        "sigmasquareds": sigmasquareds,
+        "dof": dof,
+    }
+
+
+def ar1_whiten(values: np.ndarray, rho: float) -> np.ndarray:
+    """Prewhiten (time x n) values with an AR(1) coefficient."""
+    whitened = np.empty_like(values)
+    whitened[0] = np.sqrt(1 - rho**2) * values[0]
+    whitened[1:] = values[1:] - rho * values[:-1]
+    return whitened
+
+
+def t_to_z(tstat: np.ndarray, dof: float) -> np.ndarray:
+    """Convert t statistics to z statistics with matching tail probabilities."""
+    # Work with whichever tail is smaller to avoid losing precision
+    return np.where(
+        tstat > 0,
+        stats.norm.isf(stats.t.sf(tstat, dof)),
+        stats.norm.ppf(stats.t.cdf(tstat, dof)),
+    )
+
+
+def build_l1_design(
+    ev_files: list, n_timepoints: int, tr: float, oversampling: int = HRF_OVERSAMPLING
+) -> np.ndarray:
+    """Build a (time x EVs) design by convolving each EV with an HRF.
+
+    EVs are built on a time grid oversampling times finer than the TR, then
+    sampled at the start of each volume.
+    """
+    design = np.zeros((n_timepoints, len(ev_files)))
+    for i, ev_file in enumerate(ev_files):
+        events = np.loadtxt(ev_file, ndmin=2)
+        if events.shape[1] == 1:
+            # One value per volume, modelled as back-to-back blocks of one TR
+            amplitudes = events[:n_timepoints, 0]
+            onsets = np.arange(amplitudes.size) * tr
+            durations = tr
+        else:
+            onsets, durations, amplitudes = events[:, :3].T
+        regressors = event_regressors(
+            onsets, durations, n_timepoints, tr, amplitudes, oversampling
+        )
+        design[:, i] = regressors.sum(axis=1)
+
+    return design
+
+
+def load_confounds(confounds_file: os.PathLike, n_timepoints: int) -> np.ndarray:
+    """Load a confounds file, dropping any header row and replacing missing values
+    with their column's mean."""
+    sep = "," if str(confounds_file).endswith(".csv") else r"\s+"
+    confounds = pd.read_csv(confounds_file, sep=sep, header=None)
+    confounds = confounds.apply(pd.to_numeric, errors="coerce")
+    if confounds.iloc[0].isna().all():
+        confounds = confounds.iloc[1:]
+    confounds = confounds.fillna(confounds.mean()).fillna(0)
+
+    if confounds.shape[0] != n_timepoints:
+        raise ValueError(
+            f"Confounds file {confounds_file} has {confounds.shape[0]} rows, "
+            f"but the image has {n_timepoints} timepoints."
+        )
+    return confounds.to_numpy(dtype=np.float64)
+
+
+def get_image_tr(image: nib.Nifti1Image) -> float:
+    """Get an image's repetition time in seconds from its header."""
+    tr = float(image.header.get_zooms()[3])
+    if image.header.get_xyzt_units()[1] == "msec":
+        tr /= 1000.0
+    return tr
+
+
+def write_vest(
+    path: os.PathLike, matrix: np.ndarray, count_name: str, row_names: list = None
+):
+    """Write a matrix in FSL's VEST format, as used by design.mat and design.con."""
+    matrix = np.atleast_2d(matrix)
+    lines = []
+    for i, name in enumerate(row_names or []):
+        lines.append(f"/ContrastName{i + 1}\t{name}")
+    lines.append(f"/NumWaves\t{matrix.shape[1]}")
+    lines.append(f"/{count_name}\t{matrix.shape[0]}")
+    heights = matrix.max(axis=0) - matrix.min(axis=0)
+    lines.append("/PPheights\t" + "\t".join(f"{h:e}" for h in heights))
+    lines.append("")
+    lines.append("/Matrix")
+    lines += ["\t".join(f"{value:e}" for value in row) for row in matrix]
+    Path(path).write_text("\n".join(lines) + "\n")
+
+
+def _save_masked(values, mask, reference: nib.Nifti1Image, path: os.PathLike):
+    volume = np.zeros(mask.shape, dtype=np.float32)
+    volume[mask] = values
+    _save_volume(volume, reference, path)
+
+
+def _save_volume(volume, reference: nib.Nifti1Image, path: os.PathLike):
+    header = reference.header.copy()
+    header.set_data_dtype(np.float32)
+    nib.save(
+        nib.Nifti1Image(volume.astype(np.float32), reference.affine, header),
+        str(path),
+    )
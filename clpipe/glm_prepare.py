@@ -9,15 +9,15 @@ Step 4: Launch a feat job for each fsf
 """
 
 import os
-import glob
 import sys
 import nibabel as nib
 import pandas as pd
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from .config.glm import *
-from .utils import get_logger
+from .utils import get_logger, scan_files
 from .errors import *
 
 STEP_NAME = "prepare"
@@ -26,6 +26,13 @@ DEPRECATION_MSG = "WARNING: Using deprecated GLM setup file."
 L2_SUBLIST_CSV_FILE_NAME = "l2_sublist.csv"
 L2_SUBLIST_CSV_PATH = f"data/{L2_SUBLIST_CSV_FILE_NAME}"
 
+MUMFORD_MODE_COPY = "copy"
+MUMFORD_MODE_LINK = "link"
+MUMFORD_MODES = [MUMFORD_MODE_COPY, MUMFORD_MODE_LINK]
+MUMFORD_THREADS = 8
+# Writing an .fsf file only reads an image header, so a few threads suffice
+FSF_THREADS = 8
+
 
 def glm_prepare(
     glm_config_file: str = None, level: int = L1, model: str = None, debug: bool = False
@@ -33,17 +40,7 @@ def glm_prepare(
     glm_config = GLMOptions(glm_config_file)
     setup_dirs(glm_config)
 
-    warn_deprecated = False
-    try:
-        # These working indicates the user has a glm_config file from < v1.7.4
-        # In this case, use the GLMSetupOptions block as root dict
-        # TODO: when we get centralized config classes, this can be handled there
-        task_name = glm_config.config["GLMSetupOptions"]["TaskName"]
-        reference_image = glm_config.config["GLMSetupOptions"]["ReferenceImage"]
-        warn_deprecated = True
-    except KeyError:
-        task_name = glm_config.config["TaskName"]
-        reference_image = glm_config.config["ReferenceImage"]
+    task_name, reference_image, warn_deprecated = get_task_and_reference(glm_config)
 
     logger = get_logger(
         STEP_NAME, debug=debug, log_dir=glm_config.parent_options.get_logs_dir()
@@ -88,26 +85,59 @@ def glm_prepare(
             sys.exit(1)
 
 
+def get_task_and_reference(glm_config: GLMOptions):
+    """Get the task name and reference image of a GLM config, along with whether
+    the config uses the deprecated GLMSetupOptions block."""
+    try:
+        # These working indicates the user has a glm_config file from < v1.7.4
+        # In this case, use the GLMSetupOptions block as root dict
+        # TODO: when we get centralized config classes, this can be handled there
+        task_name = glm_config.config["GLMSetupOptions"]["TaskName"]
+        reference_image = glm_config.config["GLMSetupOptions"]["ReferenceImage"]
+        return task_name, reference_image, True
+    except KeyError:
+        return glm_config.config["TaskName"], glm_config.config["ReferenceImage"], False
+
+
 def _glm_l1_propagate(l1_block, task_name, reference_image, logger):
     with open(l1_block["FSFPrototype"]) as f:
         fsf_file_template = f.readlines()
 
-    output_ind = [
-        i for i, e in enumerate(fsf_file_template) if "set fmri(outputdir)" in e
-    ]
-    image_files_ind = [
-        i for i, e in enumerate(fsf_file_template) if "set feat_files" in e
-    ]
-    ev_file_inds = [
-        i for i, e in enumerate(fsf_file_template) if "set fmri(custom" in e
-    ]
-    confound_file_ind = [
-        i for i, e in enumerate(fsf_file_template) if "set confoundev_files(1)" in e
-    ]
-    regstandard_ind = [
-        i for i, e in enumerate(fsf_file_template) if "set fmri(regstandard)" in e
-    ]
-    tps_inds = [i for i, e in enumerate(fsf_file_template) if "set fmri(npts)" in e]
+    image_files = find_l1_images(l1_block, task_name, logger)
+
+    if not os.path.exists(l1_block["FSFDir"]):
+        os.mkdir(l1_block["FSFDir"])
+
+    if len(image_files) < 1:
+        logger.info(
+            "No image files found. Check your model's TargetDirectory, TargetSuffix, ImageIncludeList, and ImageExludeList settings."
+        )
+    else:
+        logger.info("Indexing EV and confound directories...")
+        ev_index, confound_index = index_ev_confound_dirs(l1_block)
+
+        logger.info("Propogating fsf files...")
+
+        # Threads share the template and indexes, so nothing is copied per image
+        def create_fsf(file):
+            return _create_l1_fsf(
+                file,
+                fsf_file_template,
+                l1_block,
+                reference_image,
+                ev_index,
+                confound_index,
+            )
+
+        with ThreadPoolExecutor(max_workers=FSF_THREADS) as executor:
+            _log_l1_fsf_results(executor.map(create_fsf, image_files), logger)
+
+        logger.info("Propogation completed.")
+
+
+def find_l1_images(l1_block, task_name, logger) -> list:
+    """Find the images targeted by an L1 model, applying its include/exclude lists
+    and the GLM's task name."""
     if (
         l1_block["ImageIncludeList"] is not ""
         and l1_block["ImageExcludeList"] is not ""
@@ -116,10 +146,7 @@ def _glm_l1_propagate(l1_block, task_name, reference_image, logger):
             "Only one of ImageIncludeList and ImageExcludeList should be non-empty"
         )
 
-    image_files = glob.glob(
-        os.path.join(l1_block["TargetDirectory"], "**", "*" + l1_block["TargetSuffix"]),
-        recursive=True,
-    )
+    image_files = scan_files(l1_block["TargetDirectory"], l1_block["TargetSuffix"])
 
     if l1_block["ImageIncludeList"] is not "":
         image_files = [
@@ -144,94 +171,124 @@ def _glm_l1_propagate(l1_block, task_name, reference_image, logger):
 
     image_files = [file for file in image_files if "task-" + task_name in file]
 
-    if not os.path.exists(l1_block["FSFDir"]):
-        os.mkdir(l1_block["FSFDir"])
+    return image_files
 
-    if len(image_files) < 1:
-        logger.info(
-            "No image files found. Check your model's TargetDirectory, TargetSuffix, ImageIncludeList, and ImageExludeList settings."
+
+def _create_l1_fsf(
+    file, fsf_file_template, l1_block, reference_image, ev_index, confound_index
+):
+    """Write the L1 .fsf file of a single image.
+
+    Runs in a worker thread, so problems are returned as messages to be logged in
+    order. Returns the image's file name and an error message, which is None if
+    the .fsf file was written.
+    """
+    file_name = os.path.basename(file)
+
+    output_ind = [
+        i for i, e in enumerate(fsf_file_template) if "set fmri(outputdir)" in e
+    ]
+    image_files_ind = [
+        i for i, e in enumerate(fsf_file_template) if "set feat_files" in e
+    ]
+    ev_file_inds = [
+        i for i, e in enumerate(fsf_file_template) if "set fmri(custom" in e
+    ]
+    confound_file_ind = [
+        i for i, e in enumerate(fsf_file_template) if "set confoundev_files(1)" in e
+    ]
+    regstandard_ind = [
+        i for i, e in enumerate(fsf_file_template) if "set fmri(regstandard)" in e
+    ]
+    tps_inds = [i for i, e in enumerate(fsf_file_template) if "set fmri(npts)" in e]
+
+    try:
+        # Only the header is needed for the number of timepoints
+        total_tps = nib.load(file).header.get_data_shape()[3]
+        ev_conf = get_ev_confound_mat(file, l1_block, ev_index, confound_index)
+    except (EVFileNotFoundError, ConfoundsNotFoundError) as nfe:
+        return file_name, str(nfe)
+
+    out_dir = os.path.join(
+        l1_block["OutputDir"],
+        file_name.replace("_" + l1_block["TargetSuffix"], ".feat"),
+    )
+    out_fsf = os.path.join(
+        l1_block["FSFDir"],
+        file_name.replace("_" + l1_block["TargetSuffix"], ".fsf"),
+    )
+    new_fsf = list(fsf_file_template)
+
+    new_fsf[tps_inds[0]] = "set fmri(npts) " + str(total_tps) + "\n"
+    new_fsf[output_ind[0]] = 'set fmri(outputdir) "' + os.path.abspath(out_dir) + '"\n'
+    new_fsf[image_files_ind[0]] = 'set feat_files(1) "' + os.path.abspath(file) + '"\n'
+
+    if reference_image != "":
+        new_fsf[regstandard_ind[0]] = (
+            'set fmri(regstandard) "' + os.path.abspath(reference_image) + '"\n'
+        )
+    if l1_block["ConfoundSuffix"] != "":
+        new_fsf[confound_file_ind[0]] = (
+            'set confoundev_files(1) "' + os.path.abspath(ev_conf["Confounds"]) + '"\n'
         )
-    else:
-        logger.info("Propogating fsf files...")
-        for file in image_files:
-            try:
-                file_name = os.path.basename(file)
-
-                logger.info("Creating FSF File for image: " + file_name)
-                img_data = nib.load(file)
-                total_tps = img_data.shape[3]
-                ev_conf = _get_ev_confound_mat(file, l1_block, logger)
-                out_dir = os.path.join(
-                    l1_block["OutputDir"],
-                    file_name.replace("_" + l1_block["TargetSuffix"], ".feat"),
-                )
-                out_fsf = os.path.join(
-                    l1_block["FSFDir"],
-                    file_name.replace("_" + l1_block["TargetSuffix"], ".fsf"),
-                )
-                new_fsf = fsf_file_template
 
-                new_fsf[tps_inds[0]] = "set fmri(npts) " + str(total_tps) + "\n"
-                new_fsf[output_ind[0]] = (
-                    'set fmri(outputdir) "' + os.path.abspath(out_dir) + '"\n'
-                )
-                new_fsf[image_files_ind[0]] = (
-                    'set feat_files(1) "' + os.path.abspath(file) + '"\n'
-                )
+    for i, e in enumerate(ev_conf["EVs"]):
+        new_fsf[ev_file_inds[i]] = (
+            "set fmri(custom" + str(i + 1) + ') "' + os.path.abspath(e) + '"\n'
+        )
 
-                if reference_image is not "":
-                    new_fsf[regstandard_ind[0]] = (
-                        'set fmri(regstandard) "'
-                        + os.path.abspath(reference_image)
-                        + '"\n'
-                    )
-                if l1_block["ConfoundSuffix"] is not "":
-                    new_fsf[confound_file_ind[0]] = (
-                        'set confoundev_files(1) "'
-                        + os.path.abspath(ev_conf["Confounds"])
-                        + '"\n'
-                    )
+    with open(out_fsf, "w") as fsf_file:
+        fsf_file.writelines(new_fsf)
 
-                for i, e in enumerate(ev_conf["EVs"]):
-                    new_fsf[ev_file_inds[i]] = (
-                        "set fmri(custom"
-                        + str(i + 1)
-                        + ') "'
-                        + os.path.abspath(e)
-                        + '"\n'
-                    )
+    return file_name, None
 
-                with open(out_fsf, "w") as fsf_file:
-                    fsf_file.writelines(new_fsf)
 
-            except (EVFileNotFoundError, ConfoundsNotFoundError) as nfe:
-                logger.warn(nfe)
+def _log_l1_fsf_results(results, logger):
+    for file_name, error in results:
+        if error:
+            logger.warn(error)
+        else:
+            logger.info("Created FSF File for image: " + file_name)
 
-        logger.info("Propogation completed.")
 
+def index_ev_confound_dirs(l1_block):
+    """Walk the EV and confound directories once each, mapping the file names
+    that could be needed by the model to their paths."""
+    ev_index = _index_file_names(
+        scan_files(l1_block["EVDirectory"], l1_block["EVFileSuffices"])
+    )
+    confound_index = {}
+    if l1_block["ConfoundSuffix"] != "":
+        confound_index = _index_file_names(
+            scan_files(l1_block["ConfoundDirectory"], l1_block["ConfoundSuffix"])
+        )
+    return ev_index, confound_index
 
-def _get_ev_confound_mat(file, l1_block, logger):
+
+def _index_file_names(paths):
+    """Map each file name to all paths it was found at."""
+    index = {}
+    for path in paths:
+        index.setdefault(os.path.basename(path), []).append(path)
+    return index
+
+
+def get_ev_confound_mat(file, l1_block, ev_index, confound_index):
     file_name = os.path.basename(file)
 
     file_prefix = os.path.basename(file).replace(l1_block["TargetSuffix"], "")
 
     EV_files = []
     for EV in l1_block["EVFileSuffices"]:
-        try:
-            search_path = os.path.join(l1_block["EVDirectory"], "**", file_prefix + EV)
-            logger.debug(f"EV search path: {search_path}")
-            search_results = glob.glob((search_path), recursive=True)
-            if len(search_results) < 1:
-                raise EVFileNotFoundError(f"EV file not found: {EV}")
-            elif len(search_results) > 1:
-                raise EVFileNotFoundError(
-                    f"Found more than one EV file matching pattern: {search_path}"
-                )
+        search_results = ev_index.get(file_prefix + EV, [])
+        if len(search_results) == 1:
             EV_files.append(search_results[0])
-        except EVFileNotFoundError as evfnfe:
-            logger.debug(evfnfe)
+        elif len(search_results) > 1:
+            raise EVFileNotFoundError(
+                f"Found more than one EV file named: {file_prefix + EV}"
+            )
 
-    if len(EV_files) is not len(l1_block["EVFileSuffices"]):
+    if len(EV_files) != len(l1_block["EVFileSuffices"]):
         raise EVFileNotFoundError(
             (
                 f"Did not find enough EV files for image: {file_name}. "
@@ -240,42 +297,43 @@ def _get_ev_confound_mat(file, l1_block, logger):
             )
         )
 
-    if l1_block["ConfoundSuffix"] is not "":
-        search_path = os.path.join(
-            l1_block["ConfoundDirectory"],
-            "**",
-            file_prefix + l1_block["ConfoundSuffix"],
-        )
-        logger.debug(f"Confound search path: {search_path}")
-        search_results = glob.glob((search_path), recursive=True)
+    if l1_block["ConfoundSuffix"] != "":
+        confound_name = file_prefix + l1_block["ConfoundSuffix"]
+        search_results = confound_index.get(confound_name, [])
         if len(search_results) < 1:
             raise ConfoundsNotFoundError(
                 f"Did not find a confound file for image: {file_name}"
             )
         elif len(search_results) > 1:
             raise ConfoundsNotFoundError(
-                f"Found more than one confounds file matching pattern: {search_path}"
+                f"Found more than one confounds file named: {confound_name}"
             )
         return {"EVs": EV_files, "Confounds": search_results[0]}
 
     return {"EVs": EV_files}
 
 
-def _glm_l2_propagate(l2_block, reference_image, logger):
+def read_l2_sublist(l2_block, logger) -> pd.DataFrame:
+    """Read the rows of an L2 model's SubjectFile which belong to that model."""
     subject_file = l2_block["SubjectFile"]
-    prototype_file = l2_block["FSFPrototype"]
 
     logger.info(f"Reading subject file: {subject_file}")
     sub_tab = pd.read_csv(subject_file)
 
     sub_tab = sub_tab.loc[sub_tab["L2_name"] == l2_block["ModelName"]]
 
-    fsf_names = sub_tab.fsf_name.unique()
-
-    if len(fsf_names) == 0:
+    if len(sub_tab) == 0:
         raise ModelNotFoundError(
             f"No records found in subject file for model: {l2_block['ModelName']}"
         )
+    return sub_tab
+
+
+def _glm_l2_propagate(l2_block, reference_image, logger):
+    prototype_file = l2_block["FSFPrototype"]
+
+    sub_tab = read_l2_sublist(l2_block, logger)
+    fsf_names = sub_tab.fsf_name.unique()
 
     logger.info(f"Opening prototype file: {prototype_file}")
     with open(prototype_file) as f:
@@ -349,33 +407,91 @@ def glm_apply_mumford_workaround(
     l1_feat_folders_path=None,
     remove_reg_standard=False,
     debug=False,
+    mode=MUMFORD_MODE_COPY,
+    n_threads=MUMFORD_THREADS,
 ):
     logger = get_logger(APPLY_MUMFORD_STEP_NAME, debug=debug)
     if glm_config_file:
         glm_config = GLMOptions(glm_config_file).config
-        l1_feat_folders_path = glm_config["Level1Setups"]["OutputDir"]
-
-    logger.info(f"Applying Mumford workaround to: {l1_feat_folders_path}")
-    for l1_feat_folder in os.scandir(l1_feat_folders_path):
-        if os.path.isdir(l1_feat_folder):
-            logger.info(f"Processing L1 FEAT folder: {l1_feat_folder.path}")
-            _apply_mumford_workaround(
-                l1_feat_folder, logger, remove_reg_standard=remove_reg_standard
-            )
+        l1_feat_folders_paths = [
+            l1_block["OutputDir"] for l1_block in glm_config["Level1Setups"]
+        ]
+    else:
+        l1_feat_folders_paths = [l1_feat_folders_path]
+
+    l1_feat_folders = []
+    for l1_feat_folders_path in l1_feat_folders_paths:
+        logger.info(f"Applying Mumford workaround to: {l1_feat_folders_path}")
+        l1_feat_folders += [
+            entry.path for entry in os.scandir(l1_feat_folders_path) if entry.is_dir()
+        ]
+
+    def apply(l1_feat_folder):
+        logger.info(f"Processing L1 FEAT folder: {l1_feat_folder}")
+        return _apply_mumford_workaround(
+            l1_feat_folder,
+            logger,
+            remove_reg_standard=remove_reg_standard,
+            mode=mode,
+        )
 
-    logger.info(f"Finished applying Mumford workaround.")
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        applied = list(executor.map(apply, l1_feat_folders))
+
+    n_applied = applied.count(True)
+    logger.info(
+        f"Finished applying Mumford workaround. "
+        f"Applied to {n_applied} of {len(applied)} folder(s); the rest were "
+        f"already up to date or skipped."
+    )
 
 
-def _apply_mumford_workaround(l1_feat_folder, logger, remove_reg_standard=False):
+def _apply_mumford_workaround(
+    l1_feat_folder, logger, remove_reg_standard=False, mode=MUMFORD_MODE_COPY
+):
     """
     When using an image registration other than FSL's, such as fMRIPrep's,
     this work-around is necessary to run FEAT L2 analysis in FSL.
 
+    In copy mode, the identity matrix and mean_func image are copied into the
+    reg folder. In link mode they are hardlinked, or symlinked where a hardlink
+    is not possible, such as across filesystems. Folders which already hold
+    the right files are left untouched.
+
+    Returns False if the folder was already up to date or its files could not be
+    placed, True otherwise.
+
     See: https://mumfordbrainstats.tumblr.com/post/166054797696/
         feat-registration-workaround
     """
+    if mode not in MUMFORD_MODES:
+        raise ValueError(f"Mumford workaround mode must be one of: {MUMFORD_MODES}")
+
     l1_feat_folder = Path(l1_feat_folder)
     l1_feat_reg_folder = l1_feat_folder / "reg"
+    reg_standard_path = l1_feat_folder / "reg_standard"
+
+    try:
+        # Grab the FSLDIR environment var to get path to standard matrices
+        fsl_dir = Path(os.environ["FSLDIR"])
+    except KeyError:
+        fsl_dir = None
+
+    if fsl_dir is not None:
+        identity_matrix_path = fsl_dir / "etc/flirtsch/ident.mat"
+        func_to_standard_path = l1_feat_reg_folder / "example_func2standard.mat"
+        mean_func_path = l1_feat_folder / "mean_func.nii.gz"
+        standard_path = l1_feat_reg_folder / "standard.nii.gz"
+
+        if _mumford_workaround_applied(
+            l1_feat_reg_folder,
+            [
+                (identity_matrix_path, func_to_standard_path),
+                (mean_func_path, standard_path),
+            ],
+        ) and not (remove_reg_standard and reg_standard_path.exists()):
+            logger.debug(f"Mumford workaround already applied to: {l1_feat_folder}")
+            return False
 
     # Create the reg directory if it doesn't exist
     # This happens if FEAT's preprocessing was not used
@@ -389,34 +505,77 @@ def _apply_mumford_workaround(l1_feat_folder, logger, remove_reg_standard=False)
 
     if remove_reg_standard:
         # Delete the reg_standard folder if it exists
-        reg_standard_path = l1_feat_folder / "reg_standard"
         if reg_standard_path.exists():
             logger.debug(f"Removing: {reg_standard_path}")
             shutil.rmtree(reg_standard_path)
 
     try:
-        # Grab the FSLDIR environment var to get path to standard matrices
-        fsl_dir = Path(os.environ["FSLDIR"])
-        identity_matrix_path = fsl_dir / "etc/flirtsch/ident.mat"
-        func_to_standard_path = l1_feat_reg_folder / "example_func2standard.mat"
-        mean_func_path = l1_feat_folder / "mean_func.nii.gz"
-        standard_path = l1_feat_reg_folder / "standard.nii.gz"
+        if fsl_dir is None:
+            raise FileNotFoundError("FSLDIR is not set")
 
         # Copy over the standard identity matrix
         logger.debug(
             (
-                f"Copying identity matrix {identity_matrix_path}"
-                f" to {func_to_standard_path}"
+                f"Placing identity matrix {identity_matrix_path}"
+                f" at {func_to_standard_path}"
             )
         )
-        shutil.copyfile(identity_matrix_path, func_to_standard_path)
+        _place_file(identity_matrix_path, func_to_standard_path, mode)
 
         # Copy in the mean_func image as the reg folder standard,
         # imitating multiplication with the identity matrix.
-        logger.debug(f"Copying mean func image {mean_func_path} to {standard_path}")
-        shutil.copyfile(mean_func_path, standard_path)
+        logger.debug(f"Placing mean func image {mean_func_path} at {standard_path}")
+        _place_file(mean_func_path, standard_path, mode)
     except FileNotFoundError as e:
-        print(e, "- skipping")
+        logger.warning(f"{e} - skipping: {l1_feat_folder}")
+        return False
+    return True
+
+
+def _mumford_workaround_applied(l1_feat_reg_folder: Path, placements: list) -> bool:
+    """Check whether a reg folder already holds the workaround's files, and no
+    other registration matrices, using only file metadata."""
+    if not l1_feat_reg_folder.exists():
+        return False
+    for source, destination in placements:
+        if not _is_same_file(source, destination):
+            return False
+    expected_mats = {destination.name for _, destination in placements}
+    return all(mat.name in expected_mats for mat in l1_feat_reg_folder.glob("*.mat"))
+
+
+def _is_same_file(source: Path, destination: Path) -> bool:
+    """Check if destination is a link to source, or a copy of it made after source
+    was last modified."""
+    try:
+        if os.path.samefile(source, destination):
+            return True
+        source_stat = os.stat(source)
+        destination_stat = os.stat(destination)
+    except FileNotFoundError:
+        return False
+    return (
+        not os.path.islink(destination)
+        and destination_stat.st_size == source_stat.st_size
+        and destination_stat.st_mtime >= source_stat.st_mtime
+    )
+
+
+def _place_file(source: Path, destination: Path, mode: str):
+    # Never write through an existing link, which would modify its target
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    if mode == MUMFORD_MODE_COPY:
+        shutil.copyfile(source, destination)
+        return
+
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"No such file: '{source}'")
+    try:
+        os.link(source, destination)
+    except OSError:
+        os.symlink(os.path.abspath(source), destination)
 
 
 def setup_dirs(glm_config: GLMOptions):
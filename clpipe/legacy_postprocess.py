@@ -20,6 +20,8 @@ from .postprocutils.utils import (
     notch_filter,
 )
 from .postprocutils.spec_interpolate import spec_inter
+from .postprocutils.beta_series import lss_betas
+from .postprocutils.hrf import event_regressors
 from .job_manager import BatchManager, Job
 from .config_json_parser import ClpipeConfigParser
 from .errors import SubjectNotFoundError
@@ -478,23 +480,12 @@ def _ev_mat_prep(event_file, filt, TR, ntp, config_block, logger):
     ]
     valid_events = events.iloc[valid_trials, :]
 
-    timeCourse = numpy.arange(0, 32 + TR / 16.0, (TR / 16.0))
-    time_up = numpy.arange(0, TR * ntp, TR / 16.0)
-    n_up = len(time_up)
-    hrf = 0
-    indexSample = numpy.arange(0, TR * ntp / (TR / 16.0), TR / (TR / 16.0))
-    indexSample = indexSample.astype("int")
-    eventArray = numpy.zeros((ntp, len(valid_trials)))
-    for index, row in valid_events.iterrows():
-        ev_loop = numpy.zeros(n_up)
-        index1 = numpy.logical_and(
-            (time_up >= row["onset"]), (time_up <= row["onset"] + row["duration"])
-        )
-        ev_loop[index1] = 1
-        ev_loop = numpy.convolve(ev_loop, hrf)
-        ev_loop = ev_loop[: -(len(hrf) - 1)]
-        ev_loop = ev_loop[indexSample]
-        eventArray[:, index] = ev_loop
+    eventArray = event_regressors(
+        valid_events["onset"].to_numpy(),
+        valid_events["duration"].to_numpy(),
+        ntp,
+        TR,
+    )
     if filt is not None:
         filt_event_array = apply_filter(filt, eventArray)
     else:
@@ -503,25 +494,9 @@ def _ev_mat_prep(event_file, filt, TR, ntp, config_block, logger):
 
 
 def _beta_series_calc(data, filt_ev_mat, filt_confound_mat, logger):
-    beta_maker = numpy.zeros(filt_ev_mat.shape)
-    logger.debug(beta_maker.shape)
-    for index in range(filt_ev_mat.shape[1]):
-        logger.debug(filt_ev_mat[:, index].shape)
-        logger.debug(filt_confound_mat.shape)
-        logger.debug((numpy.sum(filt_ev_mat, 1) - filt_ev_mat[:, index]).shape)
-        temp_mat = numpy.concatenate(
-            [
-                numpy.expand_dims(filt_ev_mat[:, index], 1),
-                numpy.expand_dims(numpy.sum(filt_ev_mat, 1) - filt_ev_mat[:, index], 1),
-                filt_confound_mat,
-            ],
-            1,
-        )
-        temp_beta = numpy.linalg.pinv(temp_mat)
-        logger.debug(temp_beta.shape)
-        beta_maker[:, index] = temp_beta[0, :]
-
-    betas = numpy.matmul(beta_maker.transpose(), data)
+    logger.debug(filt_ev_mat.shape)
+    logger.debug(filt_confound_mat.shape)
+    betas = lss_betas(data, filt_ev_mat, filt_confound_mat)
     return betas
 
 
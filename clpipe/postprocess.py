@@ -14,6 +14,7 @@ from pathlib import Path
 from .bids import (
     get_bids,
     get_confounds,
+    get_events,
     get_images_to_process,
     get_mask,
     get_mixing_file,
@@ -38,6 +39,15 @@ from .config.options import (
 from .config.options import DEFAULT_PROCESSING_STREAM
 from .job_manager import JobManagerFactory
 from .postprocutils.global_workflows import build_postprocessing_wf
+from .postprocutils.image_workflows import STEP_BETA_SERIES
+from .postprocutils.profiling import (
+    PROFILE_SUFFIX,
+    NodeProfiler,
+    load_profiles,
+    summarize_profiles,
+    write_profile,
+)
+from .postprocutils.qc import QC_SUFFIX, load_qc
 from .postprocutils.utils import draw_graph
 from .utils import get_logger, resolve_fmriprep_dir
 from .errors import *
@@ -394,6 +404,14 @@ def postprocess_image(
             logger.error(nfnfe)
             sys.exit(1)
 
+    events_file = None
+    if STEP_BETA_SERIES in run_config.options.processing_steps:
+        try:
+            events_file = get_events(bids, non_image_query_params, logger)
+        except EventsFileNotFoundError as efnfe:
+            logger.error(efnfe)
+            sys.exit(1)
+
     # Search for this subject's files necessary for processing
     mask_image = get_mask(bids, query_params, logger)
     tr = get_tr(bids, query_params, logger)
@@ -423,6 +441,17 @@ def postprocess_image(
             run_config.target_directory,
             subject_out_dir,
         )
+        if events_file is not None:
+            image_export_path = Path(
+                str(image_export_path).replace("postproc_bold", "betaseries_bold")
+            )
+
+    # Save QC metrics beside the postprocessed image
+    qc_export_path = None
+    if image_export_path is not None and run_config.options.qc_options.include:
+        qc_export_path = image_export_path.parent / (
+            f"{file_name_no_extensions}{QC_SUFFIX}"
+        )
 
     # Build the global postprocessing workflow
     postproc_wf: pe.Workflow = build_postprocessing_wf(
@@ -437,6 +466,8 @@ def postprocess_image(
         mask_file=mask_image,
         mixing_file=mixing_file,
         noise_file=noise_file,
+        events_file=events_file,
+        qc_export_path=qc_export_path,
         base_dir=subject_working_dir,
         crashdump_dir=subject_working_dir,
     )
@@ -449,10 +480,87 @@ def postprocess_image(
             logger=logger,
         )
 
-    postproc_wf.run()
+    # Record each node's resource use, even if the run fails
+    profiler = NodeProfiler()
+    try:
+        postproc_wf.run(plugin="Linear", plugin_args={"status_callback": profiler})
+    finally:
+        profile_file = write_profile(
+            profiler,
+            Path(subject_log_dir) / f"{file_name_no_extensions}{PROFILE_SUFFIX}",
+            image=str(image_path),
+        )
+        logger.info(f"Saved processing profile: {profile_file}")
     sys.exit(0)
 
 
+def postprocess_profile(
+    config_file=None,
+    processing_stream=DEFAULT_PROCESSING_STREAM,
+    log_dir=None,
+    output_file=None,
+    debug=False,
+):
+    """Aggregate the processing profiles of a stream's images into a table of each
+    step's cost."""
+    options: ProjectOptions = ProjectOptions.load(config_file)
+    options.postprocessing.load_cli_args(log_directory=log_dir)
+    logger = get_logger(STEP_NAME, debug=debug)
+
+    stream_log_dir = options.postprocessing.get_stream_log_dir(processing_stream)
+    profiles = load_profiles(stream_log_dir)
+    if profiles.empty:
+        logger.error(f"No processing profiles found in: {stream_log_dir}")
+        sys.exit(1)
+
+    summary = summarize_profiles(profiles)
+    logger.info(
+        f"Profiled {profiles['image'].nunique()} image(s) in: {stream_log_dir}"
+    )
+    print(summary.to_string(float_format=lambda value: f"{value:.2f}"))
+
+    if output_file:
+        summary.to_csv(output_file, sep="\t")
+        logger.info(f"Saved step costs: {output_file}")
+
+    return summary
+
+
+def postprocess_qc(
+    config_file=None,
+    processing_stream=DEFAULT_PROCESSING_STREAM,
+    output_dir=None,
+    output_file=None,
+    debug=False,
+):
+    """Aggregate the QC metrics of a stream's images into one cohort table."""
+    options: ProjectOptions = ProjectOptions.load(config_file)
+    options.postprocessing.load_cli_args(output_directory=output_dir)
+    logger = get_logger(STEP_NAME, debug=debug)
+
+    stream_output_dir = options.postprocessing.get_stream_output_dir(
+        processing_stream
+    )
+    qc = load_qc(stream_output_dir)
+    if qc.empty:
+        logger.error(f"No QC metrics found in: {stream_output_dir}")
+        sys.exit(1)
+
+    logger.info(f"Found QC metrics for {len(qc)} image(s) in: {stream_output_dir}")
+    paths = ["image", "postprocessed_image", "arrays", "qc_file"]
+    print(
+        qc.drop(columns=paths).to_string(
+            index=False, float_format=lambda value: f"{value:.2f}"
+        )
+    )
+
+    if output_file:
+        qc.to_csv(output_file, sep="\t", index=False)
+        logger.info(f"Saved cohort QC table: {output_file}")
+
+    return qc
+
+
 def build_export_path(
     image_path: os.PathLike,
     subject_id: str,
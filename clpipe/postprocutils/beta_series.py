@@ -0,0 +1,252 @@
+"""
+Least-squares-separate (LSS) beta series estimation.
+
+LSS fits one model per trial, with a regressor for that trial, a regressor for
+all other trials, and the nuisance confounds. Fitting each model separately
+costs one pseudoinverse and one pass over the data per trial. Instead, every
+trial's model is solved in closed form here:
+
+    - The confounds are projected out of the trial regressors once.
+    - Each trial's model then reduces to a 2-regressor problem, whose normal
+      equations are built from a single (trials x trials) Gram matrix.
+    - The weights giving each trial's beta are stacked into one
+      (trials x time) matrix, applied to the data with a single product.
+
+beta_series_image wraps the solver as the postprocessing pipeline's BetaSeries
+step. When the image was temporally filtered earlier in the pipeline, the trial
+regressors are given the same filter, so that the design matches the data.
+
+highpass_filter gives the running-line high-pass filter used by the
+beta_series_reg script, without building its (time x time) smoothing matrix.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+# Relative tolerance for treating nuisance directions and 2x2 systems as singular
+RANK_TOLERANCE = 1e-10
+
+HIGHPASS_CUTOFF = 100.0
+
+
+def lss_betas(
+    data: np.ndarray, events: np.ndarray, confounds: np.ndarray = None
+) -> np.ndarray:
+    """Estimate a beta series with least-squares-separate regression.
+
+    Gives the same betas as fitting, for each trial i, the model
+    [events[:, i], events.sum(axis=1) - events[:, i], confounds] by pseudoinverse
+    and keeping the first coefficient.
+
+    Args:
+        data: A (time x voxels) array.
+        events: A (time x trials) array of HRF-convolved trial regressors.
+        confounds: An optional (time x confounds) array of nuisance regressors.
+
+    Returns:
+        A (trials x voxels) array of trial betas.
+    """
+    return lss_weights(events, confounds).T @ data
+
+
+def lss_weights(events: np.ndarray, confounds: np.ndarray = None) -> np.ndarray:
+    """Compute the (time x trials) weights which give each trial's LSS beta when
+    applied to data, so that betas = weights.T @ data."""
+    events = np.asarray(events, dtype=np.float64)
+
+    if confounds is not None and np.size(confounds) > 0:
+        basis = nuisance_basis(np.asarray(confounds, dtype=np.float64))
+        events = events - basis @ (basis.T @ events)
+
+    # The 'other trials' regressor of trial i is total - events[:, i]
+    total = events.sum(axis=1)
+    gram = events.T @ events
+    trial_trial = np.diagonal(gram)
+    trial_total = gram.sum(axis=1)
+    total_total = total @ total
+
+    # Normal equations of each trial's [trial, other] model
+    a = trial_trial
+    b = trial_total - trial_trial
+    c = total_total - 2 * trial_total + trial_trial
+    det = a * c - b**2
+
+    # The first row of each 2x2 inverse, applied to [trial, other]
+    scale = np.maximum(a * c, np.finfo(np.float64).tiny)
+    solvable = det > RANK_TOLERANCE * scale
+    safe_det = np.where(solvable, det, 1.0)
+    trial_weight = np.where(solvable, (c + b) / safe_det, 0.0)
+    total_weight = np.where(solvable, -b / safe_det, 0.0)
+
+    # When 'other' is empty or a multiple k of the trial, as with pinv, take the
+    # minimum-norm solution, which gives the trial 1 / (1 + k^2) of the effect
+    single = ~solvable & (a > 0)
+    k = b[single] / a[single]
+    trial_weight[single] = 1.0 / (a[single] * (1.0 + k**2))
+
+    return events * trial_weight + np.outer(total, total_weight)
+
+
+def nuisance_basis(confounds: np.ndarray) -> np.ndarray:
+    """An orthonormal basis of the space spanned by the confounds, dropping any
+    directions that are linearly dependent."""
+    u, s, _ = np.linalg.svd(confounds, full_matrices=False)
+    if s.size == 0:
+        return u
+    return u[:, s > RANK_TOLERANCE * s[0]]
+
+
+def highpass_filter(
+    data: np.ndarray, tr: float, cutoff: float = HIGHPASS_CUTOFF
+) -> np.ndarray:
+    """High-pass filter a (time x ...) array by subtracting a Gaussian-weighted
+    running-line fit.
+
+    This is the filter F = I - H of Mumford's beta series script, where row k of
+    the smoothing matrix H fits a line to the timeseries with Gaussian weights
+    centred on timepoint k. H is applied as a pair of Gaussian convolutions,
+    rescaled by per-timepoint coefficients which are cached for each run length
+    and TR.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    n_timepoints = data.shape[0]
+    kernel, times, a, b, det = _running_line_coefficients(n_timepoints, tr, cutoff)
+
+    shape = (n_timepoints,) + (1,) * (data.ndim - 1)
+    smoothed = a.reshape(shape) * _convolve_time(kernel, data)
+    smoothed += b.reshape(shape) * _convolve_time(kernel, times.reshape(shape) * data)
+    return data - smoothed / det.reshape(shape)
+
+
+@lru_cache(maxsize=32)
+def _running_line_coefficients(n_timepoints: int, tr: float, cutoff: float):
+    """Per-timepoint coefficients of the running-line fit.
+
+    With squared Gaussian weights v_kj, the fit at timepoint k is
+    sum_j v_kj (a_k + b_k t_j) y_j / det_k, from the closed-form solution of
+    each row's weighted 2-parameter least squares problem. The row
+    normalization of the weights cancels, so only the kernel shape matters.
+    """
+    sigma_squared = ((cutoff / tr) / np.sqrt(2.0)) ** 2
+    lags = np.arange(-(n_timepoints - 1), n_timepoints, dtype=np.float64)
+    kernel = np.exp(-(lags**2) / sigma_squared)
+    times = np.arange(1, n_timepoints + 1, dtype=np.float64)
+
+    s0, s1, s2 = _convolve_time(
+        kernel, np.stack([np.ones_like(times), times, times**2], axis=1)
+    ).T
+    a = s2 - times * s1
+    b = times * s0 - s1
+    det = s0 * s2 - s1**2
+
+    for array in (kernel, times, a, b, det):
+        array.flags.writeable = False
+    return kernel, times, a, b, det
+
+
+def _convolve_time(kernel: np.ndarray, data: np.ndarray) -> np.ndarray:
+    """Apply the symmetric (time x time) Toeplitz matrix with the given lags to
+    the first axis of data."""
+    from scipy.signal import fftconvolve
+
+    n_timepoints = data.shape[0]
+    kernel = kernel.reshape((kernel.size,) + (1,) * (data.ndim - 1))
+    return fftconvolve(data, kernel, axes=0)[n_timepoints - 1 : 2 * n_timepoints - 1]
+
+
+def beta_series_image(
+    nii_file,
+    events_file,
+    tr,
+    confounds_file=None,
+    mask_file=None,
+    exclude_trial_types=None,
+    trim_from_beginning=0,
+    events_export_path=None,
+    trim_from_end=0,
+    temporal_filter_options=None,
+    scrub_vector=None,
+):
+    """Estimate an image's beta series with least-squares-separate regression.
+
+    Timepoints scrubbed to NaN, in either the image or the confounds, are left
+    out of the fit. Returns the path of the beta series image, which has one
+    volume per trial used.
+
+    If the image was temporally filtered, temporal_filter_options holds the
+    filter's settings, as from get_native_step_options, along with "before_trim",
+    whether it was applied before TrimTimepoints, and "censor", whether the
+    scrub_vector was left out of its fit. The trial regressors are filtered the
+    same way.
+    """
+    # Imports must be in function for running as node
+    import os
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+    import pandas as pd
+
+    from clpipe.postprocutils.beta_series import lss_betas
+    from clpipe.postprocutils.confounds_native import temporal_filter
+    from clpipe.postprocutils.hrf import event_regressors
+    from clpipe.postprocutils.utils import strip_image_extension
+
+    image = nib.load(str(nii_file))
+    data = np.asarray(image.dataobj, dtype=np.float32)
+    n_timepoints = data.shape[3]
+
+    if mask_file:
+        mask = np.asarray(nib.load(str(mask_file)).dataobj) > 0
+    else:
+        mask = np.any(data != 0, axis=3)
+    timeseries = data[mask].T
+
+    events = pd.read_csv(events_file, sep="\t", na_values="n/a")
+    if exclude_trial_types and "trial_type" in events.columns:
+        events = events.loc[~events["trial_type"].isin(exclude_trial_types)]
+    events = events.dropna(subset=["onset"]).reset_index(drop=True)
+
+    # Trial timings are relative to the first volume before any trimming
+    regressors = event_regressors(
+        events["onset"].to_numpy(),
+        events["duration"].fillna(0).to_numpy(),
+        trim_from_beginning + n_timepoints + trim_from_end,
+        tr,
+    )
+    filter_options = temporal_filter_options or {}
+    censor = scrub_vector if filter_options.get("censor") else None
+    if filter_options.get("before_trim"):
+        regressors = temporal_filter(regressors, tr, filter_options, censor=censor)
+    regressors = regressors[trim_from_beginning : trim_from_beginning + n_timepoints]
+    if filter_options and not filter_options.get("before_trim"):
+        regressors = temporal_filter(regressors, tr, filter_options, censor=censor)
+
+    confounds = np.ones((n_timepoints, 1))
+    if confounds_file:
+        confounds_df = pd.read_csv(confounds_file, sep="\t")
+        if len(confounds_df.columns) > 0:
+            confounds = np.column_stack(
+                [confounds, confounds_df.to_numpy(dtype=np.float64)]
+            )
+
+    # Scrubbed timepoints are NaN across the whole image
+    kept = np.isfinite(timeseries).any(axis=1) & np.isfinite(confounds).all(axis=1)
+    timeseries = np.nan_to_num(timeseries[kept])
+    betas = lss_betas(timeseries, regressors[kept], confounds[kept])
+
+    volume = np.zeros(mask.shape + (betas.shape[0],), dtype=np.float32)
+    volume[mask] = betas.T
+    header = image.header.copy()
+    header.set_data_dtype(np.float32)
+
+    base_name = strip_image_extension(Path(nii_file).name)
+    out_file = os.path.abspath(f"{base_name}_betaseries.nii.gz")
+    nib.save(nib.Nifti1Image(volume, image.affine, header), out_file)
+
+    if events_export_path:
+        Path(events_export_path).parent.mkdir(parents=True, exist_ok=True)
+        events.to_csv(events_export_path, sep="\t", index=False)
+
+    return out_file
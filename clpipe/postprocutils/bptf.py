@@ -0,0 +1,107 @@
+"""
+In-process equivalent of fslmaths -bptf.
+
+fslmaths high-pass filters each voxel by subtracting a local linear fit, with
+Gaussian weights truncated at 3 sigma, and low-pass filters by convolving with
+a Gaussian truncated at 20 sigma. Both are linear in the data, and their weights
+only depend on the timepoint and the run's length, so together they form a
+single (time x time) matrix. It is cached for each run length and pair of
+sigmas, and applied to blocks of voxels, with each voxel's mean added back in
+the same pass, as the fslmaths workflow does with MeanImage and BinaryMaths.
+
+This follows FSL 5.0.7 and later, where -bptf also removes the mean.
+"""
+
+from functools import lru_cache
+from math import log, sqrt
+
+import numpy as np
+
+FWHM_TO_SIGMA = sqrt(8 * log(2))
+
+
+def bptf_sigmas(hp: float, lp: float, tr: float) -> tuple:
+    """Convert high-pass and low-pass cutoffs in Hz to the sigmas, in volumes,
+    given to fslmaths -bptf. Disabled cutoffs give a sigma of -1."""
+    hp_sigma, lp_sigma = -1, -1
+    if hp > 0:
+        hp_sigma = 1 / (hp * FWHM_TO_SIGMA * tr)
+    if lp > 0:
+        lp_sigma = 1 / (lp * FWHM_TO_SIGMA * tr)
+    return hp_sigma, lp_sigma
+
+
+def bptf(data: np.ndarray, hp_sigma: float, lp_sigma: float) -> np.ndarray:
+    """Filter a (time x ...) array as fslmaths -bptf does."""
+    data = np.asarray(data, dtype=np.float64)
+    matrix = bptf_matrix(data.shape[0], hp_sigma, lp_sigma)
+    return np.tensordot(matrix, data, axes=1)
+
+
+def bptf_matrix(n_timepoints: int, hp_sigma: float, lp_sigma: float) -> np.ndarray:
+    """Build the (time x time) matrix applying fslmaths -bptf to a timeseries.
+    Either filter is disabled when its sigma is not positive."""
+    return _bptf_matrix(int(n_timepoints), float(hp_sigma), float(lp_sigma)).copy()
+
+
+@lru_cache(maxsize=32)
+def _bptf_matrix(n_timepoints, hp_sigma, lp_sigma):
+    times = np.arange(n_timepoints)
+    lags = times[np.newaxis, :] - times[:, np.newaxis]
+    matrix = np.eye(n_timepoints)
+
+    if hp_sigma > 0:
+        # Each row fits a line to the window around its timepoint, and removes the
+        #   line's value at the timepoint
+        half_width = int(hp_sigma * 3)
+        weights = np.exp(-0.5 * lags**2 / hp_sigma**2)
+        weights[np.abs(lags) > half_width] = 0
+        n = weights.sum(axis=1)
+        a = (weights * lags).sum(axis=1)
+        c = (weights * lags**2).sum(axis=1)
+        denom = c * n - a**2
+        fittable = denom != 0
+        safe_denom = np.where(fittable, denom, 1.0)
+        fit = weights * (c[:, np.newaxis] - a[:, np.newaxis] * lags)
+        fit /= safe_denom[:, np.newaxis]
+        fit[~fittable] = 0
+        matrix = matrix - fit
+
+    if lp_sigma > 0:
+        # Weights are normalized over the whole kernel, so they sum to less than 1
+        #   near the ends of the run
+        half_width = int(lp_sigma * 20) + 2
+        kernel_lags = np.arange(-half_width, half_width + 1)
+        total = np.exp(-0.5 * kernel_lags**2 / lp_sigma**2).sum()
+        smoothing = np.exp(-0.5 * lags**2 / lp_sigma**2) / total
+        smoothing[np.abs(lags) > half_width] = 0
+        matrix = smoothing @ matrix
+
+    matrix.flags.writeable = False
+    return matrix
+
+
+def bptf_image(
+    nii_file,
+    hp_sigma=-1,
+    lp_sigma=-1,
+    mask_file=None,
+    export_path=None,
+):
+    """Temporally filter an image as fslmaths -bptf does, adding each voxel's mean
+    back. Returns the path of the filtered image."""
+    # Imports must be in function for running as node
+    from clpipe.postprocutils.bptf import bptf_matrix
+    from clpipe.postprocutils.projection import transform_image
+
+    def build_matrix(censor):
+        return bptf_matrix(len(censor), hp_sigma, lp_sigma)
+
+    return transform_image(
+        nii_file,
+        build_matrix,
+        keep_mean=True,
+        mask_file=mask_file,
+        export_path=export_path,
+        suffix="filtered",
+    )
@@ -0,0 +1,332 @@
+"""
+Native confounds engine.
+
+The nipype confounds workflow selects columns, replaces missing values, converts
+the confounds to a NIfTI image to run the image processing workflows on them,
+converts them back and appends motion outlier columns, with each step reading
+and writing its own file. Here the confounds file is parsed once into a float
+matrix, every selected step is applied to the matrix directly, and a single
+processed file is written.
+
+Steps are supported natively when they need no external tools:
+    - TemporalFiltering with the Butterworth, Projection or fslmaths
+      implementations, with fslmaths computed as in clpipe.postprocutils.bptf
+    - AROMARegression, as the same partial regression as fsl_regfilt.R
+    - TrimTimepoints
+    - ScrubTimepoints, including spectral interpolation
+"""
+
+import fnmatch
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .utils import (
+    apply_filter,
+    calc_filter,
+    construct_motion_outliers,
+    get_scrub_vector,
+)
+from .bptf import bptf, bptf_sigmas
+from .projection import filter_matrix
+from .spec_interpolate import spec_inter
+
+ENGINE_NATIVE = "native"
+ENGINE_NIPYPE = "nipype"
+ENGINES = [ENGINE_NATIVE, ENGINE_NIPYPE]
+
+STEP_TEMPORAL_FILTERING = "TemporalFiltering"
+STEP_AROMA_REGRESSION = "AROMARegression"
+STEP_TRIM_TIMEPOINTS = "TrimTimepoints"
+STEP_SCRUB_TIMEPOINTS = "ScrubTimepoints"
+
+IMPLEMENTATION_BUTTERWORTH = "Butterworth"
+IMPLEMENTATION_PROJECTION = "Projection"
+IMPLEMENTATION_FSLMATHS = "fslmaths"
+IMPLEMENTATION_FSLMATHS_NATIVE = "fslmaths_native"
+NATIVE_FILTER_IMPLEMENTATIONS = {
+    IMPLEMENTATION_BUTTERWORTH,
+    IMPLEMENTATION_PROJECTION,
+    IMPLEMENTATION_FSLMATHS,
+    IMPLEMENTATION_FSLMATHS_NATIVE,
+}
+MOTION_OUTLIER_PREFIX = "motion_outlier_"
+
+
+def native_confounds_supported(processing_options, processing_steps: list) -> bool:
+    """Whether every confounds step in processing_steps can run natively."""
+    if STEP_TEMPORAL_FILTERING in processing_steps:
+        implementation = (
+            processing_options.processing_step_options.temporal_filtering.implementation
+        )
+        if implementation not in NATIVE_FILTER_IMPLEMENTATIONS:
+            return False
+    return True
+
+
+def get_native_step_options(processing_options, processing_steps: list) -> dict:
+    """Gather the settings of each confounds step into a plain dict, which can be
+    passed to a nipype node."""
+    step_options = processing_options.processing_step_options
+    options = {}
+    if STEP_TEMPORAL_FILTERING in processing_steps:
+        temporal_filtering = step_options.temporal_filtering
+        options[STEP_TEMPORAL_FILTERING] = {
+            "implementation": temporal_filtering.implementation,
+            "hp": temporal_filtering.filtering_high_pass,
+            "lp": temporal_filtering.filtering_low_pass,
+            "order": temporal_filtering.filtering_order,
+        }
+    if STEP_TRIM_TIMEPOINTS in processing_steps:
+        options[STEP_TRIM_TIMEPOINTS] = {
+            "from_beginning": step_options.trim_timepoints.from_beginning,
+            "from_end": step_options.trim_timepoints.from_end,
+        }
+    if STEP_SCRUB_TIMEPOINTS in processing_steps:
+        scrub_timepoints = step_options.scrub_timepoints
+        options[STEP_SCRUB_TIMEPOINTS] = {
+            "insert_na": scrub_timepoints.insert_na,
+            "interpolate": scrub_timepoints.interpolate,
+            "oversampling_freq": scrub_timepoints.oversampling_freq,
+            "percent_freq_sample": scrub_timepoints.percent_freq_sample,
+        }
+    return options
+
+
+def process_confounds(
+    confounds_df: pd.DataFrame,
+    column_names: list,
+    processing_steps: list = None,
+    step_options: dict = None,
+    tr: float = None,
+    scrub_vector: list = None,
+    mixing_file: os.PathLike = None,
+    noise_file: os.PathLike = None,
+    motion_outliers: dict = None,
+) -> pd.DataFrame:
+    """Process a confounds table in memory.
+
+    Args:
+        confounds_df: The confounds table, as read from fMRIPrep's confounds file.
+        column_names: The columns to keep, which may use the '*' wildcard.
+        processing_steps: The confounds steps to apply, in order.
+        step_options: The settings of each step, from get_native_step_options.
+        tr: The repetition time, needed for TemporalFiltering.
+        scrub_vector: The timepoints to scrub, needed for ScrubTimepoints.
+        mixing_file: The AROMA mixing file, needed for AROMARegression.
+        noise_file: The AROMA noise file, needed for AROMARegression.
+        motion_outliers: If given, a scrub config dict used to add motion outlier
+            spike columns.
+
+    Returns:
+        The processed confounds, with missing values as NaN.
+    """
+    processing_steps = processing_steps or []
+    step_options = step_options or {}
+
+    columns = expand_column_names(confounds_df.columns, column_names)
+    selected_df = confounds_df[columns].astype(np.float64)
+
+    # Replace missing values with their column's mean
+    matrix = selected_df.fillna(selected_df.mean()).to_numpy()
+
+    # Motion outliers come from the original timeseries, and are then kept
+    #   aligned with the remaining timepoints
+    spikes = None
+    if motion_outliers:
+        outliers = get_scrub_vector(
+            confounds_df[motion_outliers["target_variable"]],
+            motion_outliers["threshold"],
+            motion_outliers["scrub_behind"],
+            motion_outliers["scrub_ahead"],
+            motion_outliers["scrub_contiguous"],
+        )
+        spikes = np.flatnonzero(outliers)
+    timepoints = np.arange(matrix.shape[0])
+
+    for index, step in enumerate(processing_steps):
+        if step == STEP_TEMPORAL_FILTERING:
+            if not tr:
+                raise ValueError(f"{STEP_TEMPORAL_FILTERING}: No TR provided.")
+            # Leave timepoints scrubbed later out of the filter's fit
+            censor = None
+            if STEP_SCRUB_TIMEPOINTS in processing_steps[index:]:
+                censor = scrub_vector
+            matrix = temporal_filter(
+                matrix, tr, step_options[STEP_TEMPORAL_FILTERING], censor=censor
+            )
+
+        elif step == STEP_AROMA_REGRESSION:
+            if mixing_file is None or noise_file is None:
+                raise ValueError(
+                    f"{STEP_AROMA_REGRESSION}: Missing AROMA mixing or noise file."
+                )
+            matrix = regress_aroma_components(
+                matrix,
+                load_mixing_matrix(mixing_file),
+                load_noise_components(noise_file),
+            )
+
+        elif step == STEP_TRIM_TIMEPOINTS:
+            options = step_options[STEP_TRIM_TIMEPOINTS]
+            stop = matrix.shape[0] - options["from_end"]
+            matrix = matrix[options["from_beginning"] : stop]
+            timepoints = timepoints[options["from_beginning"] : stop]
+
+        elif step == STEP_SCRUB_TIMEPOINTS:
+            if scrub_vector is None:
+                raise ValueError(f"{STEP_SCRUB_TIMEPOINTS}: No scrub vector provided.")
+            options = step_options[STEP_SCRUB_TIMEPOINTS]
+            scrub_targets = np.flatnonzero(scrub_vector)
+            if options.get("interpolate"):
+                if not tr:
+                    raise ValueError(f"{STEP_SCRUB_TIMEPOINTS}: No TR provided.")
+                matrix = spec_inter(
+                    matrix,
+                    tr,
+                    options["oversampling_freq"],
+                    scrub_vector,
+                    options["percent_freq_sample"],
+                    matrix.shape[1],
+                    dtype=np.float64,
+                )
+            elif options["insert_na"]:
+                matrix[scrub_targets] = np.nan
+            else:
+                matrix = np.delete(matrix, scrub_targets, axis=0)
+                timepoints = np.delete(timepoints, scrub_targets)
+
+        else:
+            raise ValueError(f"Step cannot be applied to confounds: {step}")
+
+    processed_df = pd.DataFrame(matrix, columns=columns)
+
+    if spikes is not None:
+        # One column per outlier, dropping any whose timepoint was removed
+        spike_df = construct_motion_outliers(np.isin(timepoints, spikes))
+        spike_df.columns = [
+            f"{MOTION_OUTLIER_PREFIX}{i}" for i in range(1, spike_df.shape[1] + 1)
+        ]
+        processed_df = pd.concat([processed_df, spike_df], axis=1)
+
+    return processed_df
+
+
+def process_confounds_file(
+    confounds_file,
+    column_names,
+    processing_steps=None,
+    step_options=None,
+    tr=None,
+    scrub_vector=None,
+    mixing_file=None,
+    noise_file=None,
+    motion_outliers=None,
+    out_file=None,
+):
+    """Node wrapper for process_confounds, reading and writing TSV files. Returns
+    the path of the processed confounds file."""
+    # Imports must be in function for running as node
+    from pathlib import Path
+
+    import pandas as pd
+
+    from clpipe.postprocutils.confounds_native import process_confounds
+
+    confounds_df = pd.read_csv(confounds_file, sep="\t")
+    processed_df = process_confounds(
+        confounds_df,
+        column_names,
+        processing_steps=processing_steps,
+        step_options=step_options,
+        tr=tr,
+        scrub_vector=scrub_vector,
+        mixing_file=mixing_file,
+        noise_file=noise_file,
+        motion_outliers=motion_outliers,
+    )
+
+    if not out_file:
+        out_file = Path(Path(confounds_file).stem + "_processed.tsv")
+    out_file = Path(out_file).absolute()
+    processed_df.to_csv(out_file, sep="\t", index=False, na_rep="n/a")
+
+    return str(out_file)
+
+
+def temporal_filter(
+    matrix: np.ndarray, tr: float, options: dict, censor: list = None
+) -> np.ndarray:
+    """Apply a natively supported TemporalFiltering implementation to the first
+    axis of a (time x columns) matrix.
+
+    Args:
+        matrix: The timeseries to filter.
+        tr: The repetition time.
+        options: The TemporalFiltering settings, from get_native_step_options.
+        censor: For the Projection implementation, timepoints to leave out of the
+            filter's fit.
+    """
+    implementation = options.get("implementation", IMPLEMENTATION_BUTTERWORTH)
+    if implementation == IMPLEMENTATION_PROJECTION:
+        return (
+            filter_matrix(matrix.shape[0], tr, options["hp"], options["lp"], censor)
+            @ matrix
+        )
+    if implementation in (IMPLEMENTATION_FSLMATHS, IMPLEMENTATION_FSLMATHS_NATIVE):
+        # fslmaths removes the mean, which the fslmaths workflow adds back
+        hp_sigma, lp_sigma = bptf_sigmas(options["hp"], options["lp"], tr)
+        return bptf(matrix, hp_sigma, lp_sigma) + matrix.mean(axis=0)
+    sos = calc_filter(options["hp"], options["lp"], tr, options["order"])
+    return apply_filter(sos, matrix)
+
+
+def expand_column_names(available_columns, column_names: list) -> list:
+    """Match column names, which may use the '*' wildcard, against the available
+    columns. Columns are returned once each, in the order first matched."""
+    available_columns = list(available_columns)
+    expanded = []
+    for pattern in column_names:
+        if "*" in pattern:
+            expanded.extend(fnmatch.filter(available_columns, pattern))
+        elif pattern in available_columns:
+            expanded.append(pattern)
+    return list(dict.fromkeys(expanded))
+
+
+def regress_aroma_components(
+    data: np.ndarray, mixing: np.ndarray, noise_components: list
+) -> np.ndarray:
+    """Non-aggressively remove AROMA noise components from a (time x columns) array.
+
+    Every component is fit to each column without an intercept, and only the fit
+    of the noise components is removed, as in fsl_regfilt.R. Constant columns are
+    left unchanged.
+    """
+    if mixing.shape[0] != data.shape[0]:
+        raise ValueError(
+            f"AROMA mixing matrix has {mixing.shape[0]} timepoints, "
+            f"but the data have {data.shape[0]}."
+        )
+    noise = np.asarray(noise_components, dtype=int) - 1
+
+    varying = ~np.all(data == data[:1], axis=0)
+    betas, _, _, _ = np.linalg.lstsq(mixing, data[:, varying], rcond=None)
+
+    regressed = data.copy()
+    regressed[:, varying] -= mixing[:, noise] @ betas[noise]
+    return regressed
+
+
+def load_mixing_matrix(mixing_file: os.PathLike) -> np.ndarray:
+    """Load an AROMA/MELODIC mixing matrix as a (time x components) array."""
+    return np.loadtxt(mixing_file, ndmin=2)
+
+
+def load_noise_components(noise_file: os.PathLike) -> list:
+    """Load the 1-based indexes of the noise components from an AROMA noise
+    file, which holds a comma-separated list."""
+    text = Path(noise_file).read_text().strip()
+    return [int(float(index)) for index in text.split(",") if index.strip()]
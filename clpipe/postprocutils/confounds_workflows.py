@@ -14,6 +14,12 @@ import nipype.pipeline.engine as pe
 
 from .image_workflows import build_image_postprocessing_workflow
 from .utils import get_scrub_vector_node, expand_columns
+from .confounds_native import (
+    ENGINE_NATIVE,
+    get_native_step_options,
+    native_confounds_supported,
+    process_confounds_file,
+)
 from ..config.options import PostProcessingOptions
 
 # A list of the temporal-based processing steps applicable to confounds
@@ -87,6 +93,41 @@ def build_confounds_processing_workflow(
     except KeyError:
         motion_outliers = False
 
+    # Select any of the postprocessing steps that apply to confounds
+    confounds_processing_steps = []
+    for step in processing_steps:
+        if step in CONFOUND_STEPS:
+            confounds_processing_steps.append(step)
+
+    if processing_options.confound_options.engine == ENGINE_NATIVE and (
+        native_confounds_supported(processing_options, confounds_processing_steps)
+    ):
+        motion_outliers_config = None
+        if motion_outliers:
+            motion_outliers_config = {
+                "target_variable": scrub_var,
+                "threshold": threshold,
+                "scrub_ahead": scrub_ahead,
+                "scrub_behind": scrub_behind,
+                "scrub_contiguous": scrub_contiguous,
+            }
+        return build_native_confounds_workflow(
+            column_names,
+            processing_steps=confounds_processing_steps,
+            step_options=get_native_step_options(
+                processing_options, confounds_processing_steps
+            ),
+            confounds_file=confounds_file,
+            export_file=export_file,
+            mixing_file=mixing_file,
+            noise_file=noise_file,
+            tr=tr,
+            motion_outliers=motion_outliers_config,
+            name=name,
+            base_dir=base_dir,
+            crashdump_dir=crashdump_dir,
+        )
+
     confounds_wf = pe.Workflow(name=name, base_dir=base_dir)
     if crashdump_dir is not None:
         confounds_wf.config["execution"]["crashdump_dir"] = crashdump_dir
@@ -117,12 +158,6 @@ def build_confounds_processing_workflow(
     if export_file:
         input_node.inputs.export_file = export_file
 
-    # Select any of the postprocessing steps that apply to confounds
-    confounds_processing_steps = []
-    for step in processing_steps:
-        if step in CONFOUND_STEPS:
-            confounds_processing_steps.append(step)
-
     # Setup the confounds file prep workflow
     #   Should always be the first confounds workflow.
     confounds_prep_wf = build_confounds_prep_workflow(
@@ -161,7 +196,6 @@ def build_confounds_processing_workflow(
     if motion_outliers:
         prev_wf = current_wf
         current_wf = build_confounds_add_motion_outliers_workflow(
-            threshold,
             base_dir=base_dir,
             crashdump_dir=crashdump_dir,
         )
@@ -186,6 +220,101 @@ def build_confounds_processing_workflow(
     return confounds_wf
 
 
+def build_native_confounds_workflow(
+    column_names: List,
+    processing_steps: List = None,
+    step_options: dict = None,
+    confounds_file: os.PathLike = None,
+    export_file: os.PathLike = None,
+    mixing_file: os.PathLike = None,
+    noise_file: os.PathLike = None,
+    tr: float = None,
+    motion_outliers: dict = None,
+    name: str = "Confounds_Processing_Pipeline",
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Builds a confounds workflow which runs every step in a single node, without
+    converting the confounds to an image.
+
+    Args:
+        column_names (List): A list of columns from the input confounds file to keep.
+        processing_steps (List, optional): The confounds steps to apply.
+        step_options (dict, optional): The settings of each step.
+        confounds_file (os.PathLike, optional): The input confounds file.
+        export_file (os.PathLike, optional): Where to export the processed file.
+        mixing_file (os.PathLike, optional): The AROMA mixing file.
+        noise_file (os.PathLike, optional): The AROMA noise file.
+        tr (float, optional): The repetition time.
+        motion_outliers (dict, optional): The scrub config used to add motion
+            outlier spike columns. Defaults to None, adding no columns.
+
+    Returns:
+        pe.Workflow: A confound processing workflow.
+    """
+    workflow = pe.Workflow(name=name, base_dir=base_dir)
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    input_node = pe.Node(
+        IdentityInterface(
+            fields=["in_file", "scrub_vector", "export_file"],
+            mandatory_inputs=False,
+        ),
+        name="inputnode",
+    )
+    output_node = pe.Node(
+        IdentityInterface(fields=["out_file"], mandatory_inputs=True), name="outputnode"
+    )
+
+    process_node = pe.Node(
+        Function(
+            input_names=[
+                "confounds_file",
+                "column_names",
+                "processing_steps",
+                "step_options",
+                "tr",
+                "scrub_vector",
+                "mixing_file",
+                "noise_file",
+                "motion_outliers",
+            ],
+            output_names=["out_file"],
+            function=process_confounds_file,
+        ),
+        name="process_confounds",
+    )
+    process_node.inputs.column_names = column_names
+    process_node.inputs.processing_steps = processing_steps or []
+    process_node.inputs.step_options = step_options or {}
+    process_node.inputs.motion_outliers = motion_outliers
+    if tr:
+        process_node.inputs.tr = tr
+    if mixing_file:
+        process_node.inputs.mixing_file = mixing_file
+    if noise_file:
+        process_node.inputs.noise_file = noise_file
+
+    if confounds_file:
+        input_node.inputs.in_file = confounds_file
+    if export_file:
+        input_node.inputs.export_file = export_file
+
+    workflow.connect(input_node, "in_file", process_node, "confounds_file")
+    if "ScrubTimepoints" in (processing_steps or []):
+        workflow.connect(input_node, "scrub_vector", process_node, "scrub_vector")
+    workflow.connect(process_node, "out_file", output_node, "out_file")
+
+    if export_file:
+        export_node = pe.Node(
+            ExportFile(out_file=export_file, clobber=True), name="export"
+        )
+        workflow.connect(process_node, "out_file", export_node, "in_file")
+
+    return workflow
+
+
 def build_confounds_prep_workflow(
     column_names: List,
     scrub_target_variable: str = None,
@@ -451,87 +580,58 @@ def build_confounds_add_motion_outliers_workflow(
     if out_file:
         input_node.inputs.out_file = out_file
 
-    construct_motion_outliers_node = pe.Node(
-        Function(
-            input_names=["scrub_vector"],
-            output_names=["out_file"],
-            function=_construct_motion_outliers,
-        ),
-        name="get_motion_outliers",
-    )
-
     combine_confounds_node = pe.Node(
         Function(
-            input_names=["base_confounds_file", "append_confounds_file"],
+            input_names=["base_confounds_file", "scrub_vector"],
             output_names=["out_file"],
             function=_combine_confounds_files,
         ),
         name="combine_confounds",
     )
 
-    # Send the scrub targets to be contrusted into motion outlier columns
-    workflow.connect(
-        input_node, "scrub_vector", construct_motion_outliers_node, "scrub_vector"
-    )
-    # Concat the motion outliers and scrub targets
+    # Build the motion outlier columns in memory and append them to the confounds
     workflow.connect(
         input_node, "in_file", combine_confounds_node, "base_confounds_file"
     )
-    workflow.connect(
-        construct_motion_outliers_node,
-        "out_file",
-        combine_confounds_node,
-        "append_confounds_file",
-    )
+    workflow.connect(input_node, "scrub_vector", combine_confounds_node, "scrub_vector")
 
     workflow.connect(combine_confounds_node, "out_file", output_node, "out_file")
 
     return workflow
 
 
-def _construct_motion_outliers(scrub_vector: list):
-    from pathlib import Path
-    from clpipe.postprocutils.utils import construct_motion_outliers
-
-    # Create outlier columns
-    mot_outliers = construct_motion_outliers(scrub_vector)
-    # Give the outlier columns names
-    mot_outliers.columns = [
-        f"motion_outlier_{i}" for i in range(1, len(mot_outliers.columns) + 1)
-    ]
-    # Cast to int
-    mot_outliers = mot_outliers.astype(int)
-
-    # Build the output path
-    out_file = Path.cwd() / "motion_outliers.tsv"
-
-    mot_outliers.to_csv(out_file, sep="\t", index=False)
-
-    return str(out_file.absolute())
-
-
-def _combine_confounds_files(base_confounds_file, append_confounds_file):
+def _combine_confounds_files(
+    base_confounds_file, append_confounds_file=None, scrub_vector=None
+):
+    """Append columns to a confounds file, from another confounds file and/or as
+    motion outlier columns built from a scrub vector. The base file is read once,
+    and the motion outlier columns are kept sparse until export."""
     from pathlib import Path
     import pandas as pd
+    from clpipe.postprocutils.utils import construct_motion_outliers
 
     # Build the output path
     out_file = Path(base_confounds_file).stem
     out_file = Path(out_file + "_combined.tsv")
 
-    base_confounds_df = pd.read_csv(base_confounds_file, sep="\t")
-    base_confounds_df = base_confounds_df.fillna("n/a")
-    try:
-        append_confounds_df = pd.read_csv(append_confounds_file, sep="\t")
-
-        # Concat append df with base df
-        combined_confounds_df = pd.concat(
-            [base_confounds_df, append_confounds_df], axis=1
-        )
-
-        combined_confounds_df.to_csv(out_file, sep="\t", index=False)
-    except pd.errors.EmptyDataError:
-        # If the append file contains no data, just save and return the base file
-        base_confounds_df.to_csv(out_file, sep="\t", index=False)
+    combined_confounds_dfs = [pd.read_csv(base_confounds_file, sep="\t")]
+    if append_confounds_file:
+        try:
+            combined_confounds_dfs.append(pd.read_csv(append_confounds_file, sep="\t"))
+        except pd.errors.EmptyDataError:
+            # If the append file contains no data, there is nothing to add
+            pass
+    if scrub_vector is not None:
+        mot_outliers = construct_motion_outliers(scrub_vector, sparse=True)
+        # Give the outlier columns names
+        mot_outliers.columns = [
+            f"motion_outlier_{i}" for i in range(1, len(mot_outliers.columns) + 1)
+        ]
+        combined_confounds_dfs.append(mot_outliers)
+
+    # Concat append dfs with base df
+    combined_confounds_df = pd.concat(combined_confounds_dfs, axis=1)
+    combined_confounds_df.to_csv(out_file, sep="\t", index=False, na_rep="n/a")
 
     return str(out_file.absolute())
 
@@ -626,7 +726,8 @@ def _nii_to_tsv(nii_file, tsv_file=None, headers=None):
     from pathlib import Path
 
     nii_img = nib.load(nii_file)
-    img_data = nii_img.get_fdata()
+    # Read in the image's own datatype, rather than upcasting to float64
+    img_data = np.asarray(nii_img.dataobj)
 
     # remove the y and z dimension for conversion back to x, time matrix
     squeezed_img_data = np.squeeze(img_data, (1, 2))
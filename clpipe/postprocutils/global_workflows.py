@@ -3,13 +3,15 @@ import os
 from nipype.interfaces.utility import Function, IdentityInterface
 import nipype.pipeline.engine as pe
 
-from .utils import get_scrub_vector_node, logical_or_across_lists, expand_scrub_dict
+from .utils import get_multiple_scrub_vector_node
 from .image_workflows import (
     build_image_postprocessing_workflow,
+    STEP_BETA_SERIES,
     STEP_CONFOUND_REGRESSION,
     STEP_SCRUB_TIMEPOINTS,
 )
 from .confounds_workflows import build_confounds_processing_workflow
+from .qc import qc_image
 from ..utils import get_logger
 from ..config.options import PostProcessingOptions
 
@@ -25,6 +27,8 @@ def build_postprocessing_wf(
     mask_file: os.PathLike = None,
     mixing_file: os.PathLike = None,
     noise_file: os.PathLike = None,
+    events_file: os.PathLike = None,
+    qc_export_path: os.PathLike = None,
     working_dir: os.PathLike = None,
     base_dir: os.PathLike = None,
     crashdump_dir: os.PathLike = None,
@@ -36,6 +40,7 @@ def build_postprocessing_wf(
         confounds_wf (pe.Workflow, optional): A confound processing workflow. Defaults to None.
         name (str, optional): The name for the constructed workflow. Defaults to "Postprocessing_Pipeline".
         confound_regression (bool, optional): Should the processed confounds be passed to the image workflow for regression? Defaults to False.
+        qc_export_path (os.PathLike, optional): Where to save the image's QC metrics, if QC is included. Defaults to None.
 
     Returns:
         pe.Workflow: A complete postprocessing workflow.
@@ -92,12 +97,16 @@ def build_postprocessing_wf(
             mixing_file=mixing_file,
             noise_file=noise_file,
             tr=tr,
+            events_file=events_file,
             base_dir=base_dir,
             crashdump_dir=crashdump_dir,
         )
 
         # Connect postprocessed confound file to image_wf if needed
-        if STEP_CONFOUND_REGRESSION in processing_steps:
+        if confounds_wf and (
+            STEP_CONFOUND_REGRESSION in processing_steps
+            or STEP_BETA_SERIES in processing_steps
+        ):
             postproc_wf.connect(
                 confounds_wf,
                 "outputnode.out_file",
@@ -111,6 +120,22 @@ def build_postprocessing_wf(
         confounds_wf, "outputnode.out_file", output_node, "processed_confounds_file"
     )
 
+    # Compute QC metrics from the image before and after processing
+    qc_node = None
+    if image_wf and qc_export_path and processing_options.qc_options.include:
+        qc_node = build_qc_node(
+            processing_options,
+            image_file,
+            mask_file=mask_file,
+            confounds_file=confounds_file,
+            export_path=qc_export_path,
+        )
+        # A beta series isn't a timeseries, so only the input is measured
+        if STEP_BETA_SERIES not in processing_steps:
+            postproc_wf.connect(image_wf, "outputnode.out_file", qc_node, "out_file")
+        else:
+            postproc_wf.add_nodes([qc_node])
+
     # Setup scrub target if needed
     if STEP_SCRUB_TIMEPOINTS in processing_steps:
         mult_scrub_wf = build_multiple_scrubbing_workflow(
@@ -130,10 +155,57 @@ def build_postprocessing_wf(
                 confounds_wf,
                 "inputnode.scrub_vector",
             )
+        if qc_node:
+            postproc_wf.connect(
+                mult_scrub_wf, "outputnode.out_file", qc_node, "scrub_vector"
+            )
 
     return postproc_wf
 
 
+def build_qc_node(
+    processing_options: PostProcessingOptions,
+    image_file: os.PathLike,
+    mask_file: os.PathLike = None,
+    confounds_file: os.PathLike = None,
+    export_path: os.PathLike = None,
+    name: str = "qc",
+):
+    """Creates a node which saves an image's QC metrics. Connect the postprocessed
+    image to its out_file input, and the scrub vector, if any, to its scrub_vector
+    input.
+    """
+    qc_options = processing_options.qc_options
+    qc_node = pe.Node(
+        Function(
+            input_names=[
+                "in_file",
+                "out_file",
+                "mask_file",
+                "confounds_file",
+                "scrub_vector",
+                "fd_column",
+                "carpet_rows",
+                "export_path",
+            ],
+            output_names=["qc_file"],
+            function=qc_image,
+        ),
+        name=name,
+    )
+    qc_node.inputs.in_file = os.fspath(image_file)
+    qc_node.inputs.fd_column = qc_options.fd_column
+    qc_node.inputs.carpet_rows = qc_options.carpet_rows
+    if mask_file:
+        qc_node.inputs.mask_file = os.fspath(mask_file)
+    if confounds_file:
+        qc_node.inputs.confounds_file = os.fspath(confounds_file)
+    if export_path:
+        qc_node.inputs.export_path = os.fspath(export_path)
+
+    return qc_node
+
+
 def build_multiple_scrubbing_workflow(
     scrub_configs: list,
     confounds_file: os.PathLike,
@@ -162,62 +234,29 @@ def build_multiple_scrubbing_workflow(
     # Convert list of ScrubColumns to list of dicts
     scrub_configs = [scrub_config.to_dict() for scrub_config in scrub_configs]
 
-    # Feed the scrub config list of dicts into the mapper via the workflow inputnode
+    # Feed the scrub config list of dicts in via the workflow inputnode
     input_node.inputs.scrub_configs = scrub_configs
-    input_node.inputs.tsv_file = confounds_file
-
-    # Expanding Dict using Wildcard node
-    expand_node = pe.Node(
-        Function(
-            input_names=["tsv_file", "scrub_configs"],
-            output_names=["scrub_configs"],
-            function=expand_scrub_dict,
-        ),
-        name="expand_node",
-    )
 
-    # Define the function node
-    scrub_target_node = pe.MapNode(
+    # Find the scrub targets of every column in one pass over the confounds file
+    scrub_target_node = pe.Node(
         Function(
             input_names=["confounds_file", "scrub_configs"],
             output_names=["scrub_vector"],
-            function=get_scrub_vector_node,
-        ),
-        iterfield=["scrub_configs"],
-        name="get_scrub_vector_map_node",
-    )
-
-    # Create the logical_or_node
-    reduce_node = pe.Node(
-        Function(
-            input_names=["list_of_lists"],
-            output_names=["or_result"],
-            function=logical_or_across_lists,
+            function=get_multiple_scrub_vector_node,
         ),
-        name="reduce_node",
+        name="get_scrub_vector_node",
     )
 
-    # Create a new workflow to hold only the scrub_target_node
     mult_scrub_wf = pe.Workflow(name=name, base_dir=base_dir)
     if crashdump_dir is not None:
         mult_scrub_wf.config["execution"]["crashdump_dir"] = crashdump_dir
 
-    mult_scrub_wf.add_nodes(
-        [input_node, expand_node, scrub_target_node, reduce_node, output_node]
-    )
-
-    mult_scrub_wf.connect(input_node, "tsv_file", expand_node, "tsv_file")
-    mult_scrub_wf.connect(input_node, "scrub_configs", expand_node, "scrub_configs")
-    mult_scrub_wf.connect(
-        expand_node, "scrub_configs", scrub_target_node, "scrub_configs"
-    )
     mult_scrub_wf.connect(
         input_node, "confounds_file", scrub_target_node, "confounds_file"
     )
-
     mult_scrub_wf.connect(
-        scrub_target_node, "scrub_vector", reduce_node, "list_of_lists"
+        input_node, "scrub_configs", scrub_target_node, "scrub_configs"
     )
-    mult_scrub_wf.connect(reduce_node, "or_result", output_node, "out_file")
+    mult_scrub_wf.connect(scrub_target_node, "scrub_vector", output_node, "out_file")
 
     return mult_scrub_wf
@@ -34,20 +34,32 @@ from .nodes import (
     RegressAromaR,
     ImageSlice,
 )
+from .beta_series import beta_series_image
+from .bptf import bptf_image, bptf_sigmas
+from .confounds_native import NATIVE_FILTER_IMPLEMENTATIONS, get_native_step_options
+from .projection import filter_image, project_image
+from .resample import resample_image
+from .selection import select_image
+from .spec_interpolate import spec_inter_image
 from .utils import (
+    DTYPE_FLOAT32,
+    OUTPUT_DTYPES,
+    convert_image,
     scrub_image,
+    strip_image_extension,
     get_scrub_vector_node,
     vector_to_txt,
     logical_or_across_lists,
 )
 from ..errors import ImplementationNotFoundError
-from ..config.options import PostProcessingOptions
+from ..config.options import PostProcessingOptions, DEFAULT_WORKING_DIRECTORY
 
 # TODO: Set these values up as hierarchical, maybe with enums
 
 STEP_TEMPORAL_FILTERING = "TemporalFiltering"
 IMPLEMENTATION_BUTTERWORTH = "Butterworth"
 IMPLEMENTATION_FSLMATHS = "fslmaths"
+IMPLEMENTATION_FSLMATHS_NATIVE = "fslmaths_native"
 
 STEP_INTENSITY_NORMALIZATION = "IntensityNormalization"
 IMPLEMENTATION_10000_GLOBAL_MEDIAN = "10000_GlobalMedian"
@@ -63,13 +75,19 @@ IMPLEMENTATION_FSL_REGFILT_R = "fsl_regfilt_R"
 STEP_CONFOUND_REGRESSION = "ConfoundRegression"
 IMPLEMENTATION_FSL_GLM = "fsl_glm"
 IMPLEMENTATION_AFNI_3DTPROJECT = "afni_3dTproject"
+IMPLEMENTATION_PROJECTION = "Projection"
 
 STEP_APPLY_MASK = "ApplyMask"
 STEP_TRIM_TIMEPOINTS = "TrimTimepoints"
 STEP_RESAMPLE = "Resample"
+IMPLEMENTATION_FLIRT = "flirt"
+IMPLEMENTATION_NATIVE = "native"
+RESAMPLE_CACHE_DIRECTORY = "resample_cache"
 
 STEP_SCRUB_TIMEPOINTS = "ScrubTimepoints"
 
+STEP_BETA_SERIES = "BetaSeries"
+
 
 def build_image_postprocessing_workflow(
     processing_options: PostProcessingOptions,
@@ -83,6 +101,7 @@ def build_image_postprocessing_workflow(
     confounds_file: os.PathLike = None,
     tr: float = None,
     scrub_vector: list = None,
+    events_file: os.PathLike = None,
     base_dir: os.PathLike = None,
     crashdump_dir: os.PathLike = None,
 ):
@@ -93,12 +112,35 @@ def build_image_postprocessing_workflow(
 
     if processing_steps is None:
         processing_steps = processing_options.processing_steps
+
+    # Projection regresses the confounds and filters in the same step. The
+    # confounds are filtered by the TemporalFiltering implementation, so the
+    # steps are only merged when both use Projection.
+    step_options = processing_options.processing_step_options
+    filter_by_projection = (
+        STEP_CONFOUND_REGRESSION in processing_steps
+        and STEP_TEMPORAL_FILTERING in processing_steps
+        and step_options.confound_regression.implementation == IMPLEMENTATION_PROJECTION
+        and step_options.temporal_filtering.implementation == IMPLEMENTATION_PROJECTION
+    )
+    requested_steps = processing_steps
+    if filter_by_projection:
+        processing_steps = [
+            step for step in processing_steps if step != STEP_TEMPORAL_FILTERING
+        ]
     step_count = len(processing_steps)
 
     if step_count < 1:
         raise ValueError(
             "The PostProcess workflow requires at least 1 processing step."
         )
+    if STEP_BETA_SERIES in processing_steps[:-1]:
+        raise ValueError(f"{STEP_BETA_SERIES} must be the last processing step.")
+    if processing_options.dtype not in OUTPUT_DTYPES:
+        raise ValueError(
+            f"Unsupported image datatype: {processing_options.dtype}. "
+            f"Choose one of: {OUTPUT_DTYPES}"
+        )
 
     input_node = pe.Node(
         IdentityInterface(
@@ -141,10 +183,36 @@ def build_image_postprocessing_workflow(
     current_wf = None
     prev_wf = None
 
+    # Adjacent trimming, scrubbing and masking steps are fused into one selection
+    selection_runs = _get_selection_runs(processing_steps, step_options)
+    fused_until = 0
+
     # Iterate through list of processing steps, adding a new sub workflow for each step
     for index, step in enumerate(processing_steps):
+        if index < fused_until:
+            # Already applied by the fused selection
+            continue
+
         # Decide which wf to add next
-        if step == STEP_TEMPORAL_FILTERING:
+        if index in selection_runs:
+            operations = selection_runs[index]
+            fused_until = index + len(operations)
+            fused_steps = [operation["step"] for operation in operations]
+            if STEP_APPLY_MASK in fused_steps and mask_file is None:
+                raise ValueError(f"{STEP_APPLY_MASK}: No mask file provided.")
+
+            current_wf = build_selection_workflow(
+                operations=operations,
+                mask_file=mask_file,
+                base_dir=postproc_wf.base_dir,
+                crashdump_dir=crashdump_dir,
+            )
+            if STEP_SCRUB_TIMEPOINTS in fused_steps:
+                postproc_wf.connect(
+                    input_node, "scrub_vector", current_wf, "inputnode.scrub_vector"
+                )
+
+        elif step == STEP_TEMPORAL_FILTERING:
             if not tr:
                 raise ValueError(f"Missing TR corresponding to image: {in_file}")
             hp = (
@@ -160,16 +228,26 @@ def build_image_postprocessing_workflow(
                 processing_options.processing_step_options.temporal_filtering.implementation
             )
 
+            # Leave timepoints scrubbed later out of the filter's fit
+            censor = (
+                implementation_name == IMPLEMENTATION_PROJECTION
+                and STEP_SCRUB_TIMEPOINTS in processing_steps[index:]
+            )
+
             current_wf = build_temporal_filter_workflow(
                 implementation_name,
                 hp=hp,
                 lp=lp,
                 tr=tr,
                 order=order,
-                scrub_targets=None,
+                scrub_targets=censor,
                 base_dir=postproc_wf.base_dir,
                 crashdump_dir=crashdump_dir,
             )
+            if censor:
+                postproc_wf.connect(
+                    input_node, "scrub_vector", current_wf, "inputnode.scrub_targets"
+                )
 
         elif step == STEP_INTENSITY_NORMALIZATION:
             implementation_name = (
@@ -229,11 +307,40 @@ def build_image_postprocessing_workflow(
                 implementation_name
             )
 
-            current_wf = confound_regression_implementation(
-                mask_file=mask_file,
-                base_dir=postproc_wf.base_dir,
-                crashdump_dir=crashdump_dir,
-            )
+            if implementation_name == IMPLEMENTATION_PROJECTION:
+                hp, lp = -1, -1
+                if filter_by_projection:
+                    if not tr:
+                        raise ValueError(
+                            f"Missing TR corresponding to image: {in_file}"
+                        )
+                    hp = step_options.temporal_filtering.filtering_high_pass
+                    lp = step_options.temporal_filtering.filtering_low_pass
+                # Leave timepoints scrubbed later out of the fit
+                censor = STEP_SCRUB_TIMEPOINTS in processing_steps[index:]
+
+                current_wf = confound_regression_implementation(
+                    tr=tr,
+                    hp=hp,
+                    lp=lp,
+                    censor=censor,
+                    mask_file=mask_file,
+                    base_dir=postproc_wf.base_dir,
+                    crashdump_dir=crashdump_dir,
+                )
+                if censor:
+                    postproc_wf.connect(
+                        input_node,
+                        "scrub_vector",
+                        current_wf,
+                        "inputnode.scrub_vector",
+                    )
+            else:
+                current_wf = confound_regression_implementation(
+                    mask_file=mask_file,
+                    base_dir=postproc_wf.base_dir,
+                    crashdump_dir=crashdump_dir,
+                )
 
             postproc_wf.connect(
                 input_node, "confounds_file", current_wf, "inputnode.confounds_file"
@@ -272,19 +379,54 @@ def build_image_postprocessing_workflow(
                     "No reference image provided. Please set a path to reference in clpipe_config.json"
                 )
 
-            current_wf = build_resample_workflow(
-                reference_image=reference_image,
-                base_dir=postproc_wf.base_dir,
-                crashdump_dir=crashdump_dir,
-            )
+            resample_options = processing_options.processing_step_options.resample
+            if resample_options.implementation == IMPLEMENTATION_NATIVE:
+                cache_dir = resample_options.cache_directory or None
+                if (
+                    cache_dir is None
+                    and processing_options.working_directory
+                    != DEFAULT_WORKING_DIRECTORY
+                ):
+                    cache_dir = str(
+                        Path(processing_options.working_directory)
+                        / RESAMPLE_CACHE_DIRECTORY
+                    )
+
+                current_wf = build_native_resample_workflow(
+                    reference_image=reference_image,
+                    cache_dir=cache_dir,
+                    n_threads=int(processing_options.batch_options.n_threads),
+                    base_dir=postproc_wf.base_dir,
+                    crashdump_dir=crashdump_dir,
+                )
+            elif resample_options.implementation == IMPLEMENTATION_FLIRT:
+                current_wf = build_resample_workflow(
+                    reference_image=reference_image,
+                    base_dir=postproc_wf.base_dir,
+                    crashdump_dir=crashdump_dir,
+                )
+            else:
+                raise ImplementationNotFoundError(
+                    f"{STEP_RESAMPLE} implementation not found: "
+                    f"{resample_options.implementation}"
+                )
 
         elif step == STEP_SCRUB_TIMEPOINTS:
-            insert_na = (
-                processing_options.processing_step_options.scrub_timepoints.insert_na
+            scrub_timepoints = (
+                processing_options.processing_step_options.scrub_timepoints
             )
+            if scrub_timepoints.interpolate and not tr:
+                raise ValueError(f"Missing TR corresponding to image: {in_file}")
 
             current_wf = build_scrubbing_workflow(
-                insert_na=insert_na,
+                insert_na=scrub_timepoints.insert_na,
+                interpolate=scrub_timepoints.interpolate,
+                tr=tr,
+                oversampling_freq=scrub_timepoints.oversampling_freq,
+                percent_freq_sample=scrub_timepoints.percent_freq_sample,
+                bin_size=scrub_timepoints.spectral_interpolation_bin_size,
+                n_threads=int(processing_options.batch_options.n_threads),
+                mask_file=mask_file,
                 base_dir=postproc_wf.base_dir,
                 crashdump_dir=crashdump_dir,
             )
@@ -292,6 +434,55 @@ def build_image_postprocessing_workflow(
                 input_node, "scrub_vector", current_wf, "inputnode.scrub_vector"
             )
 
+        elif step == STEP_BETA_SERIES:
+            if not tr:
+                raise ValueError(f"Missing TR corresponding to image: {in_file}")
+            if events_file is None:
+                raise ValueError(f"{STEP_BETA_SERIES}: No events file provided.")
+
+            step_options = processing_options.processing_step_options
+            if STEP_SCRUB_TIMEPOINTS in processing_steps and not (
+                step_options.scrub_timepoints.insert_na
+                or step_options.scrub_timepoints.interpolate
+            ):
+                raise ValueError(
+                    f"{STEP_BETA_SERIES} requires {STEP_SCRUB_TIMEPOINTS} to keep "
+                    "scrubbed timepoints with InsertNA, to preserve trial timing."
+                )
+            trim_from_beginning, trim_from_end = 0, 0
+            if STEP_TRIM_TIMEPOINTS in processing_steps:
+                trim_from_beginning = step_options.trim_timepoints.from_beginning
+                trim_from_end = step_options.trim_timepoints.from_end
+            temporal_filter_options = _get_beta_series_filter_options(
+                processing_options, requested_steps, filter_by_projection
+            )
+
+            events_export_path = None
+            if export_path:
+                events_export_path = (
+                    f"{strip_image_extension(export_path)}_usedevents.tsv"
+                )
+
+            current_wf = build_beta_series_workflow(
+                events_file=events_file,
+                tr=tr,
+                mask_file=mask_file,
+                exclude_trial_types=step_options.beta_series.exclude_trial_types,
+                trim_from_beginning=trim_from_beginning,
+                trim_from_end=trim_from_end,
+                temporal_filter_options=temporal_filter_options,
+                events_export_path=events_export_path,
+                base_dir=postproc_wf.base_dir,
+                crashdump_dir=crashdump_dir,
+            )
+            postproc_wf.connect(
+                input_node, "confounds_file", current_wf, "inputnode.confounds_file"
+            )
+            if temporal_filter_options and temporal_filter_options["censor"]:
+                postproc_wf.connect(
+                    input_node, "scrub_vector", current_wf, "inputnode.scrub_vector"
+                )
+
         # Send input of postproc workflow to first workflow
         if index == 0:
             postproc_wf.connect(input_node, "in_file", current_wf, "inputnode.in_file")
@@ -304,15 +495,31 @@ def build_image_postprocessing_workflow(
         # Keep a reference to current_wf as "prev_wf" for the next loop
         prev_wf = current_wf
 
+    out_node, out_field = prev_wf, "outputnode.out_file"
+
+    # Steps write float32, so only the output needs converting to another datatype
+    if processing_options.dtype != DTYPE_FLOAT32:
+        convert_node = pe.Node(
+            Function(
+                input_names=["in_file", "dtype"],
+                output_names=["out_file"],
+                function=convert_image,
+            ),
+            name="convert_datatype",
+        )
+        convert_node.inputs.dtype = processing_options.dtype
+        postproc_wf.connect(out_node, out_field, convert_node, "in_file")
+        out_node, out_field = convert_node, "out_file"
+
     # Connect the output of the last node to postproc workflow's output node
-    postproc_wf.connect(prev_wf, "outputnode.out_file", output_node, "out_file")
+    postproc_wf.connect(out_node, out_field, output_node, "out_file")
     if export_path:
         # TODO: Update the postproc workflow to make extension guarentees
         export_node = pe.Node(
             ExportFile(out_file=export_path, clobber=True, check_extension=False),
             name="export_image",
         )
-        postproc_wf.connect(current_wf, "outputnode.out_file", export_node, "in_file")
+        postproc_wf.connect(out_node, out_field, export_node, "in_file")
 
     return postproc_wf
 
@@ -348,6 +555,14 @@ def build_temporal_filter_workflow(
             base_dir=base_dir,
             crashdump_dir=crashdump_dir,
         )
+    elif implementationName == IMPLEMENTATION_FSLMATHS_NATIVE:
+        return build_native_fslmath_temporal_filter(
+            hp=hp,
+            lp=lp,
+            tr=tr,
+            base_dir=base_dir,
+            crashdump_dir=crashdump_dir,
+        )
     elif implementationName == IMPLEMENTATION_AFNI_3DTPROJECT:
         return build_3dtproject_temporal_filter(
             bpHigh=lp,
@@ -359,12 +574,57 @@ def build_temporal_filter_workflow(
             scrub_targets=scrub_targets,
             mask_file=mask_file,
         )
+    elif implementationName == IMPLEMENTATION_PROJECTION:
+        return build_projection_temporal_filter_workflow(
+            hp=hp,
+            lp=lp,
+            tr=tr,
+            scrub_targets=scrub_targets,
+            mask_file=mask_file,
+            base_dir=base_dir,
+            crashdump_dir=crashdump_dir,
+        )
     else:
         raise ImplementationNotFoundError(
             f"{STEP_TEMPORAL_FILTERING} implementation not found: {implementationName}"
         )
 
 
+def _get_selection_runs(processing_steps: list, step_options) -> dict:
+    """Find the runs of two or more adjacent steps which only trim, scrub or mask,
+    as a dict from the index of each run's first step to its operations."""
+    runs = {}
+    run_start, operations = None, []
+    for index, step in enumerate(list(processing_steps) + [None]):
+        operation = None
+        if step == STEP_TRIM_TIMEPOINTS:
+            operation = {
+                "step": step,
+                "from_beginning": step_options.trim_timepoints.from_beginning,
+                "from_end": step_options.trim_timepoints.from_end,
+            }
+        elif step == STEP_SCRUB_TIMEPOINTS:
+            # Interpolation needs the data, not only a selection
+            if not step_options.scrub_timepoints.interpolate:
+                operation = {
+                    "step": step,
+                    "insert_na": step_options.scrub_timepoints.insert_na,
+                }
+        elif step == STEP_APPLY_MASK:
+            operation = {"step": step}
+
+        if operation is None:
+            if len(operations) > 1:
+                runs[run_start] = operations
+            run_start, operations = None, []
+        else:
+            if run_start is None:
+                run_start = index
+            operations.append(operation)
+
+    return runs
+
+
 def _getIntensityNormalizationImplementation(implementationName: str):
     if implementationName == IMPLEMENTATION_10000_GLOBAL_MEDIAN:
         return build_10000_global_median_workflow
@@ -399,6 +659,8 @@ def _getConfoundRegressionImplementation(implementationName: str):
         return build_confound_regression_fsl_glm_workflow
     elif implementationName == IMPLEMENTATION_AFNI_3DTPROJECT:
         return build_confound_regression_afni_3dTproject
+    elif implementationName == IMPLEMENTATION_PROJECTION:
+        return build_confound_regression_projection_workflow
     else:
         raise ImplementationNotFoundError(
             f"{STEP_CONFOUND_REGRESSION} implementation not found: {implementationName}"
@@ -702,14 +964,7 @@ def build_fslmath_temporal_filter(
     input_node = build_input_node()
     output_node = build_output_node()
 
-    fwhm_to_sigma = sqrt(8 * log(2))
-
-    hp_volumes, lp_volumes = -1, -1
-
-    if hp != -1:
-        hp_volumes = 1 / (hp * fwhm_to_sigma * tr)
-    if lp != -1:
-        lp_volumes = 1 / (lp * fwhm_to_sigma * tr)
+    hp_volumes, lp_volumes = bptf_sigmas(hp, lp, tr)
 
     mean_image_node = pe.Node(MeanImage(), name="mean_image")
     temporal_filter_node = pe.Node(
@@ -734,6 +989,54 @@ def build_fslmath_temporal_filter(
     return workflow
 
 
+def build_native_fslmath_temporal_filter(
+    hp: float,
+    lp: float,
+    tr: float,
+    order: float = None,
+    in_file: os.PathLike = None,
+    out_file: os.PathLike = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Filter as the fslmaths workflow does, in a single node without FSL."""
+    workflow = pe.Workflow(
+        name=f"{STEP_TEMPORAL_FILTERING}_{IMPLEMENTATION_FSLMATHS_NATIVE}",
+        base_dir=base_dir,
+    )
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    # Setup identity (pass through) input/output nodes
+    input_node = build_input_node()
+    output_node = build_output_node()
+
+    hp_volumes, lp_volumes = bptf_sigmas(hp, lp, tr)
+
+    temporal_filter_node = pe.Node(
+        Function(
+            input_names=["nii_file", "hp_sigma", "lp_sigma", "export_path"],
+            output_names=["out_file"],
+            function=bptf_image,
+        ),
+        name="temporal_filter",
+    )
+    temporal_filter_node.inputs.hp_sigma = hp_volumes
+    temporal_filter_node.inputs.lp_sigma = lp_volumes
+
+    # Set WF inputs and outputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if out_file:
+        input_node.inputs.out_file = out_file
+
+    workflow.connect(input_node, "in_file", temporal_filter_node, "nii_file")
+    workflow.connect(input_node, "out_file", temporal_filter_node, "export_path")
+    workflow.connect(temporal_filter_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
 def build_3dtproject_temporal_filter(
     bpHigh: float,
     bpLow: float,
@@ -822,6 +1125,71 @@ def build_3dtproject_temporal_filter(
     return workflow
 
 
+def build_projection_temporal_filter_workflow(
+    hp: float,
+    lp: float,
+    tr: float,
+    scrub_targets: bool = False,
+    in_file: os.PathLike = None,
+    out_file: os.PathLike = None,
+    mask_file: os.PathLike = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Filter by removing the stopband's sines and cosines. With scrub_targets,
+    the stopband is fit only to the timepoints not in the scrub vector."""
+    workflow = pe.Workflow(
+        name=f"{STEP_TEMPORAL_FILTERING}_{IMPLEMENTATION_PROJECTION}",
+        base_dir=base_dir,
+    )
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    input_node = pe.Node(
+        IdentityInterface(
+            fields=["in_file", "out_file", "scrub_targets"], mandatory_inputs=False
+        ),
+        name="inputnode",
+    )
+    output_node = build_output_node()
+
+    filter_node = pe.Node(
+        Function(
+            input_names=[
+                "nii_file",
+                "tr",
+                "hp",
+                "lp",
+                "scrub_vector",
+                "mask_file",
+                "export_path",
+            ],
+            output_names=["out_file"],
+            function=filter_image,
+        ),
+        name="projection_filter",
+    )
+    filter_node.inputs.tr = tr
+    filter_node.inputs.hp = hp
+    filter_node.inputs.lp = lp
+    if mask_file:
+        filter_node.inputs.mask_file = mask_file
+
+    # Set WF inputs and outputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if out_file:
+        input_node.inputs.out_file = out_file
+
+    workflow.connect(input_node, "in_file", filter_node, "nii_file")
+    workflow.connect(input_node, "out_file", filter_node, "export_path")
+    if scrub_targets:
+        workflow.connect(input_node, "scrub_targets", filter_node, "scrub_vector")
+    workflow.connect(filter_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
 def build_confound_regression_fsl_glm_workflow(
     in_file: os.PathLike = None,
     out_file: os.PathLike = None,
@@ -930,6 +1298,81 @@ def build_confound_regression_afni_3dTproject(
     return workflow
 
 
+def build_confound_regression_projection_workflow(
+    tr: float = None,
+    hp: float = -1,
+    lp: float = -1,
+    censor: bool = False,
+    in_file: os.PathLike = None,
+    out_file: os.PathLike = None,
+    confounds_file: os.PathLike = None,
+    mask_file: os.PathLike = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Regress confounds, and optionally filter, with a single projection.
+
+    The stopband given by hp and lp is regressed out with the confounds and
+    polynomial trends, as in 3dTproject. With censor, the timepoints of the
+    scrub vector are left out of the fit.
+    """
+    workflow = pe.Workflow(
+        name=f"{STEP_CONFOUND_REGRESSION}_{IMPLEMENTATION_PROJECTION}",
+        base_dir=base_dir,
+    )
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    input_node = pe.Node(
+        IdentityInterface(
+            fields=["in_file", "out_file", "confounds_file", "scrub_vector"],
+            mandatory_inputs=False,
+        ),
+        name="inputnode",
+    )
+    output_node = build_output_node()
+
+    projection_node = pe.Node(
+        Function(
+            input_names=[
+                "nii_file",
+                "tr",
+                "confounds_file",
+                "scrub_vector",
+                "hp",
+                "lp",
+                "mask_file",
+                "export_path",
+            ],
+            output_names=["out_file"],
+            function=project_image,
+        ),
+        name="projection",
+    )
+    projection_node.inputs.tr = tr
+    projection_node.inputs.hp = hp
+    projection_node.inputs.lp = lp
+    if mask_file:
+        projection_node.inputs.mask_file = mask_file
+
+    # Set WF inputs and outputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if out_file:
+        input_node.inputs.out_file = out_file
+    if confounds_file:
+        input_node.inputs.confounds_file = confounds_file
+
+    workflow.connect(input_node, "in_file", projection_node, "nii_file")
+    workflow.connect(input_node, "out_file", projection_node, "export_path")
+    workflow.connect(input_node, "confounds_file", projection_node, "confounds_file")
+    if censor:
+        workflow.connect(input_node, "scrub_vector", projection_node, "scrub_vector")
+    workflow.connect(projection_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
 def build_aroma_workflow_fsl_regfilt(
     in_file: os.PathLike = None,
     out_file: os.PathLike = None,
@@ -1116,16 +1559,86 @@ def build_trim_timepoints_workflow(
     return workflow
 
 
+def build_selection_workflow(
+    operations: list,
+    scrub_vector: list = None,
+    mask_file: os.PathLike = None,
+    in_file: os.PathLike = None,
+    out_file: os.PathLike = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Workflow applying a run of trimming, scrubbing and masking operations in a
+    single pass over the image."""
+    workflow = pe.Workflow(
+        name="_".join(operation["step"] for operation in operations),
+        base_dir=base_dir,
+    )
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    # Setup identity (pass through) input/output nodes
+    input_node = pe.Node(
+        IdentityInterface(
+            fields=["in_file", "out_file", "scrub_vector"], mandatory_inputs=False
+        ),
+        name="inputnode",
+    )
+    output_node = build_output_node()
+
+    select_node = pe.Node(
+        Function(
+            input_names=[
+                "nii_file",
+                "operations",
+                "scrub_vector",
+                "mask_file",
+                "export_path",
+            ],
+            output_names=["out_file"],
+            function=select_image,
+        ),
+        name="select_image",
+    )
+    select_node.inputs.operations = operations
+    if mask_file:
+        select_node.inputs.mask_file = mask_file
+
+    # Set WF inputs and outputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if out_file:
+        input_node.inputs.out_file = out_file
+    if scrub_vector:
+        input_node.inputs.scrub_vector = scrub_vector
+
+    workflow.connect(input_node, "in_file", select_node, "nii_file")
+    workflow.connect(input_node, "scrub_vector", select_node, "scrub_vector")
+    workflow.connect(input_node, "out_file", select_node, "export_path")
+    workflow.connect(select_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
 def build_scrubbing_workflow(
     scrub_vector: list = None,
     insert_na=True,
+    interpolate: bool = False,
+    tr: float = None,
+    oversampling_freq: int = 8,
+    percent_freq_sample: float = 1.0,
+    bin_size: int = 5000,
+    n_threads: int = 1,
+    mask_file: os.PathLike = None,
     import_path: os.PathLike = None,
     export_path: os.PathLike = None,
     base_dir: os.PathLike = None,
     crashdump_dir: os.PathLike = None,
 ):
     workflow = pe.Workflow(name=STEP_SCRUB_TIMEPOINTS, base_dir=base_dir)
-    """ Workflow for scrubbing a target file based on given scrub targets."""
+    """ Workflow for scrubbing a target file based on given scrub targets.
+    With interpolate, the scrub targets are instead replaced with values
+    spectrally interpolated from the remaining timepoints."""
 
     if crashdump_dir is not None:
         workflow.config["execution"]["crashdump_dir"] = crashdump_dir
@@ -1140,14 +1653,41 @@ def build_scrubbing_workflow(
     )
     output_node = build_output_node()
 
-    scrub_node = pe.Node(
-        Function(
-            input_names=["nii_file", "scrub_vector", "insert_na", "export_path"],
-            output_names=["out_file"],
-            function=scrub_image,
-        ),
-        name="scrub_timepoints",
-    )
+    if interpolate:
+        scrub_node = pe.Node(
+            Function(
+                input_names=[
+                    "nii_file",
+                    "scrub_vector",
+                    "tr",
+                    "oversampling_freq",
+                    "percent_freq_sample",
+                    "bin_size",
+                    "n_threads",
+                    "mask_file",
+                    "export_path",
+                ],
+                output_names=["out_file"],
+                function=spec_inter_image,
+            ),
+            name="interpolate_timepoints",
+        )
+        scrub_node.inputs.tr = tr
+        scrub_node.inputs.oversampling_freq = oversampling_freq
+        scrub_node.inputs.percent_freq_sample = percent_freq_sample
+        scrub_node.inputs.bin_size = bin_size
+        scrub_node.inputs.n_threads = n_threads
+        if mask_file:
+            scrub_node.inputs.mask_file = mask_file
+    else:
+        scrub_node = pe.Node(
+            Function(
+                input_names=["nii_file", "scrub_vector", "insert_na", "export_path"],
+                output_names=["out_file"],
+                function=scrub_image,
+            ),
+            name="scrub_timepoints",
+        )
 
     # Set WF inputs and outputs
     if import_path:
@@ -1160,7 +1700,8 @@ def build_scrubbing_workflow(
 
     workflow.connect(input_node, "in_file", scrub_node, "nii_file")
     workflow.connect(input_node, "scrub_vector", scrub_node, "scrub_vector")
-    workflow.connect(input_node, "insert_na", scrub_node, "insert_na")
+    if not interpolate:
+        workflow.connect(input_node, "insert_na", scrub_node, "insert_na")
     workflow.connect(input_node, "out_file", scrub_node, "export_path")
     workflow.connect(scrub_node, "out_file", output_node, "out_file")
 
@@ -1200,6 +1741,187 @@ def build_resample_workflow(
     return workflow
 
 
+def build_native_resample_workflow(
+    reference_image: os.PathLike = None,
+    cache_dir: os.PathLike = None,
+    n_threads: int = 1,
+    in_file: os.PathLike = None,
+    out_file: os.PathLike = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Resample to the reference image's grid without FSL, caching the mapping
+    between the image grids in cache_dir."""
+    workflow = pe.Workflow(
+        name=f"{STEP_RESAMPLE}_{IMPLEMENTATION_NATIVE}", base_dir=base_dir
+    )
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    # Setup identity (pass through) input/output nodes
+    input_node = build_input_node()
+    output_node = build_output_node()
+
+    resample_node = pe.Node(
+        Function(
+            input_names=[
+                "nii_file",
+                "reference_image",
+                "cache_dir",
+                "n_threads",
+                "export_path",
+            ],
+            output_names=["out_file"],
+            function=resample_image,
+        ),
+        name="resample",
+    )
+    resample_node.inputs.reference_image = reference_image
+    resample_node.inputs.n_threads = n_threads
+    if cache_dir:
+        resample_node.inputs.cache_dir = str(cache_dir)
+
+    # Set WF inputs and outputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if out_file:
+        input_node.inputs.out_file = out_file
+
+    workflow.connect(input_node, "in_file", resample_node, "nii_file")
+    workflow.connect(input_node, "out_file", resample_node, "export_path")
+    workflow.connect(resample_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
+def _get_beta_series_filter_options(
+    processing_options: PostProcessingOptions,
+    processing_steps: list,
+    filter_by_projection: bool = False,
+):
+    """Gather the TemporalFiltering settings which the BetaSeries step must give its
+    trial regressors to match the filtered image, or None if it is not filtered."""
+    if STEP_TEMPORAL_FILTERING not in processing_steps:
+        return None
+
+    implementation = (
+        processing_options.processing_step_options.temporal_filtering.implementation
+    )
+    if implementation not in NATIVE_FILTER_IMPLEMENTATIONS:
+        raise ValueError(
+            f"{STEP_BETA_SERIES} cannot filter its trial regressors to match the "
+            f"{implementation} {STEP_TEMPORAL_FILTERING} implementation. Choose one "
+            f"of: {sorted(NATIVE_FILTER_IMPLEMENTATIONS)}"
+        )
+
+    # A filter merged into Projection confound regression is applied at that step
+    filter_index = processing_steps.index(STEP_TEMPORAL_FILTERING)
+    if filter_by_projection:
+        filter_index = processing_steps.index(STEP_CONFOUND_REGRESSION)
+
+    options = get_native_step_options(
+        processing_options, [STEP_TEMPORAL_FILTERING]
+    )[STEP_TEMPORAL_FILTERING]
+    options["before_trim"] = (
+        STEP_TRIM_TIMEPOINTS not in processing_steps
+        or processing_steps.index(STEP_TRIM_TIMEPOINTS) > filter_index
+    )
+    options["censor"] = (
+        implementation == IMPLEMENTATION_PROJECTION
+        and STEP_SCRUB_TIMEPOINTS in processing_steps[filter_index:]
+    )
+    return options
+
+
+def build_beta_series_workflow(
+    events_file: os.PathLike = None,
+    tr: float = None,
+    in_file: os.PathLike = None,
+    confounds_file: os.PathLike = None,
+    mask_file: os.PathLike = None,
+    exclude_trial_types: list = None,
+    trim_from_beginning: int = 0,
+    events_export_path: os.PathLike = None,
+    trim_from_end: int = 0,
+    temporal_filter_options: dict = None,
+    base_dir: os.PathLike = None,
+    crashdump_dir: os.PathLike = None,
+):
+    """Workflow for estimating an image's beta series from its events file.
+
+    If the image was temporally filtered, temporal_filter_options gives the
+    filter's settings, which are applied to the trial regressors too."""
+    workflow = pe.Workflow(name=STEP_BETA_SERIES, base_dir=base_dir)
+    if crashdump_dir is not None:
+        workflow.config["execution"]["crashdump_dir"] = crashdump_dir
+
+    input_node = pe.Node(
+        IdentityInterface(
+            fields=[
+                "in_file",
+                "confounds_file",
+                "events_file",
+                "mask_file",
+                "tr",
+                "scrub_vector",
+            ],
+            mandatory_inputs=False,
+        ),
+        name="inputnode",
+    )
+    output_node = build_output_node()
+
+    beta_series_node = pe.Node(
+        Function(
+            input_names=[
+                "nii_file",
+                "events_file",
+                "tr",
+                "confounds_file",
+                "mask_file",
+                "exclude_trial_types",
+                "trim_from_beginning",
+                "events_export_path",
+                "trim_from_end",
+                "temporal_filter_options",
+                "scrub_vector",
+            ],
+            output_names=["out_file"],
+            function=beta_series_image,
+        ),
+        name="beta_series",
+    )
+    beta_series_node.inputs.exclude_trial_types = exclude_trial_types or []
+    beta_series_node.inputs.trim_from_beginning = trim_from_beginning
+    beta_series_node.inputs.trim_from_end = trim_from_end
+    if temporal_filter_options:
+        beta_series_node.inputs.temporal_filter_options = temporal_filter_options
+    if events_export_path:
+        beta_series_node.inputs.events_export_path = events_export_path
+
+    # Set WF inputs
+    if in_file:
+        input_node.inputs.in_file = in_file
+    if confounds_file:
+        input_node.inputs.confounds_file = confounds_file
+    if events_file:
+        input_node.inputs.events_file = events_file
+    if mask_file:
+        input_node.inputs.mask_file = mask_file
+    if tr:
+        input_node.inputs.tr = tr
+
+    workflow.connect(input_node, "in_file", beta_series_node, "nii_file")
+    workflow.connect(input_node, "events_file", beta_series_node, "events_file")
+    workflow.connect(input_node, "tr", beta_series_node, "tr")
+    workflow.connect(input_node, "confounds_file", beta_series_node, "confounds_file")
+    workflow.connect(input_node, "mask_file", beta_series_node, "mask_file")
+    workflow.connect(input_node, "scrub_vector", beta_series_node, "scrub_vector")
+    workflow.connect(beta_series_node, "out_file", output_node, "out_file")
+
+    return workflow
+
+
 def _csv_to_list(csv_file):
     # Imports must be in function for running as node
     import numpy as np
@@ -16,7 +16,12 @@ import nipype.pipeline.engine as pe
 from nipype.interfaces.utility import IdentityInterface
 from nipype.interfaces.base.traits_extension import isdefined
 
-from clpipe.postprocutils.utils import apply_filter, calc_filter
+from clpipe.postprocutils.utils import (
+    OUTPUT_DTYPES,
+    apply_filter,
+    calc_filter,
+    save_image,
+)
 
 
 def build_input_node():
@@ -42,6 +47,11 @@ class ButterworthFilterInputSpec(BaseInterfaceInputSpec):
     )
     tr = traits.Float(desc="Repetition time.", mandatory=True)
     order = traits.Float(desc="Order of the filter", mandatory=True)
+    dtype = traits.Enum(
+        *OUTPUT_DTYPES,
+        desc="Datatype of the filtered image, float32 or scaled int16.",
+        usedefault=True,
+    )
     out_file = File(mandatory=False)
 
 
@@ -56,14 +66,16 @@ class ButterworthFilter(BaseInterface):
     def _run_interface(self, runtime):
         fname = self.inputs.in_file
         img = nb.load(fname)
-        data = np.array(img.get_data())
+        data = img.get_fdata(dtype=np.float32)
 
         filter = calc_filter(
             self.inputs.hp, self.inputs.lp, self.inputs.tr, self.inputs.order
         )
-        filtered_data = apply_filter(filter, data)
-
-        new_img = nb.Nifti1Image(filtered_data, img.affine, img.header)
+        # Filter along time, the last axis of the image. The filter itself runs
+        #   in float64, as recursive filters need the precision
+        filtered_data = np.moveaxis(
+            apply_filter(filter, np.moveaxis(data, -1, 0)), 0, -1
+        )
 
         if not isdefined(self.inputs.out_file):
             _, base, _ = split_filename(fname)
@@ -71,7 +83,9 @@ class ButterworthFilter(BaseInterface):
         else:
             self.new_file = self.inputs.out_file
 
-        nb.save(new_img, self.new_file)
+        save_image(
+            filtered_data, img.affine, img.header, self.new_file, self.inputs.dtype
+        )
 
         return runtime
 
@@ -146,6 +160,11 @@ class ImageSliceInputSpec(BaseInterfaceInputSpec):
         mandatory=False,
         default_value=0,
     )
+    dtype = traits.Enum(
+        *OUTPUT_DTYPES,
+        desc="Datatype of the sliced image, float32 or scaled int16.",
+        usedefault=True,
+    )
     out_file = File(mandatory=False)
 
 
@@ -187,7 +206,14 @@ class ImageSlice(BaseInterface):
         else:
             self.new_file = self.inputs.out_file
 
-        nb.save(cropped_img, self.new_file)
+        # Only the kept volumes are read
+        save_image(
+            cropped_img.get_fdata(dtype=np.float32),
+            cropped_img.affine,
+            cropped_img.header,
+            self.new_file,
+            self.inputs.dtype,
+        )
 
         return runtime
 
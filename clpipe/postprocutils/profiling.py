@@ -0,0 +1,199 @@
+"""
+Per-node resource profiling for postprocessing workflows.
+
+A NodeProfiler is passed to a workflow's run as nipype's status callback, which
+the plugin calls as each node starts and ends. Wall time, CPU time and bytes read
+and written are taken as the difference between a node's start and end. CPU time
+includes child processes, such as FSL commands, once they finish. Peak memory is
+sampled by a background thread, as the resident memory of this process and its
+live children, so very short spikes between samples may be missed. Children's
+reads and writes are counted as of their last sample.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import psutil
+
+PROFILE_SUFFIX = "_profile.json"
+SAMPLE_INTERVAL = 0.1
+BYTES_PER_MB = 1024**2
+
+PROFILE_COLUMNS = [
+    "wall_time",
+    "cpu_time",
+    "peak_rss_mb",
+    "read_mb",
+    "written_mb",
+]
+
+
+class NodeProfiler:
+    """Records the resource use of each node of a workflow run.
+
+    Pass an instance as the status_callback plugin argument of Workflow.run.
+    """
+
+    def __init__(self, sample_interval: float = SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.records = []
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        self._peak_rss = 0
+        self._child_io = {}
+        self._start = None
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+
+    def __call__(self, node, status: str):
+        if status == "start":
+            self._start_node()
+        elif status in ("end", "exception"):
+            self._end_node(node, status)
+
+    def _start_node(self):
+        with self._lock:
+            self._peak_rss = 0
+            self._child_io = {}
+        self._sample()
+        self._start = {
+            "wall": time.perf_counter(),
+            "cpu": self._cpu_time(),
+            "io": self._own_io(),
+        }
+
+        self._stop_sampling.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+
+    def _end_node(self, node, status: str):
+        if self._start is None:
+            return
+        self._stop_sampling.set()
+        self._sampler.join()
+        self._sample()
+
+        wall_time = time.perf_counter() - self._start["wall"]
+        cpu_time = self._cpu_time() - self._start["cpu"]
+        read_bytes, written_bytes = None, None
+        own_io = self._own_io()
+        if own_io is not None and self._start["io"] is not None:
+            with self._lock:
+                child_read = sum(io[0] for io in self._child_io.values())
+                child_written = sum(io[1] for io in self._child_io.values())
+            read_bytes = own_io[0] - self._start["io"][0] + child_read
+            written_bytes = own_io[1] - self._start["io"][1] + child_written
+
+        self.records.append(
+            {
+                "node": node.fullname,
+                "status": status,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "peak_rss_mb": self._peak_rss / BYTES_PER_MB,
+                "read_mb": _to_mb(read_bytes),
+                "written_mb": _to_mb(written_bytes),
+            }
+        )
+        self._start = None
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            self._sample()
+
+    def _sample(self):
+        """Record the memory of this process and its children, and the reads and
+        writes of the children."""
+        try:
+            rss = self._process.memory_info().rss
+            children = self._process.children(recursive=True)
+        except psutil.Error:
+            return
+
+        child_io = {}
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+                io = child.io_counters()
+                child_io[child.pid] = (io.read_bytes, io.write_bytes)
+            except (psutil.Error, AttributeError):
+                continue
+
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, rss)
+            self._child_io.update(child_io)
+
+    def _cpu_time(self) -> float:
+        times = self._process.cpu_times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def _own_io(self):
+        # Not available on every platform
+        try:
+            io = self._process.io_counters()
+        except (psutil.Error, AttributeError):
+            return None
+        return io.read_bytes, io.write_bytes
+
+
+def _to_mb(n_bytes):
+    if n_bytes is None:
+        return None
+    return n_bytes / BYTES_PER_MB
+
+
+def write_profile(
+    profiler: NodeProfiler, profile_file: os.PathLike, image: str = None
+) -> Path:
+    """Save a profiler's records as JSON."""
+    profile_file = Path(profile_file)
+    with open(profile_file, "w") as file_to_write:
+        json.dump({"image": image, "nodes": profiler.records}, file_to_write, indent=4)
+
+    return profile_file
+
+
+def load_profiles(log_directory: os.PathLike) -> pd.DataFrame:
+    """Load every profile saved under a log directory into one table, with a row
+    per node of each image."""
+    rows = []
+    for profile_file in sorted(Path(log_directory).rglob(f"*{PROFILE_SUFFIX}")):
+        with open(profile_file) as file_to_read:
+            profile = json.load(file_to_read)
+        for record in profile["nodes"]:
+            rows.append({"image": profile["image"], **record})
+
+    return pd.DataFrame(rows, columns=["image", "node", "status"] + PROFILE_COLUMNS)
+
+
+def summarize_profiles(profiles: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate profiles into a per-step cost table, sorted by total wall time.
+
+    Nodes are matched across images by their name within the image's workflow.
+    """
+    # The top-level workflow is named after each image
+    steps = profiles["node"].str.split(".", n=1).str[-1]
+    grouped = profiles.groupby(steps.rename("step"), sort=False)
+
+    summary = pd.DataFrame(
+        {
+            "runs": grouped.size(),
+            "failures": grouped["status"].apply(lambda s: (s == "exception").sum()),
+            "total_wall_time": grouped["wall_time"].sum(),
+            "mean_wall_time": grouped["wall_time"].mean(),
+            "max_wall_time": grouped["wall_time"].max(),
+            "total_cpu_time": grouped["cpu_time"].sum(),
+            "max_peak_rss_mb": grouped["peak_rss_mb"].max(),
+            "mean_read_mb": grouped["read_mb"].mean(),
+            "mean_written_mb": grouped["written_mb"].mean(),
+        }
+    )
+    summary["wall_time_share"] = (
+        summary["total_wall_time"] / summary["total_wall_time"].sum()
+    )
+
+    return summary.sort_values("total_wall_time", ascending=False)
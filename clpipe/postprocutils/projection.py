@@ -0,0 +1,254 @@
+"""
+Combined nuisance regression and temporal filtering by projection.
+
+Filtering an image and then regressing its confounds, as two separate steps, lets
+each step reintroduce signal the other removed. Here, as in AFNI's 3dTproject,
+the filter is expressed as regressors instead: sines and cosines at every
+frequency outside the passband, alongside polynomial trends, the confounds and a
+spike for each censored timepoint. All of them are projected out of the data
+together, with a single (time x time) residual-forming matrix, which is applied
+to blocks of voxels.
+
+The same frequency basis gives a temporal filter which tolerates censoring: the
+stopband is fit only to the timepoints that are kept, and removed from all of
+them.
+"""
+
+import os
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from .beta_series import nuisance_basis
+from .utils import strip_image_extension
+
+POLORT = 2
+BLOCK_SIZE = 10000
+
+
+def polynomial_trends(n_timepoints: int, polort: int = POLORT) -> np.ndarray:
+    """Legendre polynomials of degree 0 to polort over the run, as a
+    (time x polort + 1) array."""
+    times = np.linspace(-1.0, 1.0, n_timepoints)
+    return np.polynomial.legendre.legvander(times, polort)
+
+
+def stopband_regressors(
+    n_timepoints: int, tr: float, hp: float = -1, lp: float = -1
+) -> np.ndarray:
+    """Sine and cosine regressors at each of the run's Fourier frequencies which
+    lies outside the passband, as a (time x regressors) array.
+
+    Frequencies below hp, or above lp, are in the stopband. Either cutoff is
+    disabled when it is not positive.
+    """
+    freqs = np.arange(1, n_timepoints // 2 + 1) / (n_timepoints * tr)
+    stop = np.zeros(freqs.shape, dtype=bool)
+    if hp > 0:
+        stop |= freqs < hp
+    if lp > 0:
+        stop |= freqs > lp
+
+    angles = 2 * np.pi * np.outer(np.arange(n_timepoints) * tr, freqs[stop])
+    regressors = np.concatenate([np.cos(angles), np.sin(angles)], axis=1)
+
+    # The sine at the Nyquist frequency is zero at every timepoint
+    return regressors[:, np.any(np.abs(regressors) > 1e-8, axis=0)]
+
+
+def projection_matrix(
+    n_timepoints: int,
+    tr: float = None,
+    hp: float = -1,
+    lp: float = -1,
+    confounds: np.ndarray = None,
+    censor: np.ndarray = None,
+    polort: int = POLORT,
+) -> np.ndarray:
+    """Build the (time x time) matrix which projects polynomial trends, the
+    stopband, the confounds and the censored timepoints out of a timeseries.
+
+    Args:
+        n_timepoints: The length of the run.
+        tr: The repetition time, needed when filtering.
+        hp: The high-pass cutoff in Hz, disabled when not positive.
+        lp: The low-pass cutoff in Hz, disabled when not positive.
+        confounds: An optional (time x confounds) array of nuisance regressors.
+        censor: An optional vector, with 1 marking timepoints left out of the fit.
+        polort: The highest degree of polynomial trend to remove.
+
+    Returns:
+        The residual-forming matrix, such that residuals = matrix @ data.
+    """
+    regressors = [polynomial_trends(n_timepoints, polort)]
+    if hp > 0 or lp > 0:
+        if not tr:
+            raise ValueError("A TR is needed to filter by projection.")
+        regressors.append(stopband_regressors(n_timepoints, tr, hp, lp))
+    if confounds is not None and np.size(confounds) > 0:
+        regressors.append(np.asarray(confounds, dtype=np.float64))
+    if censor is not None:
+        # A spike per censored timepoint leaves it out of every other fit
+        censored = np.flatnonzero(censor)
+        spikes = np.zeros((n_timepoints, censored.size))
+        spikes[censored, np.arange(censored.size)] = 1
+        regressors.append(spikes)
+
+    basis = nuisance_basis(np.column_stack(regressors))
+    return np.eye(n_timepoints) - basis @ basis.T
+
+
+def filter_matrix(
+    n_timepoints: int,
+    tr: float,
+    hp: float = -1,
+    lp: float = -1,
+    censor: np.ndarray = None,
+) -> np.ndarray:
+    """Build the (time x time) matrix which removes the stopband from a timeseries,
+    fit only to the timepoints which aren't censored.
+
+    The stopband's sines and cosines are fit, alongside the mean, by least squares
+    over the kept timepoints, and their fit is removed from every timepoint. The
+    values of censored timepoints therefore don't affect the filtered timeseries.
+    Without censoring, this is an ideal filter at the run's Fourier frequencies.
+    """
+    stopband = stopband_regressors(n_timepoints, tr, hp, lp)
+    design = np.column_stack([np.ones(n_timepoints), stopband])
+    kept = np.ones(n_timepoints, dtype=bool)
+    if censor is not None:
+        kept = ~np.asarray(censor, dtype=bool)
+
+    fit = np.zeros((design.shape[1], n_timepoints))
+    fit[:, kept] = np.linalg.pinv(design[kept])
+    return np.eye(n_timepoints) - stopband @ fit[1:]
+
+
+def transform_image(
+    nii_file: os.PathLike,
+    build_matrix,
+    censor: np.ndarray = None,
+    keep_mean: bool = False,
+    mask_file: os.PathLike = None,
+    export_path: os.PathLike = None,
+    suffix: str = "transformed",
+) -> str:
+    """Apply a (time x time) matrix to every voxel timeseries of an image, in
+    blocks of voxels.
+
+    Timepoints scrubbed to NaN are added to the censored timepoints, which are
+    passed to build_matrix to get the matrix, and stay NaN. With keep_mean, each
+    voxel's mean over the kept timepoints is added back. Returns the path of the
+    transformed image.
+    """
+    image = nib.load(str(nii_file))
+    data = np.asarray(image.dataobj, dtype=np.float32)
+    n_timepoints = data.shape[3]
+
+    if mask_file:
+        mask = np.asarray(nib.load(str(mask_file)).dataobj) > 0
+    else:
+        mask = np.any(data != 0, axis=3)
+    timeseries = data[mask].T
+
+    scrubbed = ~np.isfinite(timeseries).all(axis=1)
+    if censor is None:
+        censor = np.zeros(n_timepoints, dtype=bool)
+    censor = np.asarray(censor, dtype=bool) | scrubbed
+    matrix = build_matrix(censor).astype(np.float32)
+
+    for start in range(0, timeseries.shape[1], BLOCK_SIZE):
+        block = np.nan_to_num(timeseries[:, start : start + BLOCK_SIZE])
+        transformed = matrix @ block
+        if keep_mean:
+            transformed += block[~censor].mean(axis=0)
+        timeseries[:, start : start + BLOCK_SIZE] = transformed
+    timeseries[scrubbed] = np.nan
+    data[mask] = timeseries.T
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(nii_file).name)
+        export_path = f"{base_name}_{suffix}.nii.gz"
+    export_path = os.path.abspath(export_path)
+
+    header = image.header.copy()
+    header.set_data_dtype(np.float32)
+    nib.save(nib.Nifti1Image(data, image.affine, header), export_path)
+
+    return export_path
+
+
+def project_image(
+    nii_file,
+    tr=None,
+    confounds_file=None,
+    scrub_vector=None,
+    hp=-1,
+    lp=-1,
+    polort=2,
+    mask_file=None,
+    export_path=None,
+):
+    """Regress the confounds and the stopband out of an image in one projection,
+    keeping each voxel's mean. Timepoints in the scrub vector, and timepoints
+    scrubbed to NaN in the image or confounds, are left out of the fit. Returns
+    the path of the projected image."""
+    # Imports must be in function for running as node
+    import numpy as np
+    import pandas as pd
+
+    from clpipe.postprocutils.projection import projection_matrix, transform_image
+
+    confounds = None
+    censor = None
+    if scrub_vector is not None:
+        censor = np.asarray(scrub_vector, dtype=bool)
+    if confounds_file:
+        confounds_df = pd.read_csv(confounds_file, sep="\t", na_values="n/a")
+        if len(confounds_df.columns) > 0:
+            confounds = confounds_df.to_numpy(dtype=np.float64)
+            scrubbed = ~np.isfinite(confounds).all(axis=1)
+            censor = scrubbed if censor is None else censor | scrubbed
+            confounds = np.nan_to_num(confounds)
+
+    def build_matrix(censor):
+        return projection_matrix(len(censor), tr, hp, lp, confounds, censor, polort)
+
+    return transform_image(
+        nii_file,
+        build_matrix,
+        censor=censor,
+        keep_mean=True,
+        mask_file=mask_file,
+        export_path=export_path,
+        suffix="projected",
+    )
+
+
+def filter_image(
+    nii_file,
+    tr,
+    hp=-1,
+    lp=-1,
+    scrub_vector=None,
+    mask_file=None,
+    export_path=None,
+):
+    """Temporally filter an image by removing its stopband, fit only to the
+    timepoints not in the scrub vector or scrubbed to NaN. Returns the path of
+    the filtered image."""
+    # Imports must be in function for running as node
+    from clpipe.postprocutils.projection import filter_matrix, transform_image
+
+    def build_matrix(censor):
+        return filter_matrix(len(censor), tr, hp, lp, censor)
+
+    return transform_image(
+        nii_file,
+        build_matrix,
+        censor=scrub_vector,
+        mask_file=mask_file,
+        export_path=export_path,
+        suffix="filtered",
+    )
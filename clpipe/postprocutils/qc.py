@@ -0,0 +1,275 @@
+"""
+Quality control metrics computed alongside postprocessing.
+
+Each image's QC node streams its input and postprocessed images through
+TimeseriesAccumulator in blocks of volumes, so each image is read once and only
+a block is held in memory. In that pass, it collects the voxelwise mean and
+variance for tSNR maps, DVARS, the global signal, and a carpet of a subset of
+voxels. Scrubbed (NaN) timepoints are left out of every metric. The image's mean
+framewise displacement and the percent of volumes scrubbed come from its
+confounds file and scrub vector.
+
+Scalar metrics are saved as JSON, and maps and timeseries as NPZ, so that the
+images of a processing stream can be aggregated into one cohort table without
+reloading them.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+QC_SUFFIX = "_qc.json"
+QC_ARRAYS_SUFFIX = "_qc.npz"
+BLOCK_VOLUMES = 32
+CARPET_ROWS = 1000
+FD_COLUMN = "framewise_displacement"
+BIDS_ENTITIES = ["sub", "ses", "task", "acq", "run", "space"]
+
+
+class TimeseriesAccumulator:
+    """Accumulates QC metrics over the masked voxels of an image, a block of
+    volumes at a time.
+
+    Voxel means and variances are merged across blocks with Chan's parallel
+    update, so they match a single pass over the whole timeseries.
+    """
+
+    def __init__(self, mask: np.ndarray, carpet_rows: int = CARPET_ROWS):
+        self.mask = np.asarray(mask, dtype=bool)
+        n_voxels = int(self.mask.sum())
+        self._count = np.zeros(n_voxels)
+        self._mean = np.zeros(n_voxels)
+        self._m2 = np.zeros(n_voxels)
+        self._previous = None
+        self._dvars = []
+        self._global_signal = []
+        self._carpet = []
+        # Evenly spaced voxels, ordered as in the image
+        self._carpet_rows = np.unique(
+            np.linspace(0, n_voxels - 1, min(carpet_rows, n_voxels)).astype(int)
+        )
+
+    def update(self, block: np.ndarray):
+        """Add a block of volumes, as a (x, y, z, volumes) array."""
+        voxels = np.asarray(block[self.mask], dtype=np.float64)
+        finite = np.isfinite(voxels)
+        count = finite.sum(axis=1)
+        filled = np.where(finite, voxels, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = filled.sum(axis=1) / count
+            m2 = (np.where(finite, voxels - mean[:, np.newaxis], 0) ** 2).sum(axis=1)
+        mean[count == 0], m2[count == 0] = 0, 0
+
+        total = self._count + count
+        delta = mean - self._mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self._mean += np.where(total > 0, delta * count / total, 0)
+            self._m2 += m2 + np.where(
+                total > 0, delta**2 * self._count * count / total, 0
+            )
+        self._count = total
+
+        # Volumes which are entirely NaN have been scrubbed, and are left NaN
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self._global_signal.append(filled.sum(axis=0) / finite.sum(axis=0))
+
+        if self._previous is not None:
+            voxels_with_previous = np.column_stack([self._previous, voxels])
+        else:
+            voxels_with_previous = voxels
+        if voxels_with_previous.shape[1] > 1:
+            differences = np.diff(voxels_with_previous, axis=1)
+            self._dvars.append(np.sqrt(np.mean(differences**2, axis=0)))
+        self._previous = voxels[:, -1:]
+
+        self._carpet.append(voxels[self._carpet_rows].astype(np.float32))
+
+    def tsnr(self) -> np.ndarray:
+        """The voxelwise temporal mean over standard deviation, as a 3D map which
+        is 0 outside the mask and where the signal doesn't vary."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self._m2 / self._count)
+            tsnr = np.where(std > 0, self._mean / std, 0)
+        tsnr_map = np.zeros(self.mask.shape, dtype=np.float32)
+        tsnr_map[self.mask] = np.nan_to_num(tsnr)
+        return tsnr_map
+
+    def dvars(self) -> np.ndarray:
+        """The RMS change over voxels between each pair of successive volumes. NaN
+        where either volume is scrubbed."""
+        if not self._dvars:
+            return np.zeros(0)
+        return np.concatenate(self._dvars)
+
+    def global_signal(self) -> np.ndarray:
+        """The mean over voxels of each volume."""
+        return np.concatenate(self._global_signal)
+
+    def carpet(self) -> np.ndarray:
+        """A (voxels x volumes) carpet of the sampled voxels, each scaled to zero
+        mean and unit variance."""
+        carpet = np.concatenate(self._carpet, axis=1)
+        rows = self._carpet_rows
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self._m2[rows] / self._count[rows])
+            std = np.where(std > 0, std, 1)
+        return ((carpet - self._mean[rows, np.newaxis]) / std[:, np.newaxis]).astype(
+            np.float32
+        )
+
+
+def accumulate_image(
+    nii_file: os.PathLike,
+    mask: np.ndarray = None,
+    carpet_rows: int = CARPET_ROWS,
+    block_volumes: int = BLOCK_VOLUMES,
+) -> TimeseriesAccumulator:
+    """Stream an image through a TimeseriesAccumulator in blocks of volumes.
+
+    The mask is used if it matches the image's grid. Otherwise, as when an image
+    has been resampled, the voxels which are nonzero in the first volume are used.
+    """
+    import nibabel as nib
+
+    # Keep compressed images open, so each block continues reading from the last
+    image = nib.load(str(nii_file), keep_file_open=True)
+    dataobj = image.dataobj
+    if mask is None or mask.shape != image.shape[:3]:
+        first_volume = np.asarray(dataobj[..., 0])
+        mask = np.isfinite(first_volume) & (first_volume != 0)
+
+    accumulator = TimeseriesAccumulator(mask, carpet_rows=carpet_rows)
+    n_volumes = image.shape[3] if len(image.shape) > 3 else 1
+    for start in range(0, n_volumes, block_volumes):
+        if len(image.shape) > 3:
+            block = np.asarray(dataobj[..., start : start + block_volumes])
+        else:
+            block = np.asarray(dataobj)[..., np.newaxis]
+        accumulator.update(block)
+
+    return accumulator
+
+
+def qc_image(
+    in_file,
+    out_file=None,
+    mask_file=None,
+    confounds_file=None,
+    scrub_vector=None,
+    fd_column="framewise_displacement",
+    carpet_rows=1000,
+    export_path=None,
+):
+    """Compute QC metrics for an image before and after postprocessing. Saves the
+    scalar metrics to export_path as JSON, and the maps and timeseries beside it
+    as NPZ. Returns the path of the JSON file."""
+    # Imports must be in function for running as node
+    import json
+    import os
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+    import pandas as pd
+
+    from clpipe.postprocutils.qc import (
+        QC_ARRAYS_SUFFIX,
+        QC_SUFFIX,
+        accumulate_image,
+    )
+    from clpipe.postprocutils.utils import strip_image_extension
+
+    mask = None
+    if mask_file:
+        mask = np.asarray(nib.load(str(mask_file)).dataobj) != 0
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(in_file).name)
+        export_path = f"{base_name}{QC_SUFFIX}"
+    export_path = os.path.abspath(export_path)
+    if export_path.endswith(QC_SUFFIX):
+        arrays_path = export_path[: -len(QC_SUFFIX)] + QC_ARRAYS_SUFFIX
+    else:
+        arrays_path = str(Path(export_path).with_suffix(".npz"))
+
+    metrics = {"image": str(in_file), "postprocessed_image": None}
+    arrays = {}
+    images = {"before": in_file, "after": out_file}
+    for stage, nii_file in images.items():
+        if not nii_file:
+            continue
+        accumulator = accumulate_image(nii_file, mask, carpet_rows=int(carpet_rows))
+        tsnr = accumulator.tsnr()
+        dvars = accumulator.dvars()
+        arrays.update(
+            {
+                f"tsnr_{stage}": tsnr,
+                f"dvars_{stage}": dvars,
+                f"global_signal_{stage}": accumulator.global_signal(),
+                f"carpet_{stage}": accumulator.carpet(),
+            }
+        )
+        in_mask = tsnr[accumulator.mask]
+        metrics.update(
+            {
+                f"n_volumes_{stage}": int(accumulator.global_signal().size),
+                f"mean_tsnr_{stage}": float(np.mean(in_mask)) if in_mask.size else None,
+                f"median_tsnr_{stage}": (
+                    float(np.median(in_mask)) if in_mask.size else None
+                ),
+                f"mean_dvars_{stage}": (
+                    float(np.nanmean(dvars)) if np.isfinite(dvars).any() else None
+                ),
+            }
+        )
+    if out_file:
+        metrics["postprocessed_image"] = str(out_file)
+
+    metrics["mean_fd"] = None
+    if confounds_file:
+        confounds = pd.read_csv(confounds_file, sep="\t", na_values="n/a")
+        if fd_column in confounds.columns:
+            fd = confounds[fd_column].to_numpy(dtype=np.float64)
+            arrays["fd"] = fd
+            if np.isfinite(fd).any():
+                metrics["mean_fd"] = float(np.nanmean(fd))
+
+    metrics["n_scrubbed"], metrics["percent_scrubbed"] = None, None
+    if scrub_vector is not None and len(scrub_vector) > 0:
+        scrub_vector = np.asarray(scrub_vector)
+        metrics["n_scrubbed"] = int(np.sum(scrub_vector == 1))
+        metrics["percent_scrubbed"] = 100 * metrics["n_scrubbed"] / len(scrub_vector)
+
+    np.savez_compressed(arrays_path, **arrays)
+    metrics["arrays"] = Path(arrays_path).name
+    with open(export_path, "w") as file_to_write:
+        json.dump(metrics, file_to_write, indent=4)
+
+    return export_path
+
+
+def load_qc(directory: os.PathLike) -> pd.DataFrame:
+    """Load the QC metrics saved under a directory into one table, with a row per
+    image, and the image's BIDS entities as columns."""
+    rows = []
+    for qc_file in sorted(Path(directory).rglob(f"*{QC_SUFFIX}")):
+        with open(qc_file) as file_to_read:
+            metrics = json.load(file_to_read)
+        entities = _bids_entities(Path(metrics["image"]).name)
+        rows.append({**entities, **metrics, "qc_file": str(qc_file)})
+
+    qc = pd.DataFrame(rows)
+    if qc.empty:
+        return qc
+    entity_columns = [entity for entity in BIDS_ENTITIES if entity in qc.columns]
+    metric_columns = [column for column in qc.columns if column not in entity_columns]
+    return qc[entity_columns + metric_columns]
+
+
+def _bids_entities(file_name: str) -> dict:
+    entities = dict(re.findall(r"(?:^|_)([a-zA-Z]+)-([a-zA-Z0-9]+)", file_name))
+    return {entity: entities[entity] for entity in BIDS_ENTITIES if entity in entities}
@@ -0,0 +1,185 @@
+"""
+Native resampling to a reference image's grid.
+
+FLIRT's -applyxfm -usesqform maps every reference voxel into the source image
+through the two images' affines, and interpolates trilinearly. That mapping only
+depends on the source and reference grids, so here it is computed once as a
+sparse (reference voxels x source voxels) matrix holding each reference voxel's
+8 trilinear weights. Every volume is then resampled with a sparse matrix
+product, in blocks of volumes run on a thread pool.
+
+Matrices are cached in memory, and can be cached on disk, keyed by both grids,
+so images which share a grid, such as a subject's runs or sessions, skip the
+setup.
+"""
+
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+CACHE_PREFIX = "resample_"
+
+
+def resampling_matrix(
+    source_shape: tuple,
+    source_affine: np.ndarray,
+    reference_shape: tuple,
+    reference_affine: np.ndarray,
+    cache_dir: os.PathLike = None,
+):
+    """Get the sparse matrix which trilinearly resamples a flattened source volume
+    onto the reference grid, loading or saving it in cache_dir if given.
+
+    Reference voxels mapped outside the source grid take its neighbours outside
+    the grid as 0.
+    """
+    source_shape = tuple(int(size) for size in source_shape[:3])
+    reference_shape = tuple(int(size) for size in reference_shape[:3])
+    source_affine = tuple(np.asarray(source_affine, dtype=np.float64).ravel())
+    reference_affine = tuple(np.asarray(reference_affine, dtype=np.float64).ravel())
+
+    if cache_dir is None:
+        return _resampling_matrix(
+            source_shape, source_affine, reference_shape, reference_affine
+        )
+    return _cached_resampling_matrix(
+        source_shape, source_affine, reference_shape, reference_affine, str(cache_dir)
+    )
+
+
+def grid_key(
+    source_shape: tuple,
+    source_affine: tuple,
+    reference_shape: tuple,
+    reference_affine: tuple,
+) -> str:
+    """A hash identifying a pair of source and reference grids."""
+    affines = np.round(np.array([source_affine, reference_affine]), 6) + 0.0
+    key = hashlib.sha1(repr((source_shape, reference_shape)).encode())
+    key.update(affines.tobytes())
+    return key.hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _cached_resampling_matrix(
+    source_shape, source_affine, reference_shape, reference_affine, cache_dir
+):
+    from scipy import sparse
+
+    key = grid_key(source_shape, source_affine, reference_shape, reference_affine)
+    cache_file = Path(cache_dir) / f"{CACHE_PREFIX}{key}.npz"
+    if cache_file.exists():
+        return sparse.load_npz(cache_file)
+
+    matrix = _resampling_matrix(
+        source_shape, source_affine, reference_shape, reference_affine
+    )
+
+    # Write to a temporary file first, so parallel jobs never read a partial file
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_name(f"{cache_file.stem}.{os.getpid()}.tmp.npz")
+    sparse.save_npz(temp_file, matrix)
+    os.replace(temp_file, cache_file)
+
+    return matrix
+
+
+@lru_cache(maxsize=8)
+def _resampling_matrix(source_shape, source_affine, reference_shape, reference_affine):
+    from scipy import sparse
+
+    source_affine = np.array(source_affine).reshape(4, 4)
+    reference_affine = np.array(reference_affine).reshape(4, 4)
+    mapping = np.linalg.inv(source_affine) @ reference_affine
+
+    reference_voxels = np.indices(reference_shape).reshape(3, -1).T
+    coordinates = reference_voxels @ mapping[:3, :3].T + mapping[:3, 3]
+    corners = np.floor(coordinates).astype(np.int64)
+    fractions = coordinates - corners
+
+    rows, columns, weights = [], [], []
+    for offset in np.ndindex(2, 2, 2):
+        neighbours = corners + offset
+        weight = np.prod(np.where(offset, fractions, 1 - fractions), axis=1)
+        inside = np.all((neighbours >= 0) & (neighbours < source_shape), axis=1)
+        inside &= weight > 0
+        rows.append(np.flatnonzero(inside))
+        columns.append(np.ravel_multi_index(neighbours[inside].T, source_shape))
+        weights.append(weight[inside])
+
+    matrix = sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))),
+        shape=(int(np.prod(reference_shape)), int(np.prod(source_shape))),
+        dtype=np.float32,
+    )
+    return matrix
+
+
+def resample(data: np.ndarray, matrix, reference_shape: tuple, n_threads: int = 1):
+    """Resample a 3D or 4D array with a matrix from resampling_matrix."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_volumes = data.shape[3] if data.ndim == 4 else 1
+    volumes = np.asarray(data, dtype=np.float32).reshape(-1, n_volumes)
+    resampled = np.empty((matrix.shape[0], n_volumes), dtype=np.float32)
+
+    n_threads = max(1, min(int(n_threads), n_volumes))
+    blocks = np.array_split(np.arange(n_volumes), n_threads)
+
+    def resample_block(block):
+        resampled[:, block] = matrix @ volumes[:, block]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        # Consume the results to raise any errors from the blocks
+        list(executor.map(resample_block, blocks))
+
+    return resampled.reshape(tuple(reference_shape[:3]) + data.shape[3:])
+
+
+def resample_image(
+    nii_file,
+    reference_image,
+    cache_dir=None,
+    n_threads=1,
+    export_path=None,
+):
+    """Resample an image onto a reference image's grid, using the transform given
+    by their affines. Returns the path of the resampled image."""
+    # Imports must be in function for running as node
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+
+    from clpipe.postprocutils.resample import resample, resampling_matrix
+    from clpipe.postprocutils.utils import strip_image_extension
+
+    image = nib.load(str(nii_file))
+    reference = nib.load(str(reference_image))
+    reference_shape = reference.shape[:3]
+
+    matrix = resampling_matrix(
+        image.shape, image.affine, reference_shape, reference.affine, cache_dir
+    )
+    resampled = resample(
+        np.asarray(image.dataobj), matrix, reference_shape, n_threads=n_threads
+    )
+
+    header = image.header.copy()
+    header.set_data_shape(resampled.shape)
+    header.set_zooms(reference.header.get_zooms()[:3] + image.header.get_zooms()[3:])
+    header.set_data_dtype(np.float32)
+    out_image = nib.Nifti1Image(resampled, reference.affine, header)
+    out_image.set_qform(reference.affine, int(reference.header["qform_code"]) or 1)
+    out_image.set_sform(reference.affine, int(reference.header["sform_code"]) or 1)
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(nii_file).name)
+        export_path = f"{base_name}_resampled.nii.gz"
+    export_path = str(Path(export_path).absolute())
+    nib.save(out_image, export_path)
+
+    return export_path
@@ -30,13 +30,14 @@ class NANOmit(BaseInterface):
         fname = self.inputs.in_file
 
         img = nb.load(fname)
-        img_dat = img.get_fdata()
+        img_dat = img.get_fdata(dtype=np.float32)
 
         nan_vec = np.sum(np.isnan(img_dat), axis=(0, 1, 2))
         it = np.nditer(nan_vec, flags=["f_index"])
         good_inds = [it.index for x in it if x == 0]
         img_trimdat = img_dat[:, :, :, good_inds]
         rm_file = nb.Nifti1Image(img_trimdat, img.affine, nb.Nifti1Header())
+        rm_file.set_data_dtype(np.float32)
         _, base, _ = split_filename(fname)
         nb.save(rm_file, base + "_naomit.nii.gz")
 
@@ -0,0 +1,130 @@
+"""
+Fused trimming, scrubbing and masking.
+
+TrimTimepoints, ScrubTimepoints (without interpolation) and ApplyMask only
+select or blank parts of an image, but each run as its own node, reading the
+full image and writing a new one. Here a run of adjacent steps is reduced to
+a single index selection: the timepoints kept are tracked as indexes into the
+original volumes, alongside the timepoints scrubbed to NaN, and the image is
+read once through its dataobj, only over the volumes needed, in its own dtype.
+"""
+
+import numpy as np
+
+STEP_TRIM_TIMEPOINTS = "TrimTimepoints"
+STEP_SCRUB_TIMEPOINTS = "ScrubTimepoints"
+STEP_APPLY_MASK = "ApplyMask"
+SELECTION_STEPS = (STEP_TRIM_TIMEPOINTS, STEP_SCRUB_TIMEPOINTS, STEP_APPLY_MASK)
+
+
+def timepoint_selection(
+    n_timepoints: int, operations: list, scrub_vector: list = None
+) -> tuple:
+    """Combine the timepoint operations of a run of steps.
+
+    Each operation is a dict with a "step" key and the step's options:
+    "from_beginning" and "from_end" for TrimTimepoints, and "insert_na" for
+    ScrubTimepoints. As when the steps run one after another, the scrub vector
+    indexes the timepoints remaining when ScrubTimepoints is reached.
+
+    Returns:
+        The indexes of the original timepoints to keep, and a boolean vector
+        marking which of them are scrubbed to NaN.
+    """
+    timepoints = np.arange(n_timepoints)
+    missing = np.zeros(n_timepoints, dtype=bool)
+
+    for operation in operations:
+        step = operation["step"]
+        if step == STEP_TRIM_TIMEPOINTS:
+            stop = len(timepoints) - operation.get("from_end", 0)
+            start = operation.get("from_beginning", 0)
+            timepoints = timepoints[start:stop]
+            missing = missing[start:stop]
+        elif step == STEP_SCRUB_TIMEPOINTS:
+            if scrub_vector is None:
+                raise ValueError(f"{STEP_SCRUB_TIMEPOINTS}: No scrub vector provided.")
+            scrub_targets = np.flatnonzero(np.asarray(scrub_vector) == 1)
+            if operation.get("insert_na", True):
+                missing[scrub_targets] = True
+            else:
+                keep = np.ones(len(timepoints), dtype=bool)
+                keep[scrub_targets] = False
+                timepoints = timepoints[keep]
+                missing = missing[keep]
+        elif step != STEP_APPLY_MASK:
+            raise ValueError(f"Step cannot be fused with a selection: {step}")
+
+    return timepoints, missing
+
+
+def select_timepoints(dataobj, timepoints: np.ndarray) -> np.ndarray:
+    """Read the given timepoints from a 4D array or array proxy, reading only
+    the volumes between the first and last of them."""
+    if len(timepoints) == 0:
+        return np.asarray(dataobj[..., :0])
+
+    start, stop = int(timepoints.min()), int(timepoints.max()) + 1
+    data = np.asarray(dataobj[..., start:stop])
+    if len(timepoints) == stop - start and np.all(np.diff(timepoints) == 1):
+        return data
+    return data[..., timepoints - start]
+
+
+def select_image(
+    nii_file,
+    operations,
+    scrub_vector=None,
+    mask_file=None,
+    export_path=None,
+    dtype=None,
+):
+    """Apply a run of TrimTimepoints, ScrubTimepoints and ApplyMask operations
+    to an image in a single pass. The image keeps its datatype, unless dtype is
+    given. Returns the path of the selected image."""
+    # Imports must be in function for running as node
+    import os
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+
+    from clpipe.postprocutils.selection import (
+        STEP_APPLY_MASK,
+        select_timepoints,
+        timepoint_selection,
+    )
+    from clpipe.postprocutils.utils import save_image, strip_image_extension
+
+    image = nib.load(str(nii_file))
+    timepoints, missing = timepoint_selection(image.shape[3], operations, scrub_vector)
+    data = select_timepoints(image.dataobj, timepoints)
+
+    # Integer images are only converted when they need NaNs, and scaled integer
+    #   images, which nibabel reads as float64, are kept in float32
+    if missing.any() and not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float32)
+    elif data.dtype == np.float64 and image.get_data_dtype() != np.float64:
+        data = data.astype(np.float32)
+
+    if any(operation["step"] == STEP_APPLY_MASK for operation in operations):
+        if not mask_file:
+            raise ValueError(f"{STEP_APPLY_MASK}: No mask file provided.")
+        mask = np.asarray(nib.load(str(mask_file)).dataobj) != 0
+        data[~mask] = 0
+    if missing.any():
+        data[..., missing] = np.nan
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(nii_file).name)
+        export_path = f"{base_name}_selected.nii.gz"
+    export_path = os.path.abspath(export_path)
+
+    if dtype is not None:
+        return save_image(data, image.affine, image.header, export_path, dtype=dtype)
+
+    header = image.header.copy()
+    header.set_data_dtype(data.dtype)
+    nib.save(nib.Nifti1Image(data, image.affine, header), export_path)
+
+    return export_path
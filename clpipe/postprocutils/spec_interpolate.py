@@ -1,72 +1,170 @@
-import numpy
-import math
+"""
+Spectral interpolation of scrubbed timepoints.
+
+The timepoints to keep are fit with a Lomb-Scargle periodogram, which handles
+their uneven sampling, and the scrubbed timepoints are replaced by the fit's
+reconstruction at their times. The fit only depends on which timepoints are
+kept, not on the data, so the trigonometric bases are built once and combined
+into a single (time x kept timepoints) reconstruction matrix. Each block of
+voxels is then reconstructed with one matrix product, in float32, with blocks
+run on a thread pool.
+"""
+
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy
 
-def spec_inter(arr, tr, ofreq, scrub_mask, hifreq, binSize):
+
+def spec_inter(
+    arr, tr, ofreq, scrub_mask, hifreq, binSize, n_threads=1, dtype=numpy.float32
+):
+    """Replace the scrubbed timepoints of a (time x voxels) array with a spectral
+    reconstruction of the remaining timepoints.
+
+    Args:
+        arr: A (time x voxels) array.
+        tr: The repetition time, in seconds.
+        ofreq: The oversampling frequency of the periodogram.
+        scrub_mask: A scrub vector, with 1 marking timepoints to replace.
+        hifreq: The highest frequency to fit, as a fraction of the average
+            Nyquist frequency of the remaining timepoints.
+        binSize: How many voxels to reconstruct at once.
+        n_threads: How many blocks of voxels to reconstruct in parallel.
+        dtype: The precision of the reconstruction.
+
+    Returns:
+        A copy of arr with the scrubbed timepoints replaced.
+    """
     scrub_mask = numpy.asarray(scrub_mask)
-    goodtpindex = numpy.asarray([[i for i, e in enumerate(scrub_mask) if e == 0]])
-    badtpindex = numpy.asarray([[i for i, e in enumerate(scrub_mask) if e == 1]])
-    tobs_good = (goodtpindex + 1) * tr
+    goodtpindex = numpy.flatnonzero(scrub_mask == 0)
+    badtpindex = numpy.flatnonzero(scrub_mask == 1)
+
+    corr_arr = numpy.copy(arr)
+    if badtpindex.size == 0:
+        return corr_arr
+    if goodtpindex.size < 2:
+        raise ValueError(
+            "Spectral interpolation requires at least 2 timepoints not scrubbed."
+        )
+
+    recon_matrix = reconstruction_matrix(
+        tr, ofreq, scrub_mask.shape[0], goodtpindex, hifreq
+    ).astype(dtype)
+
+    binSize = int(binSize)
+    totbins = math.ceil(float(arr.shape[1]) / float(binSize))
+
+    def reconstruct_bin(bin):
+        logging.debug("Bin " + str(bin) + " out of " + str(totbins))
+        binVox = slice(bin * binSize, (bin + 1) * binSize)
+        gooddata = numpy.asarray(arr[goodtpindex, binVox], dtype=dtype)
+        recon = recon_matrix @ gooddata
+
+        # Rescale the reconstruction to the variance of the data
+        recon_std = numpy.std(recon, 0, ddof=1, dtype=numpy.float64)
+        data_std = numpy.std(gooddata, 0, ddof=1, dtype=numpy.float64)
+        data_std[data_std == 0] = -1
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            cor_factor = recon_std / data_std
+            recon_bad = recon[badtpindex] / cor_factor
+        corr_arr[badtpindex, binVox] = numpy.nan_to_num(recon_bad)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(n_threads))) as executor:
+        # Consume the results to raise any errors from the blocks
+        list(executor.map(reconstruct_bin, range(totbins)))
+
+    return corr_arr
+
+
+def reconstruction_matrix(tr, ofreq, n_timepoints, goodtpindex, hifreq):
+    """Build the (time x kept timepoints) matrix which maps the kept timepoints
+    onto their Lomb-Scargle reconstruction at every timepoint."""
+    tobs_good = (numpy.asarray(goodtpindex) + 1) * tr
     timespan = tobs_good.max() - tobs_good.min()
-    tpobs_all = numpy.arange(tr, tr * float(scrub_mask.shape[0] + 1), tr)
+    tpobs_all = (numpy.arange(n_timepoints) + 1) * tr
+
+    freq_step = 1 / (timespan * ofreq)
     freq = numpy.arange(
-        1 / (timespan * ofreq),
-        hifreq * tobs_good.shape[1] / (2 * timespan) + 1 / (timespan * ofreq),
-        1 / (timespan * ofreq),
-    )[numpy.newaxis]
+        freq_step,
+        hifreq * tobs_good.shape[0] / (2 * timespan) + freq_step,
+        freq_step,
+    )
     freqang = 2.0 * math.pi * freq
-    offsets = numpy.arctan2(
-        numpy.sin(numpy.matmul(numpy.transpose(2 * freqang), tobs_good)).sum(1),
-        numpy.cos(numpy.matmul(numpy.transpose(2 * freqang), tobs_good)).sum(1),
-    ) / (2 * freqang)
-    costerm = numpy.cos(
-        numpy.matmul(numpy.transpose(freqang), tobs_good) - (offsets * freqang).T
+
+    # The time offsets which make each frequency's sine and cosine orthogonal
+    #   over the kept timepoints
+    angles = numpy.outer(2 * freqang, tobs_good)
+    offsets = numpy.arctan2(numpy.sin(angles).sum(1), numpy.cos(angles).sum(1)) / (
+        2 * freqang
     )
-    sinterm = numpy.sin(
-        numpy.matmul(numpy.transpose(freqang), tobs_good) - (offsets * freqang).T
+    angles = numpy.outer(freqang, tobs_good) - (offsets * freqang)[:, numpy.newaxis]
+    costerm = numpy.cos(angles)
+    sinterm = numpy.sin(angles)
+
+    # Each frequency's coefficients are the data projected onto its terms
+    cos_norm = numpy.power(costerm, 2).sum(axis=1)[:, numpy.newaxis]
+    sin_norm = numpy.power(sinterm, 2).sum(axis=1)[:, numpy.newaxis]
+    cos_weights = numpy.divide(
+        costerm, cos_norm, out=numpy.zeros_like(costerm), where=cos_norm > 0
     )
-    totbins = math.ceil(float(arr.shape[1]) / float(binSize))
-    binnedRecon = []
-    for bin in range(0, totbins):
-        logging.debug("Bin " + str(bin) + " out of " + str(totbins))
-        binVox = numpy.arange(bin * binSize, (bin + 1) * binSize, 1)
-        binVox = numpy.delete(
-            binVox, [i for i, e in enumerate(binVox) if e >= arr.shape[1]]
-        )
-        gooddata = arr[goodtpindex.T, binVox]
-        cosMultTemp = [
-            numpy.matmul(costerm[:, i][numpy.newaxis].T, gooddata[i, :][numpy.newaxis])
-            for i in range(0, tobs_good.shape[1])
-        ]
-        cosmult = numpy.dstack(cosMultTemp)
-        num = cosmult.sum(axis=2)
-        dem = (numpy.power(costerm, 2)).sum(axis=1)[numpy.newaxis].T
-        cosine = num / dem
-        sinMultTemp = [
-            numpy.matmul(sinterm[:, i][numpy.newaxis].T, gooddata[i, :][numpy.newaxis])
-            for i in range(0, tobs_good.shape[1])
-        ]
-        sinmult = numpy.dstack(sinMultTemp)
-        num = sinmult.sum(axis=2)
-        dem = (numpy.power(sinterm, 2)).sum(axis=1)[numpy.newaxis].T
-        sine = num / dem
-        freqRep = numpy.dstack([freqang * tp for tp in tpobs_all])[0, :, :].T
-        sin_t = numpy.sin(freqRep)
-        cos_t = numpy.cos(freqRep)
-        S = numpy.matmul(sin_t, sine)
-        C = numpy.matmul(cos_t, cosine)
-        temp = C + S
-        binnedRecon.append(temp)
-    recon = numpy.hstack(binnedRecon)
-    recon_std = numpy.std(recon, 0, ddof=1)
-    data_std = numpy.std(arr[goodtpindex, :], 1, ddof=1)
-    data_std[data_std == 0] = -1
-    with numpy.errstate(divide="ignore", invalid="ignore"):
-        cor_factor = recon_std / data_std
-        recon = recon / cor_factor
-    numpy.nan_to_num(recon, copy=False)
-    corr_arr = numpy.copy(arr)
-    if badtpindex.shape[1] != 0:
-        corr_arr[badtpindex, :] = recon[badtpindex, :]
-    return corr_arr
+    sin_weights = numpy.divide(
+        sinterm, sin_norm, out=numpy.zeros_like(sinterm), where=sin_norm > 0
+    )
+
+    freqRep = numpy.outer(tpobs_all, freqang)
+    return numpy.cos(freqRep) @ cos_weights + numpy.sin(freqRep) @ sin_weights
+
+
+def spec_inter_image(
+    nii_file,
+    scrub_vector,
+    tr,
+    oversampling_freq=8,
+    percent_freq_sample=1.0,
+    bin_size=5000,
+    n_threads=1,
+    mask_file=None,
+    export_path=None,
+):
+    """Replace an image's scrubbed timepoints with spectrally interpolated values.
+    Returns the path of the interpolated image."""
+    # Imports must be in function for running as node
+    import os
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+
+    from clpipe.postprocutils.spec_interpolate import spec_inter
+    from clpipe.postprocutils.utils import strip_image_extension
+
+    image = nib.load(str(nii_file))
+    data = np.asarray(image.dataobj, dtype=np.float32)
+
+    if mask_file:
+        mask = np.asarray(nib.load(str(mask_file)).dataobj) > 0
+    else:
+        mask = np.any(data != 0, axis=3)
+
+    data[mask] = spec_inter(
+        data[mask].T,
+        tr,
+        oversampling_freq,
+        scrub_vector,
+        percent_freq_sample,
+        bin_size,
+        n_threads=n_threads,
+    ).T
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(nii_file).name)
+        export_path = f"{base_name}_interpolated.nii.gz"
+    export_path = os.path.abspath(export_path)
+
+    header = image.header.copy()
+    header.set_data_dtype(np.float32)
+    nib.save(nib.Nifti1Image(data, image.affine, header), export_path)
+
+    return export_path
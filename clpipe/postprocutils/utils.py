@@ -5,18 +5,11 @@ import os
 
 from typing import List
 
-
 DEFAULT_GRAPH_STYLE = "colored"
 
-
-def find_sub_list(sl, l):
-    results = []
-    sll = len(sl)
-    for ind in (i for i, e in enumerate(l) if e == sl[0]):
-        if l[ind : ind + sll] == sl:
-            results.append((ind, ind + sll))
-
-    return results
+DTYPE_FLOAT32 = "float32"
+DTYPE_INT16 = "int16"
+OUTPUT_DTYPES = (DTYPE_FLOAT32, DTYPE_INT16)
 
 
 def get_scrub_vector(fdts, fd_thres=0.3, fd_behind=1, fd_ahead=1, fd_contig=3):
@@ -26,51 +19,78 @@ def get_scrub_vector(fdts, fd_thres=0.3, fd_behind=1, fd_ahead=1, fd_contig=3):
     Args:
         fdts (_type_): the input vector, a timeseries to scrub
         fd_thres (float, optional): the cutoff threshold for inclusion
-        fd_behind (int, optional):
-        fd_ahead (int, optional):
-        fd_contig (int, optional):
+        fd_behind (int, optional): how many timepoints before each target to scrub
+        fd_ahead (int, optional): how many timepoints after each target to scrub
+        fd_contig (int, optional): the fewest consecutive unscrubbed timepoints to
+            keep - shorter runs between scrub targets are also scrubbed
 
     Returns:
         _type_: the fully prepared scrub target vector
     """
-    import numpy
+    import numpy as np
 
-    # index all timepoints that exceed the threshold as the base scrub targets
-    scrubTargets = [i for i, e in enumerate(fdts) if e > fd_thres]
-
-    # Generate scrub indexes behind the base targets
-    for t in numpy.arange(0, fd_behind + 1):
-        scrubTargetsAdd = scrubTargets - t
-        scrubTargets.extend(scrubTargetsAdd)
-
-    # Generate scrub indexes ahead of the base targets
-    for t in numpy.arange(0, fd_ahead + 1):
-        scrubTargetsAdd = scrubTargets + t
-        scrubTargets.extend(scrubTargetsAdd)
-
-    # Remove duplicates by converting to a set temporarily
-    scrubTargets = list(set(scrubTargets))
-    # Remove negatives
-    scrubTargets = [e for i, e in enumerate(scrubTargets) if e >= 0]
-    # Remove items outside the bounds of the original set of indexes
-    scrubTargets = [e for i, e in enumerate(scrubTargets) if e <= len(fdts) - 1]
-    # Convert to a set again
-    # TODO: is this necessary? Duplicates already removed above
-    scrubTargets = set(scrubTargets)
-    # Create a vector of 0s representing points not to scrub
-    scrubVect = [0] * len(fdts)
-    # Populate the 0 vector with 1s representing scrub targets
-    scrubVect = [1 if i in scrubTargets else 0 for i, e in enumerate(scrubVect)]
-
-    # Ensure fd_config number of consecutive points
-    if fd_contig > 0:
-        target = [0] * fd_contig
-        contigSets = find_sub_list(target, scrubVect)
-        scrubVectTemp = [1] * len(fdts)
-        for conSet in contigSets:
-            scrubVectTemp[conSet[0] : conSet[1]] = target
-        scrubVect = scrubVectTemp
-    return scrubVect
+    from clpipe.postprocutils.utils import get_scrub_matrix
+
+    scrub_matrix = get_scrub_matrix(
+        np.asarray(fdts, dtype=np.float64)[np.newaxis],
+        [fd_thres],
+        [fd_behind],
+        [fd_ahead],
+        [fd_contig],
+    )
+    return scrub_matrix[0].astype(int).tolist()
+
+
+def get_scrub_matrix(timeseries, thresholds, behind, ahead, contiguous):
+    """Find the scrub targets of several scrub configs at once.
+
+    Args:
+        timeseries: A (configs x time) array of target variables. NaN values are
+            never scrub targets.
+        thresholds, behind, ahead, contiguous: The threshold and scrub behind,
+            ahead and contiguous settings of each config.
+
+    Returns:
+        A (configs x time) boolean array, True at timepoints to scrub.
+    """
+    import numpy as np
+
+    timeseries = np.atleast_2d(np.asarray(timeseries, dtype=np.float64))
+    n_configs, n_timepoints = timeseries.shape
+    thresholds = np.asarray(thresholds, dtype=np.float64)[:, np.newaxis]
+    behind = np.asarray(behind, dtype=np.int64)[:, np.newaxis]
+    ahead = np.asarray(ahead, dtype=np.int64)[:, np.newaxis]
+    contiguous = np.asarray(contiguous, dtype=np.int64)
+
+    with np.errstate(invalid="ignore"):
+        targets = timeseries > thresholds
+
+    # A timepoint t is scrubbed if any target lies within [t - ahead, t + behind],
+    #   counted with a cumulative sum of the targets
+    counts = np.zeros((n_configs, n_timepoints + 1), dtype=np.int64)
+    np.cumsum(targets, axis=1, out=counts[:, 1:])
+    times = np.arange(n_timepoints)
+    upper = np.minimum(times + behind, n_timepoints - 1) + 1
+    lower = np.clip(times - ahead, 0, n_timepoints)
+    scrub = np.take_along_axis(counts, upper, axis=1) > np.take_along_axis(
+        counts, lower, axis=1
+    )
+
+    # Scrub runs of kept timepoints shorter than the contiguous setting. Padding
+    #   each row with scrubbed timepoints keeps runs from spanning rows.
+    padded = np.ones((n_configs, n_timepoints + 2), dtype=bool)
+    padded[:, 1:-1] = scrub
+    edges = np.diff((~padded).ravel().astype(np.int8))
+    starts = np.flatnonzero(edges == 1) + 1
+    stops = np.flatnonzero(edges == -1) + 1
+    short = (stops - starts) < contiguous[starts // (n_timepoints + 2)]
+
+    marks = np.zeros(padded.size + 1, dtype=np.int64)
+    np.add.at(marks, starts[short], 1)
+    np.add.at(marks, stops[short], -1)
+    padded |= (np.cumsum(marks[:-1]) > 0).reshape(padded.shape)
+
+    return padded[:, 1:-1]
 
 
 def get_scrub_vector_node(confounds_file, scrub_configs):
@@ -92,6 +112,42 @@ def get_scrub_vector_node(confounds_file, scrub_configs):
     return scrub_vector
 
 
+def get_multiple_scrub_vector_node(confounds_file, scrub_configs):
+    """Combine the scrub vectors of several scrub configs, reading the confounds
+    file once. Target variables with a wildcard (*) are expanded to every
+    matching column."""
+    import fnmatch
+
+    import numpy as np
+    import pandas as pd
+    from clpipe.postprocutils.utils import get_scrub_matrix
+
+    confounds_df = pd.read_csv(confounds_file, sep="\t")
+
+    columns = []
+    expanded_configs = []
+    for scrub_config in scrub_configs:
+        target_variable = scrub_config["target_variable"]
+        if "*" in target_variable:
+            matches = fnmatch.filter(confounds_df.columns, target_variable)
+        else:
+            matches = [target_variable]
+        columns.extend(matches)
+        expanded_configs.extend([scrub_config] * len(matches))
+
+    if len(columns) == 0:
+        return [0] * len(confounds_df)
+
+    scrub_matrix = get_scrub_matrix(
+        confounds_df[columns].to_numpy(dtype=np.float64).T,
+        [scrub_config["threshold"] for scrub_config in expanded_configs],
+        [scrub_config["scrub_behind"] for scrub_config in expanded_configs],
+        [scrub_config["scrub_ahead"] for scrub_config in expanded_configs],
+        [scrub_config["scrub_contiguous"] for scrub_config in expanded_configs],
+    )
+    return scrub_matrix.any(axis=0).astype(int).tolist()
+
+
 def get_scrub_targets(scrub_vector: list):
     """Given a scrubbing vector of 1s and 0s, convert this into a list of indexes."""
 
@@ -106,43 +162,12 @@ def scrub_data(data, fdts):
     return data
 
 
-def scrub_image(nii_file, scrub_vector, insert_na=True, export_path=None):
-    """Scrub the targets from the given image."""
-    import nibabel as nib
-    import numpy as np
+def scrub_image(nii_file, scrub_vector, insert_na=True, export_path=None, dtype=None):
+    """Scrub the targets from the given image, keeping its datatype unless dtype
+    is given."""
     from pathlib import Path
 
-    from clpipe.postprocutils.utils import get_scrub_targets
-
-    image = nib.load(nii_file)
-    data = image.get_fdata()
-    affine = image.affine
-    orig_shape = data.shape
-    header = image.header
-
-    # Reorganize the data to be 2D with time on X
-    data = data.reshape((np.prod(np.shape(data)[:-1]), data.shape[-1]))
-    data = np.transpose(data)
-
-    # Get the scrub indexes
-    scrub_targets = get_scrub_targets(scrub_vector)
-    if insert_na:
-        # Replace scrub targets with NA
-        data[scrub_targets, :] = np.nan
-        new_shape = orig_shape
-    else:
-        # Remove the scrub targets
-        data = np.delete(data, scrub_targets, axis=0)
-        new_shape = (
-            orig_shape[0],
-            orig_shape[1],
-            orig_shape[2],
-            orig_shape[3] - len(scrub_targets),
-        )
-
-    # Swap the data back to original format
-    data = np.transpose(data)
-    data = data.reshape(new_shape)
+    from clpipe.postprocutils.selection import STEP_SCRUB_TIMEPOINTS, select_image
 
     if export_path is None:
         # Crude way to figure out .nii vs .nii.gz
@@ -156,10 +181,14 @@ def scrub_image(nii_file, scrub_vector, insert_na=True, export_path=None):
     else:
         out_path = export_path
 
-    out_image = nib.Nifti1Image(data, affine, header)
-    nib.save(out_image, out_path)
-
-    return out_path
+    # Scrubbing is a selection of timepoints, so it is read and written in one pass
+    return select_image(
+        nii_file,
+        [{"step": STEP_SCRUB_TIMEPOINTS, "insert_na": insert_na}],
+        scrub_vector=scrub_vector,
+        export_path=out_path,
+        dtype=dtype,
+    )
 
 
 def calc_filter(hp, lp, tr, order):
@@ -272,19 +301,17 @@ def plot_image_sample(
     )
 
 
-def nii_to_matrix(nii_file, save_df=False):
+def nii_to_matrix(nii_file, save_df=False, dtype="float32"):
     """Transform a .nii file to a 2D, time by (x, y, z) matrix."""
     import numpy as np
     import nibabel as nib
     from pathlib import Path
 
     nii_img = nib.load(nii_file)
-    img_data = nii_img.get_fdata()
+    img_data = nii_img.get_fdata(dtype=np.dtype(dtype))
     orig_shape = nii_img.shape
     affine = nii_img.affine
 
-    # data = data.astype(np.float32)
-
     # Transform the data to time by (x, y z), a 2d array
     img_2d_matrix = img_data.reshape(
         (np.prod(np.shape(img_data)[:-1]), img_data.shape[-1])
@@ -305,19 +332,79 @@ def nii_to_matrix(nii_file, save_df=False):
     return img_2d_matrix_transposed, orig_shape, affine
 
 
-def matrix_to_nii(matrix, orig_shape, affine):
+def matrix_to_nii(matrix, orig_shape, affine, dtype="float32"):
     """Transform a a 2D, time by (x, y, z) matrix back to a .nii file."""
     import numpy as np
     import nibabel as nib
 
     data = np.transpose(matrix)
     data = data.reshape(orig_shape)
-    # data32 = np.float32(data)
-    out_image = nib.Nifti1Image(data, affine)
+    out_image = nib.Nifti1Image(np.asarray(data, dtype=np.float32), affine)
+    out_image.set_data_dtype(np.dtype(dtype))
 
     return out_image
 
 
+def strip_image_extension(image_path) -> str:
+    """Remove a .nii or .nii.gz extension from an image path."""
+    image_path = str(image_path)
+    for extension in (".gz", ".nii"):
+        if image_path.endswith(extension):
+            image_path = image_path[: -len(extension)]
+    return image_path
+
+
+def save_image(data, affine, header, out_path, dtype="float32"):
+    """Save image data as float32, or as int16 scaled to the data's range.
+
+    In int16, NaNs such as scrubbed timepoints are saved as 0.
+    """
+    import numpy as np
+    import nibabel as nib
+
+    from clpipe.postprocutils.utils import OUTPUT_DTYPES
+
+    if dtype not in OUTPUT_DTYPES:
+        raise ValueError(
+            f"Unsupported image datatype: {dtype}. Choose one of: {OUTPUT_DTYPES}"
+        )
+
+    # nibabel picks the int16 scaling when the image is saved
+    out_image = nib.Nifti1Image(np.asarray(data, dtype=np.float32), affine, header)
+    out_image.set_data_dtype(np.dtype(dtype))
+    nib.save(out_image, out_path)
+
+    return out_path
+
+
+def convert_image(in_file, dtype="float32", export_path=None):
+    """Write an image in the given datatype, float32 or scaled int16. Returns the
+    path of the converted image."""
+    # Imports must be in function for running as node
+    import os
+    from pathlib import Path
+
+    import nibabel as nib
+    import numpy as np
+
+    from clpipe.postprocutils.utils import save_image, strip_image_extension
+
+    image = nib.load(str(in_file))
+
+    if export_path is None:
+        base_name = strip_image_extension(Path(in_file).name)
+        export_path = f"{base_name}_{dtype}.nii.gz"
+    export_path = os.path.abspath(export_path)
+
+    return save_image(
+        image.get_fdata(dtype=np.float32),
+        image.affine,
+        image.header,
+        export_path,
+        dtype=dtype,
+    )
+
+
 def expand_columns(tsv_file, column_names):
     import pandas as pd
     import fnmatch
@@ -339,24 +426,6 @@ def expand_columns(tsv_file, column_names):
     return [*set(expanded_columns)]  # Removes duplicates from list
 
 
-def expand_scrub_dict(tsv_file, scrub_configs):
-    # Expand the dictionary using expand_columns function
-    from clpipe.postprocutils.utils import expand_columns
-
-    expanded_columns = []
-    for column in scrub_configs:
-        target_var = column["target_variable"]
-        if "*" in target_var:
-            expanded_vars = expand_columns(tsv_file, [target_var])
-            for exp_var in expanded_vars:
-                new_column = column.copy()
-                new_column["target_variable"] = exp_var
-                expanded_columns.append(new_column)
-        else:
-            expanded_columns.append(column)
-    return expanded_columns
-
-
 def logical_or_across_lists(list_of_lists):
     import numpy as np
 
@@ -379,15 +448,31 @@ def vector_to_txt(vector):
     return str(fname.resolve())
 
 
-def construct_motion_outliers(scrub_targets):
+def construct_motion_outliers(scrub_targets, sparse=False):
+    """Build one spike regressor column per scrubbed timepoint, each with a 1 at
+    its timepoint and 0 elsewhere.
+
+    Args:
+        scrub_targets: A scrub vector, with 1 marking timepoints to scrub.
+        sparse: Return sparse columns, which only store the spikes, for
+            appending to other confounds before export.
+    """
     import pandas
     import numpy as np
 
-    size = sum(scrub_targets)
-    mot_outliers = pandas.DataFrame(np.zeros((len(scrub_targets), size)))
-    counter = 0
-    for ind, i in enumerate(scrub_targets):
-        if i == 1:
-            mot_outliers.iloc[ind, counter] = 1
-            counter += 1
-    return mot_outliers
+    scrub_targets = np.asarray(scrub_targets)
+    rows = np.flatnonzero(scrub_targets)
+    columns = np.arange(rows.size)
+
+    if sparse:
+        from scipy.sparse import csc_matrix
+
+        mot_outliers = csc_matrix(
+            (np.ones(rows.size, dtype=int), (rows, columns)),
+            shape=(scrub_targets.size, rows.size),
+        )
+        return pandas.DataFrame.sparse.from_spmatrix(mot_outliers)
+
+    mot_outliers = np.zeros((scrub_targets.size, rows.size), dtype=int)
+    mot_outliers[rows, columns] = 1
+    return pandas.DataFrame(mot_outliers)
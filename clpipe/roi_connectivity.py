@@ -0,0 +1,236 @@
+"""
+Functional connectivity between extracted ROI timeseries.
+
+Connectivity is computed for a whole cohort at once. Runs are padded into
+(runs x time x ROI) batches so each measure is computed with a few batched
+matrix products instead of one Python loop per file. Batches can be spread
+across a process pool.
+
+Two kinds of missing data from the earlier stages are handled:
+    - Scrubbed timepoints, where every ROI is NaN, are dropped from that run.
+    - ROIs that are entirely NaN, such as those below the PropVoxels mask coverage
+      threshold, get NaN for every connection in that run.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config.options import ProjectOptions
+from .roi_store import INDEX_FIELDS, get_store_path, parse_entities, read_records
+from .utils import get_logger
+
+STEP_NAME = "roi_connectivity"
+
+MEASURE_PEARSON = "pearson"
+MEASURE_PARTIAL = "partial"
+MEASURE_FISHER_Z = "fisher_z"
+MEASURES = [MEASURE_PEARSON, MEASURE_PARTIAL, MEASURE_FISHER_Z]
+
+DEFAULT_BATCH_SIZE = 64
+MIN_TIMEPOINTS = 3
+
+
+def fmri_roi_connectivity(
+    config_file=None,
+    atlas_name=None,
+    output_dir=None,
+    measures=None,
+    n_procs=1,
+    batch_size=DEFAULT_BATCH_SIZE,
+    debug=False,
+):
+    """Compute connectivity matrices for every run extracted with each atlas.
+
+    ROI timeseries are read from an atlas's merged store if one exists, and
+    otherwise from its CSV files. The results for each atlas are saved as one .npz
+    file, holding a (runs x ROI x ROI) array for each measure along with the
+    subject, session, task and run labels of each run.
+    """
+    config = ProjectOptions.load(config_file)
+    logger = get_logger(STEP_NAME, debug=debug, log_dir=config.get_logs_dir())
+
+    roi_dir = Path(config.roi_extraction.output_directory)
+    output_dir = Path(output_dir) if output_dir else roi_dir
+
+    measures = list(measures) if measures else MEASURES
+    unknown = set(measures) - set(MEASURES)
+    if unknown:
+        raise ValueError(f"Unknown connectivity measures: {unknown}")
+
+    if atlas_name is not None:
+        atlas_list = [atlas_name]
+    else:
+        atlas_list = sorted(path.name for path in roi_dir.iterdir() if path.is_dir())
+
+    for cur_atlas in atlas_list:
+        index, sources = find_atlas_runs(roi_dir, cur_atlas)
+        if len(sources) == 0:
+            logger.warning(f"No ROI timeseries found for atlas: {cur_atlas}")
+            continue
+        logger.info(
+            f"Computing connectivity for atlas {cur_atlas} across {len(sources)} runs"
+        )
+
+        batches = [
+            sources[start : start + batch_size]
+            for start in range(0, len(sources), batch_size)
+        ]
+        batch_args = [(batch, measures) for batch in batches]
+        if n_procs > 1:
+            with ProcessPoolExecutor(max_workers=n_procs) as executor:
+                results = list(executor.map(_batch_connectivity, batch_args))
+        else:
+            results = [_batch_connectivity(args) for args in batch_args]
+
+        arrays = {
+            key: np.concatenate([result[key] for result in results])
+            for key in results[0]
+        }
+        arrays.update({field: index[field].to_numpy(str) for field in INDEX_FIELDS})
+
+        out_path = output_dir / cur_atlas / f"atlas-{cur_atlas}_connectivity.npz"
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(out_path, **arrays)
+        logger.info(f"Connectivity saved to: {out_path}")
+
+
+def find_atlas_runs(roi_dir: os.PathLike, atlas_name: str):
+    """Find the ROI timeseries of every run extracted with an atlas.
+
+    Returns a DataFrame indexing the runs, and for each run either its timeseries
+    array (when read from the atlas's store) or the path of its CSV file.
+    """
+    store_path = get_store_path(roi_dir, atlas_name)
+    if store_path.exists():
+        records = read_records(store_path)
+        index = pd.DataFrame(
+            [{field: record[field] for field in INDEX_FIELDS} for record in records],
+            columns=INDEX_FIELDS,
+        )
+        return index, [record["timeseries"] for record in records]
+
+    csv_suffix = f"_atlas-{atlas_name}.csv"
+    csv_paths = sorted((Path(roi_dir) / atlas_name).glob(f"*{csv_suffix}"))
+    rows = []
+    for csv_path in csv_paths:
+        image_name = csv_path.name[: -len(csv_suffix)]
+        rows.append({"image": image_name, **parse_entities(image_name)})
+    return pd.DataFrame(rows, columns=INDEX_FIELDS), csv_paths
+
+
+def compute_connectivity(timeseries: np.ndarray, measures: list = MEASURES) -> dict:
+    """Compute connectivity matrices for a batch of runs.
+
+    Args:
+        timeseries: A (runs x time x ROI) array, or a single (time x ROI) run.
+            Timepoints where every ROI is NaN are dropped, so runs of different
+            lengths can be batched by padding with NaN. ROIs that are entirely NaN
+            are given NaN connectivity.
+        measures: Which of 'pearson', 'partial' and 'fisher_z' to compute.
+            Partial correlation uses a Ledoit-Wolf shrunk covariance of the
+            standardized timeseries. The diagonal of the Fisher z matrix is set
+            to 0.
+
+    Returns:
+        A dict with a (runs x ROI x ROI) array for each measure, and 'n_timepoints',
+        the number of timepoints used for each run.
+    """
+    timeseries = np.asarray(timeseries, dtype=np.float64)
+    if timeseries.ndim == 2:
+        timeseries = timeseries[np.newaxis]
+    n_rois = timeseries.shape[2]
+
+    # A timepoint is kept if it's finite in every ROI that has any data
+    finite = np.isfinite(timeseries)
+    valid_rois = finite.any(axis=1)
+    kept = (finite | ~valid_rois[:, np.newaxis, :]).all(axis=2)
+    n_kept = kept.sum(axis=1)
+
+    weights = kept[:, :, np.newaxis] & valid_rois[:, np.newaxis, :]
+    n = np.maximum(n_kept, 1)[:, np.newaxis]
+    data = np.where(weights, timeseries, 0.0)
+    centered = np.where(weights, data - (data.sum(axis=1) / n)[:, np.newaxis, :], 0.0)
+
+    # Sums of cross products, batched across runs
+    cross = np.matmul(centered.transpose(0, 2, 1), centered)
+    std = np.sqrt(np.diagonal(cross, axis1=1, axis2=2))
+    valid_rois &= (std > 0) & (n_kept >= MIN_TIMEPOINTS)[:, np.newaxis]
+    std = np.where(valid_rois, std, 1.0)
+
+    valid_pairs = valid_rois[:, :, np.newaxis] & valid_rois[:, np.newaxis, :]
+    eye = np.eye(n_rois, dtype=bool)
+    correlation = np.where(
+        valid_pairs, cross / (std[:, :, np.newaxis] * std[:, np.newaxis, :]), 0.0
+    )
+    correlation = np.clip(correlation, -1.0, 1.0)
+    correlation[:, eye] = valid_rois
+
+    results = {"n_timepoints": n_kept}
+    if MEASURE_PEARSON in measures:
+        results[MEASURE_PEARSON] = np.where(valid_pairs, correlation, np.nan)
+    if MEASURE_FISHER_Z in measures:
+        with np.errstate(divide="ignore"):
+            fisher_z = np.arctanh(np.where(eye, 0.0, correlation))
+        results[MEASURE_FISHER_Z] = np.where(valid_pairs, fisher_z, np.nan)
+    if MEASURE_PARTIAL in measures:
+        standardized = np.where(
+            valid_rois[:, np.newaxis, :],
+            centered * (np.sqrt(n) / std)[:, np.newaxis, :],
+            0.0,
+        )
+        shrunk = _ledoit_wolf_shrink(
+            correlation, standardized, n[:, 0], valid_rois.sum(axis=1)
+        )
+        shrunk[:, eye] = np.where(valid_rois, shrunk[:, eye], 1.0)
+        precision = np.linalg.inv(shrunk)
+        precision_diag = np.sqrt(np.diagonal(precision, axis1=1, axis2=2))
+        partial = -precision / (
+            precision_diag[:, :, np.newaxis] * precision_diag[:, np.newaxis, :]
+        )
+        partial[:, eye] = 1.0
+        results[MEASURE_PARTIAL] = np.where(valid_pairs, partial, np.nan)
+
+    return results
+
+
+def _ledoit_wolf_shrink(emp_cov, standardized, n, n_valid):
+    """Batched Ledoit-Wolf shrinkage, following scikit-learn's estimator.
+
+    The data are standardized, so the empirical covariance is the correlation
+    matrix and the shrinkage target is the identity. Only the ROIs with data
+    count towards each run's number of features.
+    """
+    p = np.maximum(n_valid, 1)
+    delta_ = (emp_cov**2).sum(axis=(1, 2))
+    beta_ = ((standardized**2).sum(axis=2) ** 2).sum(axis=1)
+
+    beta = (beta_ / n - delta_) / (p * n)
+    delta = (delta_ - p) / p
+    beta = np.minimum(beta, delta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shrinkage = np.where(delta > 0, beta / delta, 0.0)
+    shrinkage = np.clip(shrinkage, 0.0, 1.0)[:, np.newaxis, np.newaxis]
+
+    return (1.0 - shrinkage) * emp_cov + shrinkage * np.eye(emp_cov.shape[1])
+
+
+def _batch_connectivity(args):
+    sources, measures = args
+    runs = [_load_run(source) for source in sources]
+
+    n_timepoints = max(run.shape[0] for run in runs)
+    batch = np.full((len(runs), n_timepoints, runs[0].shape[1]), np.nan)
+    for i, run in enumerate(runs):
+        batch[i, : run.shape[0]] = run
+
+    return compute_connectivity(batch, measures)
+
+
+def _load_run(source):
+    if isinstance(source, np.ndarray):
+        return source
+    return pd.read_csv(source, header=None).to_numpy(dtype=np.float64)
@@ -11,16 +11,32 @@ import os
 
 import click
 import json
-import glob
 import shutil
+from datetime import datetime
 from .config.options import ProjectOptions
 from .job_manager import JobManagerFactory
 from pkg_resources import resource_stream, resource_filename
-from .errors import MaskFileNotFoundError
-from .utils import get_logger, resolve_fmriprep_dir
+from .errors import MaskFileNotFoundError, SubjectNotFoundError
+from .utils import get_logger, resolve_fmriprep_dir, scan_files
+from .roi_store import (
+    STORE_FORMAT_CSV,
+    STORE_FORMAT_NPZ,
+    STORE_FORMATS,
+    SHARD_DIR_NAME,
+    build_record,
+    get_image_name,
+    get_shard_path,
+    merge_roi_shards,
+    stored_images,
+    write_roi_shard,
+)
 from pathlib import Path
 
 STEP_NAME = "roi_extraction"
+# Each launch writes its own manifest, so queued jobs of an earlier launch
+# keep reading the manifest they were given
+MANIFEST_FILE_NAME = "roi_extraction_manifest_{timestamp}.json"
+MASK_SUFFIXES = ["_desc-brain_mask.nii.gz", "_desc-brain_mask.nii"]
 
 
 def fmri_roi_extraction(
@@ -41,6 +57,7 @@ def fmri_roi_extraction(
     overlap_ok=None,
     debug=False,
     overwrite=False,
+    manifest_file=None,
 ):
     config = ProjectOptions.load(config_file)
     config.load_cli_args(
@@ -53,6 +70,12 @@ def fmri_roi_extraction(
 
     logger = get_logger(STEP_NAME, debug=debug, log_dir=config.get_logs_dir())
 
+    if config.roi_extraction.output_format not in STORE_FORMATS:
+        raise ValueError(
+            f"Unknown ROI output format: {config.roi_extraction.output_format}. "
+            f"Choose one of: {STORE_FORMATS}"
+        )
+
     if not single:
         config_path = os.path.join(
             config.roi_extraction.output_directory, os.path.basename(config_file)
@@ -70,6 +93,24 @@ def fmri_roi_extraction(
     else:
         sublist = subjects
 
+    if manifest_file:
+        logger.debug(f"Using image manifest: {manifest_file}")
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+    else:
+        logger.info("Building manifest of images to process...")
+        manifest = build_manifest(config, sublist, task=task)
+        if not single:
+            manifest_file = os.path.join(
+                config.roi_extraction.output_directory,
+                MANIFEST_FILE_NAME.format(
+                    timestamp=datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+                ),
+            )
+            with open(manifest_file, "w") as f:
+                json.dump(manifest, f)
+            logger.info(f"Image manifest saved to: {manifest_file}")
+
     if atlas_name is not None:
         atlas_list = [atlas_name]
     else:
@@ -174,6 +215,9 @@ def fmri_roi_extraction(
                 sub_string_temp = sub_string_temp + " -overlap_ok"
                 logger.debug("Overlap ok flag set")
 
+            if manifest_file:
+                sub_string_temp = sub_string_temp + " -manifest=" + manifest_file
+
             sub_string_temp = sub_string_temp + " " + subject
             batch_manager.add_job(
                 "ROI_extract_" + subject + "_" + atlas_name, 
@@ -193,6 +237,7 @@ def fmri_roi_extraction(
                     overlap_ok,
                     overwrite,
                     logger,
+                    get_subject_manifest(manifest, subject, manifest_file),
                 )
     if not single:
         if submit:
@@ -214,6 +259,7 @@ def _fmri_roi_extract_subject(
     overlap_ok,
     overwrite,
     logger,
+    subject_manifest,
 ):
     logger.info(
         "Running Subject "
@@ -232,19 +278,8 @@ def _fmri_roi_extract_subject(
         atlas_labelpath = os.path.abspath(atlas_label)
     logger.debug(f"Using atlas path: {atlas_path}")
 
-    search_string = os.path.abspath(
-        os.path.join(
-            config.roi_extraction.target_directory,
-            "sub-" + subject,
-            "**",
-            "*" + config.roi_extraction.target_suffix,
-        )
-    )
-    logger.debug(search_string)
-    subject_files = glob.glob(search_string, recursive=True)
-    if task is not None:
-        logger.info(f"Checking for task {task} for subjects: {subject_files}")
-        subject_files = [x for x in subject_files if "task-" + task in x]
+    subject_files = subject_manifest["images"]
+    mask_index = set(subject_manifest["masks"])
     logger.info(f"Processing subjects: {subject_files}")
 
     os.makedirs(
@@ -254,8 +289,24 @@ def _fmri_roi_extract_subject(
     if not Path(atlas_labelpath).exists():
         shutil.copy2(atlas_labelpath, config.roi_extraction.output_directory)
 
+    use_store = config.roi_extraction.output_format == STORE_FORMAT_NPZ
+    if use_store:
+        shard_path = get_shard_path(
+            config.roi_extraction.output_directory, atlas_name, subject
+        )
+        logger.info(f"Writing ROI timeseries to shard: {shard_path}")
+        images_done = set() if overwrite else stored_images(shard_path)
+        records = []
+
     for file in subject_files:
-        fmri_roi_extract_image(
+        if use_store and get_image_name(file) in images_done:
+            logger.info(
+                f"{Path(file).name} already in shard! Skipping. "
+                "Use -overwrite to reprocess."
+            )
+            continue
+
+        extracted = fmri_roi_extract_image(
             file,
             config,
             atlas_name,
@@ -265,7 +316,13 @@ def _fmri_roi_extract_subject(
             overlap_ok,
             overwrite,
             logger,
+            mask_index=mask_index,
         )
+        if use_store and extracted is not None:
+            records.append(build_record(file, *extracted))
+
+    if use_store and records:
+        write_roi_shard(shard_path, records)
 
 
 def fmri_roi_extract_image(
@@ -278,14 +335,28 @@ def fmri_roi_extract_image(
     overlap_ok,
     overwrite,
     logger,
+    mask_index=None,
 ):
+    """Extract the ROI timeseries of a single image.
+
+    With the csv output format, the timeseries (and the proportion of each ROI's
+    voxels within the brain mask) are written next to each other as CSV files.
+    Either way, returns a tuple of the timeseries and voxel proportions, or None
+    if the image was skipped. Voxel proportions are None when no mask was used.
+
+    If a mask_index of known mask paths is given (see build_manifest), the image's
+    mask is looked up there instead of on the file system.
+    """
     logger.info(f"Processing image: {Path(file).stem}")
     file_outname = os.path.splitext(os.path.basename(file))[0]
     if ".nii" in file_outname:
         file_outname = os.path.splitext(file_outname)[0]
+    write_csv = config.roi_extraction.output_format == STORE_FORMAT_CSV
+    voxel_prop = None
 
     if (
-        os.path.exists(
+        write_csv
+        and os.path.exists(
             os.path.join(
                 config.roi_extraction.output_directory,
                 atlas_name + "/" + file_outname + "_atlas-" + atlas_name + ".csv",
@@ -298,7 +369,7 @@ def fmri_roi_extract_image(
 
     try:
         # First, try to find this image's mask from fMRIPrep.
-        mask_file = fmriprep_mask_finder(file, config, logger)
+        mask_file = fmriprep_mask_finder(file, config, logger, mask_index=mask_index)
     except MaskFileNotFoundError:
         if config.roi_extraction.require_mask:
             # If a mask is required, return here due to missing mask.
@@ -346,31 +417,35 @@ def fmri_roi_extract_image(
         ]
         logger.debug(to_remove)
         ROI_ts[:, to_remove] = np.nan
+        voxel_prop = mask_ROIs[0]
 
         # Save ROI masked threshold timeseries
-        np.savetxt(
-            os.path.join(
+        if write_csv:
+            np.savetxt(
                 os.path.join(
-                    config.roi_extraction.output_directory,
-                    atlas_name,
+                    os.path.join(
+                        config.roi_extraction.output_directory,
+                        atlas_name,
+                    ),
+                    file_outname + "_atlas-" + atlas_name + "_voxel_prop.csv",
                 ),
-                file_outname + "_atlas-" + atlas_name + "_voxel_prop.csv",
+                voxel_prop,
+                delimiter=",",
+            )
+
+    # Save the ROI timeseries
+    if write_csv:
+        np.savetxt(
+            os.path.join(
+                os.path.join(config.roi_extraction.output_directory, atlas_name),
+                file_outname + "_atlas-" + atlas_name + ".csv",
             ),
-            mask_ROIs[0],
+            ROI_ts,
             delimiter=",",
         )
 
-    # Save the ROI timeseries
-    np.savetxt(
-        os.path.join(
-            os.path.join(config.roi_extraction.output_directory, atlas_name),
-            file_outname + "_atlas-" + atlas_name + ".csv",
-        ),
-        ROI_ts,
-        delimiter=",",
-    )
-
     logger.info("Extraction completed.")
+    return ROI_ts, voxel_prop
 
 
 def _fmri_roi_extract_image(
@@ -399,6 +474,32 @@ def _fmri_roi_extract_image(
     return timeseries
 
 
+def fmri_roi_merge(
+    config_file=None, atlas_name=None, remove_shards=False, debug=False
+):
+    """Merge the per-job ROI timeseries shards of each atlas into a single store."""
+    config = ProjectOptions.load(config_file)
+    logger = get_logger(STEP_NAME, debug=debug, log_dir=config.get_logs_dir())
+
+    output_dir = Path(config.roi_extraction.output_directory)
+    if atlas_name is not None:
+        atlas_list = [atlas_name]
+    else:
+        atlas_list = sorted(
+            shard_dir.parent.name
+            for shard_dir in output_dir.glob(f"*/{SHARD_DIR_NAME}")
+        )
+    if len(atlas_list) == 0:
+        logger.warning(f"No ROI timeseries shards found in: {output_dir}")
+
+    for cur_atlas in atlas_list:
+        logger.info(f"Merging ROI timeseries shards for atlas: {cur_atlas}")
+        store_path = merge_roi_shards(
+            output_dir, cur_atlas, remove_shards=remove_shards
+        )
+        logger.info(f"ROI timeseries store written to: {store_path}")
+
+
 def get_available_atlases():
     with resource_stream(__name__, "data/atlasLibrary.json") as at_lib:
         atlas_library = json.load(at_lib)
@@ -410,9 +511,14 @@ def get_available_atlases():
         print("")
 
 
-def fmriprep_mask_finder(image_path, config: ProjectOptions, logger) -> os.PathLike:
+def fmriprep_mask_finder(
+    image_path, config: ProjectOptions, logger, mask_index: set = None
+) -> os.PathLike:
     """Search for a mask in the fmriprep output directory matching
-    the name of the image targeted for roi_extraction"""
+    the name of the image targeted for roi_extraction.
+
+    If mask_index is given, a mask is only considered to exist if its path is in
+    this set, avoiding a file system lookup for each image."""
 
     _, _, _, front_matter, type, path = _file_folder_generator(
         os.path.basename(image_path),
@@ -433,17 +539,74 @@ def fmriprep_mask_finder(image_path, config: ProjectOptions, logger) -> os.PathL
         fmriprep_dir, path + "_" + type + "_desc-brain_mask.nii.gz"
     )
     logger.debug(f"Target mask: {target_mask}")
-    if not os.path.exists(target_mask):
+    if mask_index is None:
+        mask_exists = os.path.exists
+    else:
+        # build_manifest stores absolute mask paths
+        def mask_exists(mask):
+            return os.path.abspath(mask) in mask_index
+
+    if not mask_exists(target_mask):
         logger.warn(f"No .nii.gz mask file found, searching for unzipped variant...")
         target_mask_unzipped = os.path.join(
             fmriprep_dir, path + "_" + type + "_desc-brain_mask.nii"
         )
-        if not os.path.exists(target_mask_unzipped):
+        if not mask_exists(target_mask_unzipped):
             raise MaskFileNotFoundError(f"No mask found on path: {target_mask}")
+        target_mask = target_mask_unzipped
     logger.debug(f"Found matching mask: {target_mask}")
     return target_mask
 
 
+def build_manifest(config: ProjectOptions, subjects: list, task: str = None) -> dict:
+    """Find the target images and fMRIPrep brain masks of each subject.
+
+    The target and fMRIPrep directories are each walked once, in parallel, so that
+    extraction jobs can be handed their file lists instead of searching the file
+    system themselves.
+
+    Returns a dict mapping each subject to a dict of its "images" and "masks".
+    """
+    target_dir = config.roi_extraction.target_directory
+    fmriprep_dir = resolve_fmriprep_dir(config.postprocessing.target_directory)
+
+    images = scan_files(
+        [os.path.join(target_dir, "sub-" + subject) for subject in subjects],
+        config.roi_extraction.target_suffix,
+    )
+    if task is not None:
+        images = [image for image in images if "task-" + task in image]
+    masks = scan_files(
+        [os.path.join(fmriprep_dir, "sub-" + subject) for subject in subjects],
+        MASK_SUFFIXES,
+    )
+
+    manifest = {subject: {"images": [], "masks": []} for subject in subjects}
+    for key, root, paths in [
+        ("images", target_dir, images),
+        ("masks", fmriprep_dir, masks),
+    ]:
+        for path in paths:
+            subject = Path(os.path.relpath(path, root)).parts[0].replace("sub-", "")
+            manifest[subject][key].append(os.path.abspath(path))
+
+    return manifest
+
+
+def get_subject_manifest(manifest: dict, subject: str, manifest_file=None) -> dict:
+    """Get a subject's images and masks from a manifest made by build_manifest.
+
+    Raises SubjectNotFoundError if the subject is not in the manifest, rather than
+    treating the subject as having no images."""
+    try:
+        return manifest[subject]
+    except KeyError:
+        source = f": {manifest_file}" if manifest_file else ""
+        raise SubjectNotFoundError(
+            f"Subject {subject} not found in image manifest{source}"
+        ) from None
+
+
 def setup_dirs(config: ProjectOptions):
     """Setup the directories necessary for ROI extraction's output."""
     
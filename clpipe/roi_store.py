@@ -0,0 +1,220 @@
+"""
+Binary storage for extracted ROI timeseries.
+
+Instead of writing one CSV per image, each ROI extraction job writes a single
+.npz shard holding every image it processed for one subject and atlas. Because
+each job owns its own shard, concurrent jobs never write to the same file. Once
+all jobs are finished, the shards are merged into one store per atlas, which can
+be read back as a (runs x time x ROI) array.
+"""
+
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .postprocutils.utils import strip_image_extension
+
+STORE_FORMAT_CSV = "csv"
+STORE_FORMAT_NPZ = "npz"
+STORE_FORMATS = [STORE_FORMAT_CSV, STORE_FORMAT_NPZ]
+
+SHARD_DIR_NAME = "shards"
+INDEX_FIELDS = ["image", "subject", "session", "task", "run"]
+
+ENTITY_PATTERNS = {
+    "subject": re.compile(r"(?:^|_)sub-([a-zA-Z0-9]+)"),
+    "session": re.compile(r"(?:^|_)ses-([a-zA-Z0-9]+)"),
+    "task": re.compile(r"(?:^|_)task-([a-zA-Z0-9]+)"),
+    "run": re.compile(r"(?:^|_)run-([a-zA-Z0-9]+)"),
+}
+
+
+def get_image_name(image_path: os.PathLike) -> str:
+    """Strip the directory and .nii/.nii.gz extension from an image path."""
+    return strip_image_extension(os.path.basename(str(image_path)))
+
+
+def parse_entities(image_name: str) -> dict:
+    """Pull the subject, session, task and run labels out of a BIDS file name.
+    Missing entities are returned as empty strings."""
+    entities = {}
+    for entity, pattern in ENTITY_PATTERNS.items():
+        match = pattern.search(image_name)
+        entities[entity] = match.group(1) if match else ""
+    return entities
+
+
+def build_record(
+    image_path: os.PathLike, timeseries: np.ndarray, voxel_prop: np.ndarray = None
+) -> dict:
+    """Package one image's ROI timeseries with its index fields for storage."""
+    image_name = get_image_name(image_path)
+    timeseries = np.atleast_2d(timeseries)
+    if voxel_prop is None:
+        voxel_prop = np.full(timeseries.shape[1], np.nan)
+
+    record = {"image": image_name, **parse_entities(image_name)}
+    record["timeseries"] = timeseries
+    record["voxel_prop"] = np.asarray(voxel_prop, dtype=np.float64)
+    return record
+
+
+def get_shard_path(output_dir: os.PathLike, atlas_name: str, subject: str) -> Path:
+    """Path of the shard written by the job for a given subject and atlas."""
+    return (
+        Path(output_dir)
+        / atlas_name
+        / SHARD_DIR_NAME
+        / f"sub-{subject}_atlas-{atlas_name}.npz"
+    )
+
+
+def get_store_path(output_dir: os.PathLike, atlas_name: str) -> Path:
+    """Path of the merged store for a given atlas."""
+    return Path(output_dir) / atlas_name / f"atlas-{atlas_name}_timeseries.npz"
+
+
+def read_records(store_path: os.PathLike) -> list:
+    """Read a shard or merged store back into a list of records.
+    Returns an empty list if the file does not exist."""
+    store_path = Path(store_path)
+    if not store_path.exists():
+        return []
+
+    with np.load(store_path, allow_pickle=False) as store:
+        index = {field: store[field] for field in INDEX_FIELDS}
+        timeseries = np.split(
+            store["timeseries"], np.cumsum(store["n_timepoints"])[:-1]
+        )
+        voxel_prop = store["voxel_prop"]
+
+    records = []
+    for i, run_timeseries in enumerate(timeseries):
+        record = {field: str(index[field][i]) for field in INDEX_FIELDS}
+        record["timeseries"] = run_timeseries
+        record["voxel_prop"] = voxel_prop[i]
+        records.append(record)
+    return records
+
+
+def write_records(store_path: os.PathLike, records: list):
+    """Write records to a shard or store.
+
+    The file is first written under a temporary name and then moved into place,
+    so readers never observe a partially written store.
+    """
+    if len(records) == 0:
+        raise ValueError(f"No ROI timeseries given to write to: {store_path}")
+
+    n_rois = {record["timeseries"].shape[1] for record in records}
+    if len(n_rois) > 1:
+        raise ValueError(
+            f"Records written to {store_path} have differing ROI counts: {n_rois}"
+        )
+
+    records = sorted(records, key=lambda record: record["image"])
+    arrays = {
+        field: np.array([record[field] for record in records]) for field in INDEX_FIELDS
+    }
+    arrays["n_timepoints"] = np.array(
+        [record["timeseries"].shape[0] for record in records], dtype=np.int64
+    )
+    arrays["timeseries"] = np.concatenate([record["timeseries"] for record in records])
+    arrays["voxel_prop"] = np.stack([record["voxel_prop"] for record in records])
+
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = store_path.with_name(f".{store_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as temp_file:
+        np.savez(temp_file, **arrays)
+    os.replace(temp_path, store_path)
+
+
+def stored_images(store_path: os.PathLike) -> set:
+    """Names of the images already present in a shard or store."""
+    store_path = Path(store_path)
+    if not store_path.exists():
+        return set()
+    with np.load(store_path, allow_pickle=False) as store:
+        return {str(image) for image in store["image"]}
+
+
+def write_roi_shard(shard_path: os.PathLike, records: list):
+    """Add records to a job's shard, replacing any images already stored."""
+    _write_merged(shard_path, read_records(shard_path), records)
+
+
+def merge_roi_shards(
+    output_dir: os.PathLike, atlas_name: str, remove_shards: bool = False
+) -> Path:
+    """Merge all shards of an atlas into its store, replacing any images already
+    present in the store. Returns the path of the store."""
+    store_path = get_store_path(output_dir, atlas_name)
+    shard_paths = sorted((store_path.parent / SHARD_DIR_NAME).glob("*.npz"))
+    if len(shard_paths) == 0:
+        raise FileNotFoundError(
+            f"No ROI timeseries shards found for atlas: {atlas_name}"
+        )
+
+    new_records = []
+    for shard_path in shard_paths:
+        new_records += read_records(shard_path)
+    _write_merged(store_path, read_records(store_path), new_records)
+
+    if remove_shards:
+        for shard_path in shard_paths:
+            shard_path.unlink()
+    return store_path
+
+
+def load_roi_timeseries(
+    store_path: os.PathLike,
+    subject: str = None,
+    session: str = None,
+    task: str = None,
+    run: str = None,
+):
+    """Load ROI timeseries from a merged store or shard.
+
+    Args:
+        store_path: Path to the .npz store.
+        subject, session, task, run: Optional labels to filter runs by.
+
+    Returns:
+        A (runs x time x ROI) array, with runs shorter than the longest run padded
+        at the end with NaN, and a DataFrame indexing the runs of the array,
+        including each run's number of timepoints.
+    """
+    filters = {"subject": subject, "session": session, "task": task, "run": run}
+    records = [
+        record
+        for record in read_records(store_path)
+        if all(
+            value is None or record[field] == str(value)
+            for field, value in filters.items()
+        )
+    ]
+
+    index = pd.DataFrame(
+        [{field: record[field] for field in INDEX_FIELDS} for record in records],
+        columns=INDEX_FIELDS,
+    )
+    index["n_timepoints"] = [record["timeseries"].shape[0] for record in records]
+
+    if len(records) == 0:
+        return np.empty((0, 0, 0)), index
+
+    n_rois = records[0]["timeseries"].shape[1]
+    data = np.full((len(records), index["n_timepoints"].max(), n_rois), np.nan)
+    for i, record in enumerate(records):
+        data[i, : record["timeseries"].shape[0]] = record["timeseries"]
+    return data, index
+
+
+def _write_merged(store_path: os.PathLike, old_records: list, new_records: list):
+    merged = {record["image"]: record for record in old_records}
+    merged.update({record["image"]: record for record in new_records})
+    write_records(store_path, list(merged.values()))
@@ -83,6 +83,54 @@ def resolve_fmriprep_dir(fmriprep_dir):
 
     return fmriprep_root
 
+def scan_files(roots, suffixes, max_workers: int = 8) -> list:
+    """Recursively find all files under the given directories whose names end with
+    one of the given suffixes.
+
+    Each directory is listed once with os.scandir, and listings are spread over a
+    thread pool. This is much faster than a recursive glob on network file systems,
+    where each directory listing has high latency. Roots which do not exist are
+    ignored. Returns a sorted list of paths.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+    if isinstance(suffixes, str):
+        suffixes = [suffixes]
+    suffixes = tuple(suffixes)
+
+    found = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(_scan_directory, os.fspath(root), suffixes)
+            for root in roots
+            if os.path.isdir(root)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, sub_dirs = future.result()
+                found += files
+                pending |= {
+                    executor.submit(_scan_directory, sub_dir, suffixes)
+                    for sub_dir in sub_dirs
+                }
+
+    return sorted(found)
+
+
+def _scan_directory(directory: str, suffixes: tuple):
+    files, sub_dirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                sub_dirs.append(entry.path)
+            elif entry.name.endswith(suffixes):
+                files.append(entry.path)
+    return files, sub_dirs
+
+
 def exception_handler(logger, exception_type, exception, traceback):
     logger.error("%s: %s" % (exception_type.__name__, exception))
 
@@ -0,0 +1,172 @@
+from clpipe.postprocutils.beta_series import highpass_filter, lss_betas
+import numpy as np
+import pytest
+
+
+def _lss_betas_pinv(data, events, confounds):
+    """Reference LSS, fitting one model per trial."""
+    betas = []
+    for trial in range(events.shape[1]):
+        design = np.column_stack(
+            [
+                events[:, trial],
+                events.sum(axis=1) - events[:, trial],
+                confounds,
+            ]
+        )
+        betas.append((np.linalg.pinv(design) @ data)[0])
+    return np.array(betas)
+
+
+def _highpass_matrix_loop(ntp, tr):
+    """Reference running-line filter, fitting a weighted line for each row."""
+    sigma_squared = ((100 / tr) / np.sqrt(2.0)) ** 2.0
+    lags = np.abs(np.subtract.outer(np.arange(ntp), np.arange(ntp)))
+    weights = np.exp(-(lags**2.0) / (2 * sigma_squared))
+    weights /= weights.sum(axis=1, keepdims=True)
+    design = np.column_stack([np.ones(ntp), np.arange(1, ntp + 1)])
+    smoothing = np.zeros((ntp, ntp))
+    for k in range(ntp):
+        w = np.diag(weights[k])
+        smoothing[k] = (design @ np.linalg.pinv(w @ design) @ w)[k]
+    return np.eye(ntp) - smoothing
+
+
+@pytest.fixture
+def lss_inputs():
+    rng = np.random.default_rng(0)
+    events = np.abs(rng.standard_normal((120, 15)))
+    confounds = np.column_stack([rng.standard_normal((120, 4)), np.ones(120)])
+    data = rng.standard_normal((120, 25))
+    return data, events, confounds
+
+
+def test_lss_betas(lss_inputs):
+    """Test that the closed-form LSS matches fitting each trial separately."""
+    data, events, confounds = lss_inputs
+
+    betas = lss_betas(data, events, confounds)
+
+    assert betas.shape == (15, 25)
+    assert np.allclose(betas, _lss_betas_pinv(data, events, confounds))
+
+
+def test_lss_betas_rank_deficient_confounds(lss_inputs):
+    """Test that duplicated confounds are handled as pinv would."""
+    data, events, confounds = lss_inputs
+    confounds = np.column_stack([confounds, 2 * confounds[:, 0]])
+
+    betas = lss_betas(data, events, confounds)
+
+    assert np.allclose(betas, _lss_betas_pinv(data, events, confounds))
+
+
+def test_lss_betas_single_trial(lss_inputs):
+    """Test that a single trial, with an empty 'other trials' regressor, matches
+    the minimum-norm solution."""
+    data, events, confounds = lss_inputs
+
+    betas = lss_betas(data, events[:, :1], confounds)
+
+    assert np.allclose(betas, _lss_betas_pinv(data, events[:, :1], confounds))
+
+
+@pytest.mark.parametrize("ntp,tr", [(60, 2.0), (150, 0.8)])
+def test_highpass_filter(ntp, tr):
+    """Test that the closed-form filter matches the per-row weighted line fits."""
+    data = np.random.default_rng(0).standard_normal((ntp, 3, 4))
+
+    filtered = highpass_filter(data, tr)
+
+    expected = np.tensordot(_highpass_matrix_loop(ntp, tr), data, axes=1)
+    assert filtered.shape == data.shape
+    assert np.allclose(filtered, expected)
+
+
+def test_beta_series_image(tmp_path, monkeypatch):
+    """Test that the beta series image is fit around scrubbed timepoints."""
+    import nibabel as nib
+    from clpipe.postprocutils.beta_series import beta_series_image, lss_betas
+    from clpipe.postprocutils.hrf import event_regressors
+
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    tr = 2.0
+    onsets = np.arange(4, 180, 12.0)
+    trial_betas = rng.uniform(1, 3, onsets.size)
+
+    regressors = event_regressors(onsets, np.ones(onsets.size), 100, tr)
+    data = 100 + regressors @ trial_betas + 0.01 * rng.standard_normal((2, 2, 2, 100))
+    data[..., 50] = np.nan
+    nib.save(nib.Nifti1Image(data, np.eye(4)), tmp_path / "sub-1_bold.nii.gz")
+
+    events_file = tmp_path / "events.tsv"
+    events_file.write_text(
+        "onset\tduration\n" + "".join(f"{onset}\t1\n" for onset in onsets)
+    )
+
+    out_file = beta_series_image(tmp_path / "sub-1_bold.nii.gz", events_file, tr)
+
+    betas = nib.load(out_file).get_fdata()
+    assert out_file.endswith("sub-1_bold_betaseries.nii.gz")
+    assert betas.shape == (2, 2, 2, onsets.size)
+
+    kept = np.arange(100) != 50
+    expected = lss_betas(
+        data[0, 0, 0, kept][:, np.newaxis], regressors[kept], np.ones((99, 1))
+    )
+    assert np.allclose(betas[0, 0, 0], expected[:, 0], atol=1e-3)
+    assert np.corrcoef(betas[0, 0, 0], trial_betas)[0, 1] > 0.9
+
+
+def test_beta_series_image_filtered(tmp_path, monkeypatch):
+    """Test that the trial regressors get the same filter as the image."""
+    import nibabel as nib
+    from clpipe.postprocutils.beta_series import beta_series_image, lss_betas
+    from clpipe.postprocutils.confounds_native import temporal_filter
+    from clpipe.postprocutils.hrf import event_regressors
+
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    tr = 2.0
+    onsets = np.arange(4, 180, 12.0)
+    trial_betas = rng.uniform(1, 3, onsets.size)
+    filter_options = {
+        "implementation": "Butterworth",
+        "hp": 0.01,
+        "lp": -1,
+        "order": 2,
+        "before_trim": True,
+        "censor": False,
+    }
+
+    regressors = event_regressors(onsets, np.ones(onsets.size), 100, tr)
+    data = 100 + regressors @ trial_betas + 0.01 * rng.standard_normal((2, 2, 2, 100))
+    data = np.moveaxis(
+        temporal_filter(np.moveaxis(data, 3, 0).reshape(100, -1), tr, filter_options)
+        .reshape(100, 2, 2, 2),
+        0,
+        3,
+    )
+    nib.save(nib.Nifti1Image(data, np.eye(4)), tmp_path / "sub-1_bold.nii.gz")
+
+    events_file = tmp_path / "events.tsv"
+    events_file.write_text(
+        "onset\tduration\n" + "".join(f"{onset}\t1\n" for onset in onsets)
+    )
+
+    out_file = beta_series_image(
+        tmp_path / "sub-1_bold.nii.gz",
+        events_file,
+        tr,
+        temporal_filter_options=filter_options,
+    )
+
+    betas = nib.load(out_file).get_fdata()
+    expected = lss_betas(
+        data[0, 0, 0][:, np.newaxis],
+        temporal_filter(regressors, tr, filter_options),
+        np.ones((100, 1)),
+    )
+    assert np.allclose(betas[0, 0, 0], expected[:, 0], atol=1e-3)
+    assert np.corrcoef(betas[0, 0, 0], trial_betas)[0, 1] > 0.9
@@ -0,0 +1,56 @@
+from clpipe.postprocutils.bptf import bptf, bptf_sigmas
+import numpy as np
+import pytest
+
+
+def _bptf_loop(array, hp_sigma, lp_sigma):
+    """Reference filter, following the loops of FSL's bandpass_temporal_filter."""
+    array = array.astype(np.float64).copy()
+    n = array.size
+
+    if hp_sigma > 0:
+        half_width = int(hp_sigma * 3)
+        filtered = np.empty(n)
+        for t in range(n):
+            a = b = c = d = total = 0.0
+            for tt in range(max(t - half_width, 0), min(t + half_width, n - 1) + 1):
+                dt = tt - t
+                w = np.exp(-0.5 * dt * dt / (hp_sigma * hp_sigma))
+                a += w * dt
+                b += w * array[tt]
+                c += w * dt * dt
+                d += w * dt * array[tt]
+                total += w
+            denom = c * total - a * a
+            filtered[t] = array[t] - (b * c - a * d) / denom if denom else array[t]
+        array = filtered
+
+    if lp_sigma > 0:
+        half_width = int(lp_sigma * 20) + 2
+        kernel = np.exp(
+            -0.5 * np.arange(-half_width, half_width + 1) ** 2 / lp_sigma**2
+        )
+        kernel /= kernel.sum()
+        filtered = np.empty(n)
+        for t in range(n):
+            filtered[t] = sum(
+                array[tt] * kernel[tt - t + half_width]
+                for tt in range(max(t - half_width, 0), min(t + half_width, n - 1) + 1)
+            )
+        array = filtered
+
+    return array
+
+
+@pytest.mark.parametrize("hp,lp", [(0.008, -1), (0.01, 0.1), (-1, 0.08)])
+def test_bptf(hp, lp):
+    """Test that the filter matches fslmaths' loops, for each voxel."""
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((150, 4)).cumsum(axis=0)
+    hp_sigma, lp_sigma = bptf_sigmas(hp, lp, 2.0)
+
+    filtered = bptf(data, hp_sigma, lp_sigma)
+
+    for voxel in range(data.shape[1]):
+        expected = _bptf_loop(data[:, voxel], hp_sigma, lp_sigma)
+        assert np.allclose(filtered[:, voxel], expected)
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from clpipe.config.options import ProjectOptions
+from clpipe.postprocutils.confounds_native import (
+    process_confounds,
+    regress_aroma_components,
+)
+from clpipe.postprocutils.confounds_workflows import (
+    build_confounds_processing_workflow,
+)
+from clpipe.postprocutils.spec_interpolate import spec_inter
+from clpipe.postprocutils.utils import apply_filter, calc_filter
+
+MOTION_OUTLIERS = {
+    "target_variable": "framewise_displacement",
+    "threshold": 0.5,
+    "scrub_ahead": 0,
+    "scrub_behind": 0,
+    "scrub_contiguous": 0,
+}
+
+
+@pytest.fixture
+def confounds_df():
+    rng = np.random.default_rng(0)
+    confounds_df = pd.DataFrame(
+        {
+            "csf": rng.standard_normal(20),
+            "csf_derivative1": rng.standard_normal(20),
+            "white_matter": rng.standard_normal(20),
+            "framewise_displacement": np.full(20, 0.1),
+        }
+    )
+    confounds_df.loc[0, "csf_derivative1"] = np.nan
+    confounds_df.loc[[3, 12], "framewise_displacement"] = 1.0
+    return confounds_df
+
+
+def test_process_confounds_prep(confounds_df):
+    """Test that columns are expanded, missing values are replaced with the
+    column mean and motion outliers are appended."""
+    processed_df = process_confounds(
+        confounds_df, ["csf*", "white_matter"], motion_outliers=MOTION_OUTLIERS
+    )
+
+    assert list(processed_df.columns) == [
+        "csf",
+        "csf_derivative1",
+        "white_matter",
+        "motion_outlier_1",
+        "motion_outlier_2",
+    ]
+    assert processed_df.loc[0, "csf_derivative1"] == pytest.approx(
+        confounds_df["csf_derivative1"].mean()
+    )
+    assert np.flatnonzero(processed_df["motion_outlier_1"]).tolist() == [3]
+    assert np.flatnonzero(processed_df["motion_outlier_2"]).tolist() == [12]
+
+
+def test_process_confounds_filter_trim_scrub(confounds_df):
+    """Test that steps are applied in order along time, and motion outliers stay
+    aligned with the remaining timepoints."""
+    scrub_vector = [0] * 20
+    scrub_vector[5] = 1
+    step_options = {
+        "TemporalFiltering": {"hp": 0.01, "lp": -1, "order": 2},
+        "TrimTimepoints": {"from_beginning": 4, "from_end": 2},
+        "ScrubTimepoints": {"insert_na": False},
+    }
+
+    processed_df = process_confounds(
+        confounds_df,
+        ["csf"],
+        processing_steps=["TemporalFiltering", "ScrubTimepoints", "TrimTimepoints"],
+        step_options=step_options,
+        tr=2.0,
+        scrub_vector=scrub_vector,
+        motion_outliers=MOTION_OUTLIERS,
+    )
+
+    filtered = apply_filter(
+        calc_filter(0.01, -1, 2.0, 2), confounds_df[["csf"]].to_numpy()
+    )
+    expected = np.delete(filtered, 5, axis=0)[4:-2]
+    assert np.allclose(processed_df["csf"], expected[:, 0])
+    # The outlier at timepoint 3 was trimmed, and 12 is now row 7
+    assert list(processed_df.columns) == ["csf", "motion_outlier_1"]
+    assert np.flatnonzero(processed_df["motion_outlier_1"]).tolist() == [7]
+
+
+def test_process_confounds_interpolate(confounds_df):
+    """Test that interpolation keeps every timepoint, replacing the scrubbed ones."""
+    scrub_vector = [0] * 20
+    scrub_vector[5] = 1
+    step_options = {
+        "ScrubTimepoints": {
+            "insert_na": True,
+            "interpolate": True,
+            "oversampling_freq": 8,
+            "percent_freq_sample": 1.0,
+        },
+    }
+
+    processed_df = process_confounds(
+        confounds_df,
+        ["white_matter"],
+        processing_steps=["ScrubTimepoints"],
+        step_options=step_options,
+        tr=2.0,
+        scrub_vector=scrub_vector,
+    )
+
+    expected = spec_inter(
+        confounds_df[["white_matter"]].to_numpy(), 2.0, 8, scrub_vector, 1.0, 1
+    )
+    assert len(processed_df) == 20
+    assert np.allclose(processed_df["white_matter"], expected[:, 0], rtol=1e-5)
+    assert processed_df.loc[5, "white_matter"] != confounds_df.loc[5, "white_matter"]
+
+
+def test_process_confounds_projection_filter(confounds_df):
+    """Test that the projection filter leaves later scrubbed timepoints out of
+    its fit."""
+    scrub_vector = [0] * 20
+    scrub_vector[5] = 1
+    step_options = {
+        "TemporalFiltering": {
+            "implementation": "Projection",
+            "hp": 0.05,
+            "lp": -1,
+            "order": 2,
+        },
+        "ScrubTimepoints": {"insert_na": False},
+    }
+    spiked_df = confounds_df.copy()
+    spiked_df.loc[5, "csf"] += 100
+
+    processed = [
+        process_confounds(
+            df,
+            ["csf"],
+            processing_steps=["TemporalFiltering", "ScrubTimepoints"],
+            step_options=step_options,
+            tr=2.0,
+            scrub_vector=scrub_vector,
+        )
+        for df in (confounds_df, spiked_df)
+    ]
+
+    assert len(processed[0]) == 19
+    assert np.allclose(processed[0]["csf"], processed[1]["csf"])
+
+
+def test_regress_aroma_components():
+    """Test that only the noise components' partial fit is removed."""
+    rng = np.random.default_rng(0)
+    mixing = rng.standard_normal((50, 4))
+    signal = rng.standard_normal((50, 1))
+    data = np.column_stack([mixing @ [1.0, 2.0, 3.0, 4.0], np.full(50, 7.0)])
+    data[:, :1] += 0.1 * signal
+
+    regressed = regress_aroma_components(data, mixing, [2, 4])
+
+    betas, _, _, _ = np.linalg.lstsq(mixing, data[:, 0], rcond=None)
+    assert np.allclose(regressed[:, 0], data[:, 0] - mixing[:, [1, 3]] @ betas[[1, 3]])
+    # Constant columns are left unchanged
+    assert np.all(regressed[:, 1] == 7.0)
+
+
+def test_build_confounds_processing_workflow_native(
+    sample_confounds_timeseries, tmp_path
+):
+    """Test that the native engine runs as a single node and exports the file."""
+    postprocessing_config = ProjectOptions().postprocessing
+    postprocessing_config.processing_steps = ["TemporalFiltering", "TrimTimepoints"]
+    step_options = postprocessing_config.processing_step_options
+    step_options.temporal_filtering.implementation = "Butterworth"
+    step_options.trim_timepoints.from_beginning = 2
+    out_path = tmp_path / "postprocessed.tsv"
+
+    wf = build_confounds_processing_workflow(
+        postprocessing_config,
+        confounds_file=sample_confounds_timeseries,
+        export_file=out_path,
+        tr=2,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    assert "process_confounds" in wf.list_node_names()
+    processed_df = pd.read_csv(out_path, sep="\t")
+    original_df = pd.read_csv(sample_confounds_timeseries, sep="\t")
+    assert len(processed_df) == len(original_df) - 2
+    assert "csf" in processed_df.columns
@@ -217,5 +217,24 @@ def test_prepare_confounds_aroma(
     cf_workflow.run()
 
 
-def test_build_confounds_add_motion_outliers_workflow():
-    pass
+def test_build_confounds_add_motion_outliers_workflow(
+    sample_confounds_timeseries, tmp_path
+):
+    """Test that motion outlier columns are appended to the confounds."""
+    confounds_df = pd.read_csv(sample_confounds_timeseries, sep="\t")
+    scrub_vector = [0] * len(confounds_df)
+    scrub_vector[1] = 1
+    scrub_vector[3] = 1
+
+    wf = build_confounds_add_motion_outliers_workflow(
+        confounds_file=sample_confounds_timeseries,
+        scrub_vector=scrub_vector,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    out_file = next(tmp_path.glob("motion_outliers_wf/combine_confounds/*.tsv"))
+    combined_df = pd.read_csv(out_file, sep="\t")
+    assert list(combined_df.columns[-2:]) == ["motion_outlier_1", "motion_outlier_2"]
+    assert combined_df["motion_outlier_2"].to_numpy().nonzero()[0].tolist() == [3]
+    assert len(combined_df.columns) == len(confounds_df.columns) + 2
@@ -338,6 +338,53 @@ def test_postprocess2_wf_scrubbing(
     helpers.plot_4D_img_slice(out_path, "postprocessed.png")
 
 
+def test_postprocess2_wf_qc(
+    artifact_dir,
+    request,
+    sample_raw_image,
+    sample_raw_image_mask,
+    sample_confounds_timeseries,
+    helpers,
+):
+    """Test that QC metrics are saved from the input and postprocessed image."""
+    import json
+
+    postprocessing_config = ProjectOptions().postprocessing
+    postprocessing_config.processing_steps = ["TemporalFiltering", "ScrubTimepoints"]
+    postprocessing_config.processing_step_options.temporal_filtering.implementation = (
+        "fslmaths_native"
+    )
+    postprocessing_config.processing_step_options.scrub_timepoints.scrub_columns = [
+        ScrubColumn(target_variable="csf", threshold=332.44),
+    ]
+    postprocessing_config.qc_options.include = True
+    postprocessing_config.qc_options.carpet_rows = 100
+
+    test_path = helpers.create_test_dir(artifact_dir, request.node.name)
+    out_path = test_path / "postprocessed_image.nii.gz"
+    qc_path = test_path / "postprocessed_image_qc.json"
+
+    wf = build_postprocessing_wf(
+        postprocessing_config,
+        image_file=sample_raw_image,
+        image_export_path=out_path,
+        tr=2,
+        mask_file=sample_raw_image_mask,
+        confounds_file=sample_confounds_timeseries,
+        qc_export_path=qc_path,
+        base_dir=test_path,
+        crashdump_dir=test_path,
+    )
+    wf.run()
+
+    with open(qc_path) as qc_file:
+        qc = json.load(qc_file)
+    assert qc["n_scrubbed"] > 0
+    assert qc["n_volumes_after"] == qc["n_volumes_before"]
+    assert qc["mean_tsnr_after"] != qc["mean_tsnr_before"]
+    assert (test_path / "postprocessed_image_qc.npz").exists()
+
+
 @pytest.mark.skip("Test runs long")
 def test_postprocess2_wf_scrubbing_aroma(
     artifact_dir,
@@ -0,0 +1,48 @@
+from clpipe.postprocutils.hrf import event_regressors, spm_hrf
+import numpy as np
+
+TR = 2.0
+N_TIMEPOINTS = 150
+OVERSAMPLING = 16
+
+
+def _event_regressors_convolve(onsets, durations, amplitudes):
+    """Reference regressors, convolving each oversampled boxcar with the HRF."""
+    dt = TR / OVERSAMPLING
+    n_samples = N_TIMEPOINTS * OVERSAMPLING
+    hrf = spm_hrf(dt)
+    regressors = np.zeros((N_TIMEPOINTS, len(onsets)))
+    for i, (onset, duration, amplitude) in enumerate(
+        zip(onsets, durations, amplitudes)
+    ):
+        signal = np.zeros(n_samples)
+        start = int(round(onset / dt))
+        stop = max(start + 1, int(round((onset + duration) / dt)))
+        signal[start:stop] = amplitude
+        regressors[:, i] = np.convolve(signal, hrf)[:n_samples:OVERSAMPLING]
+    return regressors
+
+
+def test_event_regressors():
+    """Test that regressors match convolving each boxcar, including zero-length
+    events and events running past the end of the run."""
+    rng = np.random.default_rng(0)
+    onsets = np.append(rng.uniform(0, TR * N_TIMEPOINTS, 30), 295.0)
+    durations = np.append(rng.uniform(0, 5, 30), 10.0)
+    durations[0] = 0
+    amplitudes = rng.uniform(-1, 2, 31)
+
+    regressors = event_regressors(onsets, durations, N_TIMEPOINTS, TR, amplitudes)
+
+    expected = _event_regressors_convolve(onsets, durations, amplitudes)
+    assert regressors.shape == (N_TIMEPOINTS, 31)
+    assert np.allclose(regressors, expected)
+
+
+def test_event_regressors_cached_copy():
+    """Test that modifying returned regressors doesn't affect later calls."""
+    regressors = event_regressors([10.0], [2.0], N_TIMEPOINTS, TR)
+    expected = regressors.copy()
+    regressors[:] = 0
+
+    assert np.array_equal(event_regressors([10.0], [2.0], N_TIMEPOINTS, TR), expected)
@@ -390,6 +390,36 @@ def test_scrubbing_wf(artifact_dir, sample_raw_image, plot_img, request, helpers
         helpers.plot_4D_img_slice(scrubbed_path, "scrubbed.png")
 
 
+def test_scrubbing_wf_interpolate(artifact_dir, sample_raw_image, request, helpers):
+    """Test that interpolation replaces only the scrubbed timepoints."""
+
+    test_path = helpers.create_test_dir(artifact_dir, request.node.name)
+    interpolated_path = test_path / "interpolated.nii.gz"
+
+    scrub_vector = [0, 1, 0, 0, 0, 0, 1, 0, 0, 0]
+
+    wf = build_scrubbing_workflow(
+        scrub_vector,
+        interpolate=True,
+        tr=2.0,
+        import_path=sample_raw_image,
+        export_path=interpolated_path,
+        base_dir=test_path,
+        crashdump_dir=test_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+    import numpy as np
+
+    raw_data = nib.load(sample_raw_image).get_fdata()
+    interpolated_data = nib.load(interpolated_path).get_fdata()
+    kept = [i for i, scrub in enumerate(scrub_vector) if not scrub]
+    assert interpolated_data.shape == raw_data.shape
+    assert np.allclose(interpolated_data[..., kept], raw_data[..., kept], rtol=1e-6)
+    assert not np.allclose(interpolated_data[..., 1], raw_data[..., 1])
+
+
 def test_scrubbing_wf_first_timepoint(artifact_dir, sample_raw_image, plot_img, request, helpers):
     """Test that the specific case of a first timepoint being scrubbed works"""
 
@@ -528,3 +558,255 @@ def test_scrubbing_wf_aroma(artifact_dir, sample_melodic_mixing, request, helper
         crashdump_dir=test_path,
     )
     wf.run()
+
+
+def test_beta_series_wf(
+    artifact_dir, sample_raw_image, sample_raw_image_mask, request, helpers
+):
+    """Test that a beta series with one volume per used trial is estimated."""
+    import nibabel as nib
+
+    test_path = helpers.create_test_dir(artifact_dir, request.node.name)
+    beta_series_path = test_path / "sub-1_task-test_betaseries_bold.nii.gz"
+
+    events_file = test_path / "sub-1_task-test_events.tsv"
+    events_file.write_text(
+        "onset\tduration\ttrial_type\n"
+        "0\t2\tgo\n"
+        "6\t2\tstop\n"
+        "10\t2\tgo\n"
+        "14\t2\tgo\n"
+    )
+
+    wf = build_beta_series_workflow(
+        events_file=events_file,
+        tr=2,
+        in_file=sample_raw_image,
+        mask_file=sample_raw_image_mask,
+        exclude_trial_types=["stop"],
+        events_export_path=test_path / "used_events.tsv",
+        base_dir=test_path,
+        crashdump_dir=test_path,
+    )
+    export_node = pe.Node(
+        ExportFile(out_file=beta_series_path, clobber=True), name="export"
+    )
+    wf.connect(wf.get_node("outputnode"), "out_file", export_node, "in_file")
+
+    wf.run()
+
+    beta_series = nib.load(beta_series_path)
+    assert beta_series.shape == nib.load(sample_raw_image).shape[:3] + (3,)
+    assert (test_path / "used_events.tsv").read_text().count("go") == 3
+
+
+def test_beta_series_after_unsupported_filter(sample_raw_image, tmp_path):
+    """Test that BetaSeries rejects a filter it cannot apply to its regressors."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = ["TemporalFiltering", "BetaSeries"]
+    step_options = postprocessing_config.processing_step_options
+    step_options.temporal_filtering.implementation = "afni_3dTproject"
+    events_file = tmp_path / "events.tsv"
+    events_file.write_text("onset\tduration\n0\t2\n")
+
+    with pytest.raises(ValueError):
+        build_image_postprocessing_workflow(
+            postprocessing_config,
+            in_file=sample_raw_image,
+            events_file=events_file,
+            tr=2,
+            base_dir=tmp_path,
+        )
+
+
+def test_postprocess_projection_wf(
+    sample_raw_image, sample_postprocessed_confounds, tmp_path
+):
+    """Test that projection regresses confounds and filters in a single step."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = [
+        "TemporalFiltering",
+        "ConfoundRegression",
+    ]
+    step_options = postprocessing_config.processing_step_options
+    step_options.confound_regression.implementation = "Projection"
+    step_options.temporal_filtering.implementation = "Projection"
+    step_options.temporal_filtering.filtering_high_pass = 0.05
+    out_path = tmp_path / "projected.nii.gz"
+
+    wf = build_image_postprocessing_workflow(
+        postprocessing_config,
+        in_file=sample_raw_image,
+        export_path=out_path,
+        confounds_file=sample_postprocessed_confounds,
+        tr=2,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+
+    assert not any("TemporalFiltering" in node for node in wf.list_node_names())
+    assert nib.load(out_path).shape == nib.load(sample_raw_image).shape
+
+
+def test_postprocess_projection_butterworth_wf(
+    sample_raw_image, sample_postprocessed_confounds, tmp_path
+):
+    """Test that projection keeps a separate Butterworth filtering step."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = [
+        "TemporalFiltering",
+        "ConfoundRegression",
+    ]
+    step_options = postprocessing_config.processing_step_options
+    step_options.confound_regression.implementation = "Projection"
+    step_options.temporal_filtering.implementation = "Butterworth"
+    step_options.temporal_filtering.filtering_high_pass = 0.05
+    out_path = tmp_path / "projected.nii.gz"
+
+    wf = build_image_postprocessing_workflow(
+        postprocessing_config,
+        in_file=sample_raw_image,
+        export_path=out_path,
+        confounds_file=sample_postprocessed_confounds,
+        tr=2,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+
+    assert any("TemporalFiltering" in node for node in wf.list_node_names())
+    assert nib.load(out_path).shape == nib.load(sample_raw_image).shape
+
+
+def test_postprocess_projection_filter_wf_censor(sample_raw_image, tmp_path):
+    """Test that the projection filter receives the scrub vector."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = ["TemporalFiltering", "ScrubTimepoints"]
+    step_options = postprocessing_config.processing_step_options
+    step_options.temporal_filtering.implementation = "Projection"
+    step_options.temporal_filtering.filtering_high_pass = 0.05
+    out_path = tmp_path / "filtered.nii.gz"
+
+    wf = build_image_postprocessing_workflow(
+        postprocessing_config,
+        in_file=sample_raw_image,
+        export_path=out_path,
+        scrub_vector=[0, 0, 0, 1, 0, 0, 0, 0, 0, 0],
+        tr=2,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+    import numpy as np
+
+    filtered = nib.load(out_path).get_fdata()
+    assert filtered.shape == nib.load(sample_raw_image).shape
+    assert np.isnan(filtered[..., 3]).all()
+
+
+def test_native_fslmath_temporal_filter(sample_raw_image, tmp_path):
+    """Test that the native fslmaths filter adds each voxel's mean back."""
+    out_path = tmp_path / "filtered.nii.gz"
+
+    wf = build_native_fslmath_temporal_filter(
+        hp=0.1, lp=-1, tr=2, base_dir=tmp_path
+    )
+    wf.inputs.inputnode.in_file = sample_raw_image
+    wf.inputs.inputnode.out_file = out_path
+    wf.run()
+
+    import nibabel as nib
+    import numpy as np
+
+    from clpipe.postprocutils.bptf import bptf, bptf_sigmas
+
+    raw_data = nib.load(sample_raw_image).get_fdata()
+    filtered = nib.load(out_path).get_fdata()
+    expected = np.moveaxis(
+        bptf(np.moveaxis(raw_data, 3, 0), *bptf_sigmas(0.1, -1, 2)), 0, 3
+    )
+    expected += raw_data.mean(axis=3, keepdims=True)
+    assert np.allclose(filtered, expected, atol=1e-3)
+
+
+def test_native_resample_wf(sample_raw_image, tmp_path):
+    """Test that the native resample workflow caches its mapping."""
+    import nibabel as nib
+
+    reference = nib.load(sample_raw_image).slicer[::2, ::2, ::2, 0]
+    reference_path = tmp_path / "reference.nii.gz"
+    nib.save(reference, reference_path)
+    out_path = tmp_path / "resampled.nii.gz"
+
+    wf = build_native_resample_workflow(
+        reference_image=reference_path,
+        cache_dir=tmp_path / "cache",
+        in_file=sample_raw_image,
+        out_file=out_path,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    assert nib.load(out_path).shape == reference.shape[:3] + (10,)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+
+def test_postprocess_selection_fused(
+    sample_raw_image, sample_raw_image_mask, tmp_path
+):
+    """Test that adjacent trimming, scrubbing and masking run as one node."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = [
+        "TrimTimepoints",
+        "ScrubTimepoints",
+        "ApplyMask",
+    ]
+    step_options = postprocessing_config.processing_step_options
+    step_options.trim_timepoints.from_beginning = 2
+    step_options.scrub_timepoints.insert_na = False
+    out_path = tmp_path / "selected.nii.gz"
+
+    wf = build_image_postprocessing_workflow(
+        postprocessing_config,
+        in_file=sample_raw_image,
+        export_path=out_path,
+        mask_file=sample_raw_image_mask,
+        scrub_vector=[0, 1, 0, 0, 0, 0, 0, 0],
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+
+    assert len([node for node in wf.list_node_names() if "select_image" in node]) == 1
+    assert nib.load(out_path).shape[3] == 7
+
+
+def test_postprocess_int16_output(sample_raw_image, tmp_path):
+    """Test that only the output is converted to scaled int16."""
+    postprocessing_config = PostProcessingOptions()
+    postprocessing_config.processing_steps = ["TrimTimepoints"]
+    postprocessing_config.processing_step_options.trim_timepoints.from_beginning = 2
+    postprocessing_config.dtype = "int16"
+    out_path = tmp_path / "trimmed.nii.gz"
+
+    wf = build_image_postprocessing_workflow(
+        postprocessing_config,
+        in_file=sample_raw_image,
+        export_path=out_path,
+        base_dir=tmp_path,
+    )
+    wf.run()
+
+    import nibabel as nib
+    import numpy as np
+
+    output = nib.load(out_path)
+    assert output.get_data_dtype() == np.int16
+    expected = nib.load(sample_raw_image).get_fdata()[..., 2:]
+    tolerance = np.abs(expected).max() / 2**14
+    assert np.allclose(output.get_fdata(), expected, atol=tolerance)
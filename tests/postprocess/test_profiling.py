@@ -0,0 +1,70 @@
+from clpipe.postprocutils.profiling import (
+    NodeProfiler,
+    load_profiles,
+    summarize_profiles,
+    write_profile,
+)
+import nipype.pipeline.engine as pe
+from nipype.interfaces.utility import Function
+import pytest
+
+
+def _allocate(size):
+    # Imports must be in function for running as node
+    import numpy as np
+
+    return float(np.ones(size).sum())
+
+
+def _build_workflow(name, base_dir):
+    workflow = pe.Workflow(name=name, base_dir=base_dir)
+    for node_name, size in (("small", 10), ("large", 5_000_000)):
+        node = pe.Node(
+            Function(input_names=["size"], output_names=["total"], function=_allocate),
+            name=node_name,
+        )
+        node.inputs.size = size
+        workflow.add_nodes([node])
+    return workflow
+
+
+def test_node_profiler(tmp_path):
+    """Test that every node of a run is recorded."""
+    profiler = NodeProfiler(sample_interval=0.01)
+
+    _build_workflow("sub_1", tmp_path).run(
+        plugin="Linear", plugin_args={"status_callback": profiler}
+    )
+
+    records = {record["node"]: record for record in profiler.records}
+    assert set(records) == {"sub_1.small", "sub_1.large"}
+    for record in records.values():
+        assert record["status"] == "end"
+        assert record["wall_time"] > 0
+        assert record["cpu_time"] >= 0
+        assert record["peak_rss_mb"] > 0
+    # The large node holds a 40MB array
+    assert records["sub_1.large"]["peak_rss_mb"] > 40
+
+
+def test_summarize_profiles(tmp_path):
+    """Test that profiles are matched across images by step."""
+    for image in ("sub_1", "sub_2"):
+        profiler = NodeProfiler()
+        _build_workflow(image, tmp_path).run(
+            plugin="Linear", plugin_args={"status_callback": profiler}
+        )
+        log_dir = tmp_path / "logs" / image
+        log_dir.mkdir(parents=True)
+        write_profile(profiler, log_dir / f"{image}_profile.json", image=image)
+
+    profiles = load_profiles(tmp_path / "logs")
+    summary = summarize_profiles(profiles)
+
+    assert len(profiles) == 4
+    assert set(summary.index) == {"small", "large"}
+    assert summary["runs"].tolist() == [2, 2]
+    assert summary["wall_time_share"].sum() == pytest.approx(1)
+    assert summary.loc["large", "total_wall_time"] == pytest.approx(
+        profiles.loc[profiles["node"].str.endswith("large"), "wall_time"].sum()
+    )
@@ -0,0 +1,84 @@
+from clpipe.postprocutils.projection import (
+    filter_matrix,
+    projection_matrix,
+    stopband_regressors,
+)
+import numpy as np
+
+TR = 2.0
+N_TIMEPOINTS = 120
+
+
+def test_projection_matrix_filter_and_regress():
+    """Test that the stopband and confounds are removed together, matching a
+    least squares fit of all regressors at once."""
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((N_TIMEPOINTS, 30))
+    confounds = rng.standard_normal((N_TIMEPOINTS, 4))
+
+    projection = projection_matrix(N_TIMEPOINTS, TR, 0.01, 0.1, confounds)
+
+    design = np.column_stack(
+        [
+            np.polynomial.legendre.legvander(np.linspace(-1, 1, N_TIMEPOINTS), 2),
+            stopband_regressors(N_TIMEPOINTS, TR, 0.01, 0.1),
+            confounds,
+        ]
+    )
+    betas, _, _, _ = np.linalg.lstsq(design, data, rcond=None)
+    assert np.allclose(projection @ data, data - design @ betas)
+
+    # Only passband frequencies are left
+    residual_spectrum = np.abs(np.fft.rfft(projection @ data, axis=0))
+    freqs = np.fft.rfftfreq(N_TIMEPOINTS, TR)
+    stopband = (freqs < 0.01) | (freqs > 0.1)
+    assert np.allclose(residual_spectrum[stopband], 0, atol=1e-8)
+    assert np.allclose(projection @ confounds, 0, atol=1e-8)
+
+
+def test_projection_matrix_censor():
+    """Test that censored timepoints are left out of the fit."""
+    rng = np.random.default_rng(1)
+    data = rng.standard_normal((N_TIMEPOINTS, 5))
+    confounds = rng.standard_normal((N_TIMEPOINTS, 2))
+    censor = np.zeros(N_TIMEPOINTS, dtype=int)
+    censor[[3, 50, 51]] = 1
+    data[censor == 1] = 1000
+
+    projected = (
+        projection_matrix(N_TIMEPOINTS, confounds=confounds, censor=censor, polort=0)
+        @ data
+    )
+
+    kept = censor == 0
+    design = np.column_stack([np.ones(N_TIMEPOINTS), confounds])[kept]
+    betas, _, _, _ = np.linalg.lstsq(design, data[kept], rcond=None)
+    assert np.allclose(projected[kept], data[kept] - design @ betas)
+    assert np.allclose(projected[~kept], 0)
+
+
+def test_filter_matrix_ideal():
+    """Test that without censoring, the filter zeroes the stopband of the FFT."""
+    rng = np.random.default_rng(2)
+    data = rng.standard_normal((N_TIMEPOINTS, 3))
+
+    filtered = filter_matrix(N_TIMEPOINTS, TR, 0.01, 0.1) @ data
+
+    spectrum = np.fft.rfft(data, axis=0)
+    freqs = np.fft.rfftfreq(N_TIMEPOINTS, TR)
+    spectrum[((freqs < 0.01) & (freqs > 0)) | (freqs > 0.1)] = 0
+    assert np.allclose(filtered, np.fft.irfft(spectrum, N_TIMEPOINTS, axis=0))
+
+
+def test_filter_matrix_censor():
+    """Test that censored timepoints don't affect the kept timepoints."""
+    rng = np.random.default_rng(3)
+    data = rng.standard_normal((N_TIMEPOINTS, 3))
+    censor = np.zeros(N_TIMEPOINTS, dtype=int)
+    censor[[10, 11, 60]] = 1
+    spiked = data.copy()
+    spiked[censor == 1] += 500
+
+    matrix = filter_matrix(N_TIMEPOINTS, TR, 0.02, censor=censor)
+
+    assert np.allclose(matrix @ spiked, matrix @ data + spiked - data)
@@ -0,0 +1,155 @@
+import json
+
+import numpy as np
+import pytest
+
+from clpipe.postprocutils.qc import (
+    QC_ARRAYS_SUFFIX,
+    QC_SUFFIX,
+    TimeseriesAccumulator,
+    accumulate_image,
+    load_qc,
+    qc_image,
+)
+
+
+@pytest.fixture
+def timeseries():
+    rng = np.random.default_rng(0)
+    data = rng.normal(100, 5, (4, 5, 3, 25))
+    mask = np.zeros(data.shape[:3], dtype=bool)
+    mask[1:3, 1:4, :] = True
+    return data, mask
+
+
+def _accumulate(data, mask, block_volumes, carpet_rows=1000):
+    accumulator = TimeseriesAccumulator(mask, carpet_rows=carpet_rows)
+    for start in range(0, data.shape[3], block_volumes):
+        accumulator.update(data[..., start : start + block_volumes])
+    return accumulator
+
+
+@pytest.mark.parametrize("block_volumes", [1, 7, 25])
+def test_accumulator_matches_full_pass(timeseries, block_volumes):
+    """Test that metrics streamed in blocks match those of the whole timeseries."""
+    data, mask = timeseries
+    voxels = data[mask]
+
+    accumulator = _accumulate(data, mask, block_volumes)
+
+    expected_tsnr = voxels.mean(axis=1) / voxels.std(axis=1)
+    assert np.allclose(accumulator.tsnr()[mask], expected_tsnr, rtol=1e-5)
+    assert np.all(accumulator.tsnr()[~mask] == 0)
+    expected_dvars = np.sqrt(np.mean(np.diff(voxels, axis=1) ** 2, axis=0))
+    assert np.allclose(accumulator.dvars(), expected_dvars)
+    assert np.allclose(accumulator.global_signal(), voxels.mean(axis=0))
+
+    carpet = accumulator.carpet()
+    assert carpet.shape == voxels.shape
+    assert np.allclose(carpet.mean(axis=1), 0, atol=1e-5)
+
+
+def test_accumulator_scrubbed_volumes(timeseries):
+    """Test that scrubbed volumes are left out of tSNR, and give NaN DVARS."""
+    data, mask = timeseries
+    data[..., [3, 10]] = np.nan
+    kept = np.setdiff1d(np.arange(data.shape[3]), [3, 10])
+
+    accumulator = _accumulate(data, mask, 4)
+
+    voxels = data[mask][:, kept]
+    expected_tsnr = voxels.mean(axis=1) / voxels.std(axis=1)
+    assert np.allclose(accumulator.tsnr()[mask], expected_tsnr, rtol=1e-5)
+    dvars = accumulator.dvars()
+    assert np.isnan(dvars[[2, 3, 9, 10]]).all()
+    assert np.isfinite(np.delete(dvars, [2, 3, 9, 10])).all()
+    assert np.isnan(accumulator.global_signal()[[3, 10]]).all()
+
+
+def test_accumulator_carpet_rows(timeseries):
+    data, mask = timeseries
+
+    accumulator = _accumulate(data, mask, 10, carpet_rows=5)
+
+    assert accumulator.carpet().shape == (5, data.shape[3])
+
+
+def test_accumulate_image(sample_raw_image, sample_raw_image_mask):
+    """Test that streaming an image matches reading it whole."""
+    import nibabel as nib
+
+    data = nib.load(sample_raw_image).get_fdata()
+    mask = np.asarray(nib.load(sample_raw_image_mask).dataobj) != 0
+
+    accumulator = accumulate_image(sample_raw_image, mask, block_volumes=3)
+
+    assert np.allclose(accumulator.global_signal(), data[mask].mean(axis=0), rtol=1e-6)
+    assert accumulator.dvars().size == data.shape[3] - 1
+
+
+def test_qc_image(
+    tmp_path, sample_raw_image, sample_raw_image_mask, sample_confounds_timeseries
+):
+    """Test that the QC metrics and arrays are saved."""
+    import nibabel as nib
+
+    n_volumes = nib.load(sample_raw_image).shape[3]
+    scrub_vector = [0] * n_volumes
+    scrub_vector[2] = 1
+    export_path = tmp_path / f"sub-01_task-rest_run-1{QC_SUFFIX}"
+
+    qc_file = qc_image(
+        str(sample_raw_image),
+        out_file=str(sample_raw_image),
+        mask_file=str(sample_raw_image_mask),
+        confounds_file=str(sample_confounds_timeseries),
+        scrub_vector=scrub_vector,
+        carpet_rows=50,
+        export_path=str(export_path),
+    )
+
+    with open(qc_file) as file_to_read:
+        metrics = json.load(file_to_read)
+    assert metrics["n_volumes_before"] == n_volumes
+    assert metrics["mean_tsnr_before"] == pytest.approx(metrics["mean_tsnr_after"])
+    assert metrics["mean_fd"] > 0
+    assert metrics["n_scrubbed"] == 1
+    assert metrics["percent_scrubbed"] == pytest.approx(100 / n_volumes)
+
+    arrays = np.load(tmp_path / f"sub-01_task-rest_run-1{QC_ARRAYS_SUFFIX}")
+    assert arrays["tsnr_after"].shape == nib.load(sample_raw_image).shape[:3]
+    assert arrays["carpet_before"].shape == (50, n_volumes)
+    assert arrays["dvars_after"].shape == (n_volumes - 1,)
+
+
+def test_qc_image_without_output(tmp_path, sample_raw_image):
+    """Test that only the input's metrics are saved without a postprocessed image."""
+    qc_file = qc_image(
+        str(sample_raw_image), export_path=str(tmp_path / f"image{QC_SUFFIX}")
+    )
+
+    with open(qc_file) as file_to_read:
+        metrics = json.load(file_to_read)
+    assert "mean_tsnr_before" in metrics
+    assert "mean_tsnr_after" not in metrics
+    assert metrics["percent_scrubbed"] is None
+
+
+def test_load_qc(tmp_path):
+    """Test that QC files are gathered into a table with their BIDS entities."""
+    for subject, tsnr in (("01", 50.0), ("02", 60.0)):
+        subject_dir = tmp_path / f"sub-{subject}" / "func"
+        subject_dir.mkdir(parents=True)
+        image = f"sub-{subject}_task-rest_run-1_desc-preproc_bold.nii.gz"
+        with open(subject_dir / f"sub-{subject}_task-rest{QC_SUFFIX}", "w") as f:
+            json.dump({"image": image, "mean_tsnr_before": tsnr}, f)
+
+    qc = load_qc(tmp_path)
+
+    assert list(qc["sub"]) == ["01", "02"]
+    assert list(qc.columns[:3]) == ["sub", "task", "run"]
+    assert list(qc["mean_tsnr_before"]) == [50.0, 60.0]
+
+
+def test_load_qc_empty(tmp_path):
+    assert load_qc(tmp_path).empty
@@ -0,0 +1,122 @@
+from clpipe.postprocutils.resample import (
+    CACHE_PREFIX,
+    resample,
+    resample_image,
+    resampling_matrix,
+)
+import nibabel as nib
+import numpy as np
+import pytest
+from scipy import ndimage
+
+
+@pytest.fixture
+def grids():
+    """A small source grid, and an oblique, shifted reference grid with finer
+    voxels which partly falls outside of it."""
+    source_affine = np.diag([3.0, 3.0, 4.0, 1.0])
+    source_affine[:3, 3] = [-12, -15, -8]
+    angle = np.deg2rad(10)
+    rotation = np.array(
+        [
+            [np.cos(angle), -np.sin(angle), 0],
+            [np.sin(angle), np.cos(angle), 0],
+            [0, 0, 1],
+        ]
+    )
+    reference_affine = np.eye(4)
+    reference_affine[:3, :3] = rotation * 2
+    reference_affine[:3, 3] = [-14, -13, -9]
+    return (9, 11, 5), source_affine, (14, 15, 12), reference_affine
+
+
+def _map_coordinates(data, source_affine, reference_shape, reference_affine):
+    mapping = np.linalg.inv(source_affine) @ reference_affine
+    volumes = [
+        ndimage.affine_transform(
+            data[..., volume],
+            mapping[:3, :3],
+            offset=mapping[:3, 3],
+            output_shape=reference_shape,
+            order=1,
+            mode="grid-constant",
+            cval=0,
+        )
+        for volume in range(data.shape[3])
+    ]
+    return np.stack(volumes, axis=3)
+
+
+def test_resample_matches_map_coordinates(grids):
+    """Test that the matrix resamples trilinearly, as scipy does."""
+    source_shape, source_affine, reference_shape, reference_affine = grids
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal(source_shape + (6,))
+
+    matrix = resampling_matrix(
+        source_shape, source_affine, reference_shape, reference_affine
+    )
+    resampled = resample(data, matrix, reference_shape, n_threads=4)
+
+    expected = _map_coordinates(data, source_affine, reference_shape, reference_affine)
+    assert resampled.shape == reference_shape + (6,)
+    assert np.allclose(resampled, expected, atol=1e-5)
+
+
+def test_resample_identity():
+    """Test that resampling onto the same grid leaves the data unchanged."""
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    data = np.random.default_rng(0).standard_normal((4, 5, 6, 3))
+
+    matrix = resampling_matrix(data.shape, affine, data.shape[:3], affine)
+
+    assert np.allclose(resample(data, matrix, data.shape[:3]), data, atol=1e-6)
+
+
+def test_resampling_matrix_disk_cache(grids, tmp_path):
+    """Test that the matrix is saved once per pair of grids, and loaded back."""
+    source_shape, source_affine, reference_shape, reference_affine = grids
+
+    matrix = resampling_matrix(
+        source_shape, source_affine, reference_shape, reference_affine, tmp_path
+    )
+    cache_files = list(tmp_path.glob(f"{CACHE_PREFIX}*.npz"))
+    assert len(cache_files) == 1
+
+    # A new cache directory pointing at the same file bypasses the memory cache
+    cached = resampling_matrix(
+        source_shape,
+        source_affine,
+        reference_shape,
+        reference_affine,
+        tmp_path / ".." / tmp_path.name,
+    )
+    assert len(list(tmp_path.glob(f"{CACHE_PREFIX}*.npz"))) == 1
+    assert (cached != matrix).nnz == 0
+
+    resampling_matrix(source_shape, source_affine, reference_shape, np.eye(4), tmp_path)
+    assert len(list(tmp_path.glob(f"{CACHE_PREFIX}*.npz"))) == 2
+
+
+def test_resample_image(grids, tmp_path):
+    """Test that the output takes the reference's grid and keeps the TR."""
+    source_shape, source_affine, reference_shape, reference_affine = grids
+    data = np.random.default_rng(0).standard_normal(source_shape + (3,))
+    source = nib.Nifti1Image(data.astype(np.float32), source_affine)
+    source.header.set_zooms((3.0, 3.0, 4.0, 2.0))
+    nib.save(source, tmp_path / "source.nii.gz")
+    nib.save(
+        nib.Nifti1Image(np.zeros(reference_shape, dtype=np.float32), reference_affine),
+        tmp_path / "reference.nii.gz",
+    )
+
+    out_path = resample_image(
+        tmp_path / "source.nii.gz",
+        tmp_path / "reference.nii.gz",
+        export_path=tmp_path / "resampled.nii.gz",
+    )
+
+    resampled = nib.load(out_path)
+    assert resampled.shape == reference_shape + (3,)
+    assert np.allclose(resampled.affine, reference_affine, atol=1e-5)
+    assert resampled.header.get_zooms()[3] == pytest.approx(2.0)
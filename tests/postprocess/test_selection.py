@@ -0,0 +1,84 @@
+from clpipe.postprocutils.selection import (
+    select_image,
+    select_timepoints,
+    timepoint_selection,
+)
+import nibabel as nib
+import numpy as np
+import pytest
+
+
+def test_timepoint_selection_in_order():
+    """Test that each operation indexes the timepoints left by the previous ones."""
+    scrub_vector = [0, 1, 0, 0, 1, 0, 0]
+    operations = [
+        {"step": "TrimTimepoints", "from_beginning": 2, "from_end": 1},
+        {"step": "ScrubTimepoints", "insert_na": False},
+        {"step": "ApplyMask"},
+        {"step": "ScrubTimepoints", "insert_na": True},
+    ]
+
+    timepoints, missing = timepoint_selection(10, operations, scrub_vector)
+
+    assert timepoints.tolist() == [2, 4, 5, 7, 8]
+    assert missing.tolist() == [False, True, False, False, True]
+
+
+def test_timepoint_selection_unknown_step():
+    with pytest.raises(ValueError):
+        timepoint_selection(10, [{"step": "TemporalFiltering"}])
+
+
+def test_select_timepoints_reads_range():
+    """Test that only the range of volumes needed is read, and contiguous
+    selections are returned as read."""
+    data = np.arange(2 * 10).reshape(2, 10)
+
+    assert np.shares_memory(select_timepoints(data, np.array([3, 4, 5])), data)
+    assert select_timepoints(data, np.array([2, 5, 6])).tolist() == (
+        data[:, [2, 5, 6]].tolist()
+    )
+
+
+def test_select_image_matches_steps(sample_raw_image, sample_raw_image_mask, tmp_path):
+    """Test that a fused selection matches trimming, masking and scrubbing in
+    turn, converting an integer image to float32 for its NaNs."""
+    scrub_vector = [0, 1, 0, 0, 0, 1, 0, 0]
+    operations = [
+        {"step": "TrimTimepoints", "from_beginning": 1, "from_end": 1},
+        {"step": "ApplyMask"},
+        {"step": "ScrubTimepoints", "insert_na": True},
+    ]
+
+    out_path = select_image(
+        sample_raw_image,
+        operations,
+        scrub_vector=scrub_vector,
+        mask_file=sample_raw_image_mask,
+        export_path=tmp_path / "selected.nii.gz",
+    )
+
+    image = nib.load(sample_raw_image)
+    expected = image.get_fdata()[..., 1:-1]
+    mask = nib.load(sample_raw_image_mask).get_fdata() != 0
+    expected[~mask] = 0
+    expected[..., [1, 5]] = np.nan
+
+    selected = nib.load(out_path)
+    assert selected.get_data_dtype() == np.float32
+    assert np.allclose(selected.get_fdata(), expected, equal_nan=True)
+
+
+def test_select_image_keeps_dtype(sample_raw_image, tmp_path):
+    """Test that removing timepoints keeps an integer image's dtype."""
+    out_path = select_image(
+        sample_raw_image,
+        [{"step": "ScrubTimepoints", "insert_na": False}],
+        scrub_vector=[1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+        export_path=tmp_path / "selected.nii.gz",
+    )
+
+    image = nib.load(sample_raw_image)
+    selected = nib.load(out_path)
+    assert selected.get_data_dtype() == image.get_data_dtype()
+    assert np.array_equal(selected.get_fdata(), image.get_fdata()[..., 1:-1])
@@ -0,0 +1,79 @@
+from clpipe.postprocutils.spec_interpolate import spec_inter
+import numpy as np
+import pytest
+
+TR = 2.0
+OVERSAMPLING_FREQ = 8
+PERCENT_FREQ_SAMPLE = 1.0
+
+
+def _spec_inter_loop(arr, scrub_mask):
+    """Reference interpolation, fitting each frequency's Lomb-Scargle terms one at
+    a time."""
+    good = np.flatnonzero(scrub_mask == 0)
+    bad = np.flatnonzero(scrub_mask == 1)
+    times_good = (good + 1) * TR
+    times_all = (np.arange(arr.shape[0]) + 1) * TR
+    timespan = times_good.max() - times_good.min()
+    step = 1 / (timespan * OVERSAMPLING_FREQ)
+    freqs = np.arange(
+        step, PERCENT_FREQ_SAMPLE * good.size / (2 * timespan) + step, step
+    )
+
+    recon = np.zeros((arr.shape[0], arr.shape[1]))
+    for freq in freqs:
+        w = 2 * np.pi * freq
+        offset = np.arctan2(
+            np.sin(2 * w * times_good).sum(), np.cos(2 * w * times_good).sum()
+        ) / (2 * w)
+        cos_term = np.cos(w * (times_good - offset))
+        sin_term = np.sin(w * (times_good - offset))
+        cosine = cos_term @ arr[good] / (cos_term @ cos_term)
+        sine = sin_term @ arr[good] / (sin_term @ sin_term)
+        recon += np.outer(np.cos(w * times_all), cosine)
+        recon += np.outer(np.sin(w * times_all), sine)
+
+    recon /= recon.std(0, ddof=1) / arr[good].std(0, ddof=1)
+    expected = arr.copy()
+    expected[bad] = recon[bad]
+    return expected
+
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_spec_inter(n_threads):
+    """Test that only scrubbed timepoints are replaced, matching a fit of each
+    frequency in turn, across blocks of voxels."""
+    rng = np.random.default_rng(0)
+    arr = rng.standard_normal((80, 25)).cumsum(axis=0) + 100
+    scrub_mask = np.zeros(80, dtype=int)
+    scrub_mask[[0, 10, 11, 12, 40, 79]] = 1
+
+    interpolated = spec_inter(
+        arr,
+        TR,
+        OVERSAMPLING_FREQ,
+        scrub_mask,
+        PERCENT_FREQ_SAMPLE,
+        binSize=10,
+        n_threads=n_threads,
+        dtype=np.float64,
+    )
+
+    assert np.allclose(interpolated, _spec_inter_loop(arr, scrub_mask))
+    assert np.array_equal(interpolated[scrub_mask == 0], arr[scrub_mask == 0])
+
+
+def test_spec_inter_float32():
+    """Test that the default float32 reconstruction stays close to float64."""
+    rng = np.random.default_rng(1)
+    arr = rng.standard_normal((60, 40)) * 50 + 1000
+    scrub_mask = np.zeros(60, dtype=int)
+    scrub_mask[[5, 30, 31]] = 1
+
+    interpolated = spec_inter(
+        arr, TR, OVERSAMPLING_FREQ, scrub_mask, PERCENT_FREQ_SAMPLE, 16
+    )
+
+    expected = _spec_inter_loop(arr, scrub_mask)
+    assert interpolated.dtype == arr.dtype
+    assert np.allclose(interpolated, expected, rtol=1e-4)
@@ -1,6 +1,17 @@
-from clpipe.postprocutils.utils import nii_to_matrix, matrix_to_nii, scrub_image
+from clpipe.postprocutils.utils import (
+    nii_to_matrix,
+    matrix_to_nii,
+    scrub_image,
+    get_scrub_vector,
+    get_multiple_scrub_vector_node,
+    construct_motion_outliers,
+    save_image,
+    strip_image_extension,
+)
 import nibabel as nib
 import numpy as np
+import pandas as pd
+import pytest
 
 
 def test_nii_to_matrix(sample_raw_image):
@@ -27,6 +38,36 @@ def test_matrix_to_nii(sample_raw_image):
     assert np.array_equal(nii.affine, orig_affine)
 
 
+def test_nii_to_matrix_float32(sample_raw_image):
+    """Test that images are read in float32 by default."""
+    matrix, _, _ = nii_to_matrix(sample_raw_image)
+
+    assert matrix.dtype == np.float32
+
+
+@pytest.mark.parametrize("dtype,tolerance", [("float32", 0), ("int16", 1e-2)])
+def test_save_image(dtype, tolerance, tmp_path):
+    """Test that images are saved as float32, or as scaled int16 with NaNs as 0."""
+    data = np.random.default_rng(0).uniform(0, 1000, (4, 4, 4, 3))
+    data[..., 1] = np.nan
+
+    save_image(data, np.eye(4), None, tmp_path / "image.nii.gz", dtype=dtype)
+
+    image = nib.load(tmp_path / "image.nii.gz")
+    assert image.get_data_dtype() == np.dtype(dtype)
+    saved = image.get_fdata()
+    assert np.allclose(saved[..., [0, 2]], data[..., [0, 2]], atol=tolerance)
+    if dtype == "int16":
+        assert np.all(saved[..., 1] == 0)
+    else:
+        assert np.all(np.isnan(saved[..., 1]))
+
+
+def test_save_image_unsupported_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        save_image(np.zeros((2, 2, 2)), np.eye(4), None, tmp_path / "a.nii", "uint8")
+
+
 def test_scrub_image_no_insert_na(
     artifact_dir, sample_raw_image, plot_img, request, helpers
 ):
@@ -43,3 +84,90 @@ def test_scrub_image_no_insert_na(
 
     if plot_img:
         helpers.plot_4D_img_slice(scrubbed_path, "scrubbed.png")
+
+
+@pytest.mark.parametrize(
+    "fd_behind,fd_ahead,fd_contig,expected",
+    [
+        (0, 0, 0, [0, 0, 1, 0, 0, 0, 0, 1, 0, 0]),
+        (1, 0, 0, [0, 1, 1, 0, 0, 0, 1, 1, 0, 0]),
+        (0, 2, 0, [0, 0, 1, 1, 1, 0, 0, 1, 1, 1]),
+        (2, 0, 0, [1, 1, 1, 0, 0, 1, 1, 1, 0, 0]),
+        (0, 0, 3, [1, 1, 1, 0, 0, 0, 0, 1, 1, 1]),
+        (1, 1, 4, [1, 1, 1, 1, 1, 1, 1, 1, 1, 1]),
+    ],
+)
+def test_get_scrub_vector(fd_behind, fd_ahead, fd_contig, expected):
+    """Test scrubbing around targets and of short runs between them."""
+    fdts = [np.nan, 0.1, 0.5, 0.1, 0.1, 0.2, 0.1, 0.9, 0.1, 0.1]
+
+    scrub_vector = get_scrub_vector(fdts, 0.3, fd_behind, fd_ahead, fd_contig)
+
+    assert scrub_vector == expected
+
+
+def test_get_scrub_vector_scrubs_exactly_n():
+    """Test that scrubbing 2 behind and ahead scrubs exactly 2 timepoints each way.
+
+    Older versions scrubbed a triangular number of timepoints (3 for 2)."""
+    fdts = [0.0] * 5 + [1.0] + [0.0] * 5
+
+    scrub_vector = get_scrub_vector(fdts, 0.3, 2, 2, 0)
+
+    assert scrub_vector == [0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0]
+
+
+def test_get_multiple_scrub_vector_node(tmp_path):
+    """Test that scrub configs, including wildcards, are combined with OR."""
+    confounds_file = tmp_path / "confounds.tsv"
+    pd.DataFrame(
+        {
+            "framewise_displacement": [0.1, 0.1, 0.1, 1.2, 0.1, 0.1, 0.1, 0.1],
+            "outlier00": [1, 0, 0, 0, 0, 0, 0, 0],
+            "outlier01": [0, 0, 0, 0, 0, 0, 1, 0],
+        }
+    ).to_csv(confounds_file, sep="\t", index=False)
+    scrub_configs = [
+        {
+            "target_variable": "framewise_displacement",
+            "threshold": 0.9,
+            "scrub_ahead": 1,
+            "scrub_behind": 0,
+            "scrub_contiguous": 0,
+        },
+        {
+            "target_variable": "outlier*",
+            "threshold": 0,
+            "scrub_ahead": 0,
+            "scrub_behind": 0,
+            "scrub_contiguous": 0,
+        },
+    ]
+
+    scrub_vector = get_multiple_scrub_vector_node(confounds_file, scrub_configs)
+
+    assert scrub_vector == [1, 0, 0, 1, 1, 0, 1, 0]
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_construct_motion_outliers(sparse):
+    """Test that each scrubbed timepoint gets its own spike column."""
+    mot_outliers = construct_motion_outliers([0, 1, 0, 0, 1, 1, 0], sparse=sparse)
+
+    expected = np.zeros((7, 3), dtype=int)
+    expected[[1, 4, 5], [0, 1, 2]] = 1
+    assert np.array_equal(mot_outliers.to_numpy(), expected)
+    assert construct_motion_outliers([0, 0, 0], sparse=sparse).shape == (3, 0)
+
+
+@pytest.mark.parametrize(
+    "image_path,expected",
+    [
+        ("sub-1_bold.nii.gz", "sub-1_bold"),
+        ("sub-1_bold.nii", "sub-1_bold"),
+        ("out/sub-1_bold.nii.gz", "out/sub-1_bold"),
+    ],
+)
+def test_strip_image_extension(image_path, expected):
+    """Test that .nii and .nii.gz extensions are removed."""
+    assert strip_image_extension(image_path) == expected
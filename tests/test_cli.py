@@ -108,3 +108,22 @@ def test_update_config_cli_option_backup(legacy_config_dir: Path):
         ["-config_file", str(legacy_config_dir / "clpipe_config.json"), "-backup"],
     )
     assert result.exit_code == 0
+
+
+def test_postprocess_default_command():
+    """Test that postprocess arguments go to the run command unless they name
+    another postprocess command."""
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["postprocess", "-help"])
+    assert "profile" in result.output
+    assert "qc" in result.output
+
+    result = runner.invoke(cli, ["postprocess", "123", "-help"])
+    assert result.output.startswith("Usage: cli postprocess run")
+
+    result = runner.invoke(cli, ["postprocess", "profile", "-help"])
+    assert result.output.startswith("Usage: cli postprocess profile")
+
+    result = runner.invoke(cli, ["postprocess", "qc", "-help"])
+    assert result.output.startswith("Usage: cli postprocess qc")
@@ -1,6 +1,12 @@
 import pytest
 from pathlib import Path
-from clpipe.glm_launch import glm_launch
+from clpipe.glm_launch import (
+    glm_launch,
+    _create_native_l1_submission_strings,
+    _create_native_l2_submission_strings,
+    _create_submission_strings,
+    _filter_completed_fsfs,
+)
 
 
 def test_glm_launch_controller_L1(glm_config_file: Path):
@@ -28,3 +34,82 @@ def test_glm_launch_controller_invalid_level(glm_config_file: Path):
         glm_launch(glm_config_file=glm_config_file, level="L4", model="example_L1")
 
     assert e.value.code == 1
+
+
+def test_create_native_l1_submission_strings(glm_config_file: Path):
+    """Check that native L1 images are bundled into jobs."""
+    images = [f"sub-{i}_bold.nii.gz" for i in range(5)]
+
+    submission_strings = _create_native_l1_submission_strings(
+        images, "example", glm_config_file, images_per_job=2
+    )
+
+    assert len(submission_strings) == 3
+    assert submission_strings["example_native_l1_1"].endswith(
+        f"{Path(images[0]).absolute()} {Path(images[1]).absolute()}"
+    )
+    assert submission_strings["example_native_l1_3"].endswith(
+        f" {Path(images[4]).absolute()}"
+    )
+
+
+def test_create_native_l2_submission_strings(glm_config_file: Path):
+    """Check that native L2 groups are bundled into jobs."""
+    fsf_names = [f"sub-{i}" for i in range(5)]
+
+    submission_strings = _create_native_l2_submission_strings(
+        fsf_names, "example", glm_config_file, groups_per_job=2
+    )
+
+    assert len(submission_strings) == 3
+    assert submission_strings["example_native_l2_3"].endswith(" sub-4")
+
+    submission_strings = _create_native_l2_submission_strings(
+        fsf_names, "example", glm_config_file, test_one=True, groups_per_job=2
+    )
+
+    assert list(submission_strings) == ["example_native_l2_1"]
+    assert submission_strings["example_native_l2_1"].endswith(" sub-0")
+
+
+def test_create_submission_strings_bundled(tmp_path: Path):
+    """Check that .fsf files are bundled into jobs run with NThreads processes."""
+    fsf_files = [tmp_path / f"sub-{i}.fsf" for i in range(5)]
+
+    submission_strings = _create_submission_strings(
+        fsf_files, fsfs_per_job=2, n_threads=4
+    )
+
+    assert list(submission_strings) == [
+        "sub-0_bundle-2",
+        "sub-2_bundle-2",
+        "sub-4",
+    ]
+    assert submission_strings["sub-0_bundle-2"].endswith(
+        f"echo {fsf_files[0]} {fsf_files[1]} | xargs -n 1 -P 4 feat"
+    )
+    assert submission_strings["sub-4"] == f"unset PYTHONPATH; feat {fsf_files[4]}"
+
+
+def test_filter_completed_fsfs(tmp_path: Path):
+    """Check that .fsf files with a finished FEAT report are skipped."""
+    import logging
+
+    fsf_files = []
+    for status in ["done", "running", "missing"]:
+        fsf = tmp_path / f"{status}.fsf"
+        fsf.write_text(f'set fmri(outputdir) "{tmp_path / status}"\n')
+        fsf_files.append(fsf)
+
+    (tmp_path / "done.feat").mkdir()
+    (tmp_path / "done.feat" / "report.html").write_text("<HTML>Done</HTML>")
+    (tmp_path / "running.feat").mkdir()
+    (tmp_path / "running.feat" / "report.html").write_text(
+        "<HTML><META HTTP-EQUIV=refresh CONTENT=5></HTML>"
+    )
+
+    remaining = _filter_completed_fsfs(
+        fsf_files, "L1", logging.getLogger("test_filter_completed_fsfs")
+    )
+
+    assert remaining == fsf_files[1:]
@@ -0,0 +1,180 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from clpipe.glm_native import (
+    build_l1_design,
+    fit_glm,
+    fit_l1_image,
+    fit_l2_fixed_effects,
+    t_to_z,
+)
+from clpipe.fsf import get_fsf_contrasts
+
+TR = 2.0
+N_TIMEPOINTS = 120
+
+
+@pytest.fixture
+def ev_files(tmp_path) -> list:
+    """Two alternating block EVs in FSL's 3-column format."""
+    ev_files = []
+    for i, name in enumerate(["task_a", "task_b"]):
+        onsets = np.arange(i * 20, N_TIMEPOINTS * TR, 40)
+        events = np.column_stack(
+            [onsets, np.full(onsets.size, 15.0), np.ones(onsets.size)]
+        )
+        ev_file = tmp_path / f"{name}.txt"
+        np.savetxt(ev_file, events)
+        ev_files.append(ev_file)
+    return ev_files
+
+
+def test_build_l1_design(ev_files):
+    design = build_l1_design(ev_files, N_TIMEPOINTS, TR)
+
+    assert design.shape == (N_TIMEPOINTS, 2)
+    # The HRF has unit sum, so a block's response peaks near the EV's amplitude
+    assert 0.9 < design[:, 0].max() < 1.2
+    # The HRF delays the response to the first block
+    assert design[0, 0] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_fit_glm_ols():
+    """Without AR(1) prewhitening, the fit should match ordinary least squares."""
+    rng = np.random.default_rng(0)
+    design = rng.standard_normal((100, 3))
+    data = design @ rng.standard_normal((3, 50)) + rng.standard_normal((100, 50))
+    contrasts = np.array([[1, -1, 0]])
+
+    results = fit_glm(data, design, contrasts, ar1=False)
+
+    design_c = np.column_stack([design, np.ones(100)])
+    expected, _, _, _ = np.linalg.lstsq(design_c, data, rcond=None)
+    assert np.allclose(results["pe"], expected[:3])
+    assert np.allclose(results["cope"], expected[0] - expected[1])
+    assert results["dof"] == 96
+
+
+def test_fit_glm_ar1(ev_files):
+    """Effects should be recovered from data with autocorrelated noise."""
+    rng = np.random.default_rng(0)
+    design = build_l1_design(ev_files, N_TIMEPOINTS, TR)
+    betas = np.array([[5.0] * 20 + [0.0] * 20, [0.0] * 40])
+
+    noise = rng.standard_normal((N_TIMEPOINTS, 40))
+    for t in range(1, N_TIMEPOINTS):
+        noise[t] += 0.4 * noise[t - 1]
+    data = 100 + design @ betas + noise
+
+    results = fit_glm(data, design, np.eye(2))
+
+    assert np.allclose(results["pe"][0, :20], 5.0, atol=1.0)
+    assert np.all(results["zstat"][0, :20] > 5)
+    assert np.abs(results["zstat"][1]).mean() < 2
+
+
+def test_t_to_z():
+    tstat = np.array([-40.0, -2.0, 0.0, 2.0, 40.0])
+    zstat = t_to_z(tstat, 1000)
+
+    assert np.allclose(zstat, -zstat[::-1])
+    assert np.all(np.isfinite(zstat))
+    assert zstat[3] == pytest.approx(2.0, abs=0.01)
+
+
+def test_get_fsf_contrasts():
+    settings = {
+        "ncon_orig": "1",
+        "conname_orig.1": "a_vs_b",
+        "con_orig1.1": "1",
+        "con_orig1.2": "-1",
+    }
+
+    names, contrasts = get_fsf_contrasts(settings, ["a", "b"])
+
+    assert names == ["a_vs_b"]
+    assert np.array_equal(contrasts, [[1, -1]])
+
+    names, contrasts = get_fsf_contrasts({}, ["a", "b"])
+    assert names == ["a", "b"]
+    assert np.array_equal(contrasts, np.eye(2))
+
+
+def test_fit_l1_image(tmp_path, ev_files):
+    """Check that outputs are written in FEAT's .feat layout."""
+    rng = np.random.default_rng(0)
+    design = build_l1_design(ev_files, N_TIMEPOINTS, TR)
+    data = 100 + rng.standard_normal((4, 4, 4, N_TIMEPOINTS))
+    data += 3 * design[:, 0]
+    data[0] = 0
+
+    image_path = tmp_path / "sub-1_task-test_bold.nii.gz"
+    image = nib.Nifti1Image(data.astype(np.float32), np.eye(4))
+    image.header.set_zooms((2, 2, 2, TR))
+    nib.save(image, image_path)
+
+    confounds_path = tmp_path / "confounds.tsv"
+    confounds_path.write_text(
+        "motion\n" + "\n".join(str(v) for v in rng.standard_normal(N_TIMEPOINTS))
+    )
+
+    feat_dir = tmp_path / "sub-1_task-test.feat"
+    fit_l1_image(image_path, ev_files, feat_dir, confounds_file=confounds_path)
+
+    for output in [
+        "stats/pe3.nii.gz",
+        "stats/cope2.nii.gz",
+        "stats/varcope2.nii.gz",
+        "stats/zstat1.nii.gz",
+        "mask.nii.gz",
+        "mean_func.nii.gz",
+        "design.mat",
+        "design.con",
+    ]:
+        assert (feat_dir / output).exists()
+
+    cope = nib.load(str(feat_dir / "stats/cope1.nii.gz")).get_fdata()
+    assert np.all(cope[0] == 0)
+    assert np.allclose(cope[1:], 3.0, atol=1.0)
+
+
+def test_fit_l2_fixed_effects(tmp_path):
+    """Check fixed effects against an inverse-variance weighted average."""
+    rng = np.random.default_rng(0)
+    copes = rng.standard_normal((3, 4, 4, 4))
+    varcopes = rng.uniform(0.5, 2.0, (3, 4, 4, 4))
+    varcopes[1, 0, 0, 0] = 0
+
+    feat_dirs = []
+    for i in range(3):
+        stats_dir = tmp_path / f"run-{i}.feat" / "stats"
+        stats_dir.mkdir(parents=True)
+        for name, volume in [("cope1", copes[i]), ("varcope1", varcopes[i])]:
+            nib.save(nib.Nifti1Image(volume, np.eye(4)), stats_dir / f"{name}.nii.gz")
+        (stats_dir / "dof").write_text("100\n")
+        feat_dirs.append(stats_dir.parent)
+
+    out_dir = tmp_path / "sub-1.gfeat"
+    fit_l2_fixed_effects(feat_dirs, out_dir)
+
+    stats_dir = out_dir / "cope1.feat" / "stats"
+    cope = nib.load(stats_dir / "cope1.nii.gz").get_fdata()
+    varcope = nib.load(stats_dir / "varcope1.nii.gz").get_fdata()
+    weights = 1 / varcopes[:, 1:]
+    expected = (weights * copes[:, 1:]).sum(axis=0) / weights.sum(axis=0)
+    assert np.allclose(cope[1:], expected, atol=1e-5)
+    assert np.allclose(varcope[1:], 1 / weights.sum(axis=0), atol=1e-5)
+
+    # A voxel missing from any run is masked out
+    mask = nib.load(out_dir / "mask.nii.gz").get_fdata()
+    assert mask[0, 0, 0] == 0 and cope[0, 0, 0] == 0
+    assert mask[1:].all()
+
+    tdof = nib.load(stats_dir / "tdof_t1.nii.gz").get_fdata()
+    assert tdof[1, 0, 0] == 300
+
+
+def test_fit_l2_fixed_effects_missing_dir(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        fit_l2_fixed_effects([tmp_path / "missing.feat"], tmp_path / "out.gfeat")
@@ -2,6 +2,9 @@ import pytest
 from pathlib import Path
 from clpipe import glm_prepare
 
+# Keep a reference to the helper, as the controller tests monkeypatch it
+_original_glm_l1_propagate = glm_prepare._glm_l1_propagate
+
 
 def test_glm_prepare_controller_L1(glm_config_file: Path):
     """Check running glm_launch controller for L1."""
@@ -46,3 +49,126 @@ def _glm_l2_propagate_return(l2_block, reference_image, logger):
     assert l2_block["SubjectFile"] == "l2_sublist.csv"
     assert l2_block["ModelName"] == "example"
     assert reference_image == "SET REFERENCE"
+
+
+def test_glm_l1_propagate(tmp_path: Path):
+    """Check that .fsf files are written with EVs and confounds found through the
+    directory index, and that images missing EVs are skipped."""
+    import nibabel as nib
+    import numpy as np
+    from clpipe.utils import get_logger
+
+    prototype = tmp_path / "prototype.fsf"
+    prototype.write_text(
+        "set fmri(outputdir) \"\"\n"
+        "set fmri(npts) 0\n"
+        "set feat_files(1) \"\"\n"
+        "set fmri(custom1) \"\"\n"
+        "set fmri(custom2) \"\"\n"
+        "set confoundev_files(1) \"\"\n"
+        "set fmri(regstandard) \"\"\n"
+    )
+
+    target_suffix = "desc-postproc_bold.nii.gz"
+    for subject in ["1", "2"]:
+        image_dir = tmp_path / "postproc" / f"sub-{subject}" / "func"
+        image_dir.mkdir(parents=True)
+        nib.save(
+            nib.Nifti1Image(np.zeros((2, 2, 2, 7), dtype=np.float32), np.eye(4)),
+            image_dir / f"sub-{subject}_task-gonogo_{target_suffix}",
+        )
+
+        confound_dir = tmp_path / "confounds" / f"sub-{subject}"
+        confound_dir.mkdir(parents=True)
+        (confound_dir / f"sub-{subject}_task-gonogo_confounds.tsv").touch()
+
+    # Only sub-1 gets a full set of EVs
+    ev_dir = tmp_path / "EVs" / "sub-1"
+    ev_dir.mkdir(parents=True)
+    for ev in ["hit.txt", "miss.txt"]:
+        (ev_dir / f"sub-1_task-gonogo_{ev}").touch()
+    (tmp_path / "EVs" / "sub-2_task-gonogo_hit.txt").touch()
+
+    l1_block = {
+        "FSFPrototype": str(prototype),
+        "ImageIncludeList": "",
+        "ImageExcludeList": "",
+        "TargetDirectory": str(tmp_path / "postproc"),
+        "TargetSuffix": target_suffix,
+        "FSFDir": str(tmp_path / "fsfs"),
+        "EVDirectory": str(tmp_path / "EVs"),
+        "ConfoundDirectory": str(tmp_path / "confounds"),
+        "EVFileSuffices": ["hit.txt", "miss.txt"],
+        "ConfoundSuffix": "confounds.tsv",
+        "OutputDir": str(tmp_path / "l1_feat"),
+    }
+
+    _original_glm_l1_propagate(
+        l1_block, "gonogo", "", get_logger(glm_prepare.STEP_NAME, debug=True)
+    )
+
+    fsfs = sorted(path.name for path in (tmp_path / "fsfs").iterdir())
+    assert fsfs == ["sub-1_task-gonogo.fsf"]
+
+    fsf = (tmp_path / "fsfs" / "sub-1_task-gonogo.fsf").read_text()
+    assert "set fmri(npts) 7" in fsf
+    assert str(ev_dir / "sub-1_task-gonogo_miss.txt") in fsf
+    assert "sub-1_task-gonogo_confounds.tsv" in fsf
+
+
+@pytest.mark.parametrize("mode", ["copy", "link"])
+def test_apply_mumford_workaround(tmp_path: Path, monkeypatch, mode):
+    """Check that the workaround is applied once, and skipped when up to date."""
+    import logging
+    import os
+
+    fsl_dir = tmp_path / "fsl"
+    (fsl_dir / "etc/flirtsch").mkdir(parents=True)
+    identity_matrix = fsl_dir / "etc/flirtsch/ident.mat"
+    identity_matrix.write_text("1 0 0 0\n0 1 0 0\n0 0 1 0\n0 0 0 1\n")
+    monkeypatch.setenv("FSLDIR", str(fsl_dir))
+
+    feat_folders = tmp_path / "l1"
+    for i in range(3):
+        feat_folder = feat_folders / f"sub-{i}.feat"
+        (feat_folder / "reg").mkdir(parents=True)
+        (feat_folder / "reg" / "highres2standard.mat").write_text("old")
+        (feat_folder / "mean_func.nii.gz").write_bytes(os.urandom(64))
+
+    glm_prepare.glm_apply_mumford_workaround(
+        l1_feat_folders_path=feat_folders, mode=mode, n_threads=2
+    )
+
+    reg_folder = feat_folders / "sub-0.feat" / "reg"
+    assert [mat.name for mat in reg_folder.glob("*.mat")] == [
+        "example_func2standard.mat"
+    ]
+    assert (reg_folder / "standard.nii.gz").read_bytes() == (
+        feat_folders / "sub-0.feat" / "mean_func.nii.gz"
+    ).read_bytes()
+    if mode == "link":
+        assert os.path.samefile(
+            reg_folder / "example_func2standard.mat", identity_matrix
+        )
+
+    logger = logging.getLogger("test_apply_mumford_workaround")
+    assert not glm_prepare._apply_mumford_workaround(
+        feat_folders / "sub-0.feat", logger, mode=mode
+    )
+
+    # A changed mean_func image is picked up again
+    mean_func = feat_folders / "sub-1.feat" / "mean_func.nii.gz"
+    mean_func.unlink()
+    mean_func.write_bytes(os.urandom(128))
+    assert glm_prepare._apply_mumford_workaround(
+        feat_folders / "sub-1.feat", logger, mode=mode
+    )
+    assert (
+        feat_folders / "sub-1.feat" / "reg" / "standard.nii.gz"
+    ).read_bytes() == mean_func.read_bytes()
+
+    # A folder missing its mean_func image is not counted as applied
+    mean_func.unlink()
+    assert not glm_prepare._apply_mumford_workaround(
+        feat_folders / "sub-1.feat", logger, mode=mode
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from clpipe.roi_connectivity import compute_connectivity, fmri_roi_connectivity
+
+
+@pytest.fixture
+def roi_timeseries():
+    rng = np.random.default_rng(0)
+    timeseries = rng.standard_normal((50, 6))
+    timeseries[:, 1] += timeseries[:, 0]
+    return timeseries
+
+
+def _partial_from_sklearn(timeseries):
+    from sklearn.covariance import LedoitWolf
+
+    standardized = (timeseries - timeseries.mean(0)) / timeseries.std(0)
+    precision = np.linalg.inv(LedoitWolf().fit(standardized).covariance_)
+    diag = np.sqrt(np.diag(precision))
+    partial = -precision / np.outer(diag, diag)
+    np.fill_diagonal(partial, 1)
+    return partial
+
+
+def test_compute_connectivity(roi_timeseries):
+    results = compute_connectivity(roi_timeseries)
+
+    assert np.allclose(results["pearson"][0], np.corrcoef(roi_timeseries.T))
+    assert np.allclose(results["partial"][0], _partial_from_sklearn(roi_timeseries))
+    assert np.allclose(
+        results["fisher_z"][0][0, 1], np.arctanh(results["pearson"][0][0, 1])
+    )
+    assert np.all(np.diag(results["fisher_z"][0]) == 0)
+
+
+def test_compute_connectivity_nans(roi_timeseries):
+    """Scrubbed timepoints should be dropped, and NaN ROIs should get NaN
+    connectivity without affecting the rest of the batch."""
+    scrubbed = roi_timeseries.copy()
+    scrubbed[[3, 10], :] = np.nan
+    scrubbed[:, 4] = np.nan
+
+    results = compute_connectivity(np.stack([scrubbed, roi_timeseries]))
+    expected = np.delete(np.delete(roi_timeseries, [3, 10], axis=0), 4, axis=1)
+
+    assert list(results["n_timepoints"]) == [48, 50]
+    assert np.isnan(results["pearson"][0][4]).all()
+    assert np.allclose(
+        np.delete(np.delete(results["pearson"][0], 4, 0), 4, 1),
+        np.corrcoef(expected.T),
+    )
+    assert np.allclose(
+        np.delete(np.delete(results["partial"][0], 4, 0), 4, 1),
+        _partial_from_sklearn(expected),
+    )
+    assert np.allclose(results["pearson"][1], np.corrcoef(roi_timeseries.T))
+
+
+def test_fmri_roi_connectivity_csv(clpipe_dir, roi_timeseries):
+    """Check that connectivity is computed for a cohort of CSV outputs."""
+    config_file = clpipe_dir / "clpipe_config.json"
+    atlas_dir = clpipe_dir / "data_ROI_ts" / "power"
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    for subject in ["1", "2", "3"]:
+        np.savetxt(
+            atlas_dir / f"sub-{subject}_task-rest_bold_atlas-power.csv",
+            roi_timeseries,
+            delimiter=",",
+        )
+
+    fmri_roi_connectivity(config_file=config_file, atlas_name="power", batch_size=2)
+
+    with np.load(atlas_dir / "atlas-power_connectivity.npz") as connectivity:
+        assert connectivity["pearson"].shape == (3, 6, 6)
+        assert list(connectivity["subject"]) == ["1", "2", "3"]
@@ -3,11 +3,14 @@ from clpipe.config.options import ProjectOptions
 from pathlib import Path
 
 from clpipe.roi_extractor import (
+    build_manifest,
+    get_subject_manifest,
     fmri_roi_extraction,
     fmri_roi_extract_image,
     fmriprep_mask_finder,
     STEP_NAME,
 )
+from clpipe.errors import SubjectNotFoundError
 from clpipe.utils import get_logger
 
 
@@ -95,3 +98,67 @@ def test_fmriprep_mask_finder(clpipe_postproc_dir):
 
 
 
+
+
+def test_fmri_roi_extraction_npz(clpipe_postproc_dir):
+    """Check that the npz output format writes a shard per subject and atlas,
+    which can be merged into a single store."""
+    from clpipe.roi_extractor import fmri_roi_merge
+    from clpipe.roi_store import get_shard_path, get_store_path, load_roi_timeseries
+
+    config_file_path = clpipe_postproc_dir / "clpipe_config.json"
+    config: ProjectOptions = ProjectOptions.load(config_file_path)
+    config.roi_extraction.output_format = "npz"
+    config.roi_extraction.target_directory = str(
+        clpipe_postproc_dir / "data_postproc" / "default"
+    )
+    config.dump(config_file_path)
+
+    fmri_roi_extraction(
+        subjects=["1"], single=True, config_file=config_file_path, debug=True
+    )
+    output_dir = config.roi_extraction.output_directory
+    assert get_shard_path(output_dir, "power", "1").exists()
+
+    fmri_roi_merge(config_file=config_file_path)
+    data, index = load_roi_timeseries(get_store_path(output_dir, "power"))
+
+    assert data.shape[0] == len(index)
+    assert set(index["subject"]) == {"1"}
+
+
+def test_build_manifest(clpipe_postproc_dir):
+    """Check that the manifest pairs each subject's images with their masks."""
+    config_file_path = clpipe_postproc_dir / "clpipe_config.json"
+    config: ProjectOptions = ProjectOptions.load(config_file_path)
+    config.roi_extraction.target_directory = str(
+        clpipe_postproc_dir / "data_postproc" / "default"
+    )
+
+    manifest = build_manifest(config, ["1", "2"], task="gonogo")
+
+    assert set(manifest.keys()) == {"1", "2"}
+    assert len(manifest["1"]["images"]) > 0
+    assert all("task-gonogo" in image for image in manifest["1"]["images"])
+    assert all(
+        image.endswith(config.roi_extraction.target_suffix)
+        for image in manifest["1"]["images"]
+    )
+    assert all("desc-brain_mask" in mask for mask in manifest["1"]["masks"])
+
+    logger = get_logger(STEP_NAME, debug=True)
+    image_path = manifest["1"]["images"][0]
+    matching_mask = fmriprep_mask_finder(
+        image_path, config, logger, mask_index=set(manifest["1"]["masks"])
+    )
+    assert matching_mask in manifest["1"]["masks"]
+
+
+
+def test_get_subject_manifest_missing_subject():
+    """Check that a subject missing from the manifest raises an error."""
+    manifest = {"1": {"images": [], "masks": []}}
+
+    assert get_subject_manifest(manifest, "1") == manifest["1"]
+    with pytest.raises(SubjectNotFoundError):
+        get_subject_manifest(manifest, "2", "manifest.json")
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from clpipe.roi_store import (
+    build_record,
+    get_shard_path,
+    get_store_path,
+    load_roi_timeseries,
+    merge_roi_shards,
+    stored_images,
+    write_roi_shard,
+)
+
+N_ROIS = 4
+
+
+def _record(image_name, n_timepoints, value):
+    timeseries = np.full((n_timepoints, N_ROIS), float(value))
+    return build_record(f"/some/dir/{image_name}.nii.gz", timeseries)
+
+
+def test_build_record_parses_entities():
+    record = _record("sub-1_ses-2_task-rest_run-3_desc-postproc_bold", 5, 0)
+
+    assert record["image"] == "sub-1_ses-2_task-rest_run-3_desc-postproc_bold"
+    assert record["subject"] == "1"
+    assert record["session"] == "2"
+    assert record["task"] == "rest"
+    assert record["run"] == "3"
+    assert np.isnan(record["voxel_prop"]).all()
+
+
+def test_merge_roi_shards(tmp_path):
+    """Shards from separate jobs should merge into one store that loads back as a
+    NaN-padded (runs x time x ROI) array."""
+    write_roi_shard(
+        get_shard_path(tmp_path, "power", "1"),
+        [
+            _record("sub-1_task-rest_run-1_bold", 10, 1),
+            _record("sub-1_task-rest_run-2_bold", 8, 2),
+        ],
+    )
+    write_roi_shard(
+        get_shard_path(tmp_path, "power", "2"),
+        [_record("sub-2_task-gonogo_bold", 6, 3)],
+    )
+
+    store_path = merge_roi_shards(tmp_path, "power", remove_shards=True)
+    assert store_path == get_store_path(tmp_path, "power")
+    assert not get_shard_path(tmp_path, "power", "1").exists()
+
+    data, index = load_roi_timeseries(store_path)
+    assert data.shape == (3, 10, N_ROIS)
+    assert list(index["subject"]) == ["1", "1", "2"]
+    assert list(index["n_timepoints"]) == [10, 8, 6]
+    assert np.all(data[1, :8] == 2)
+    assert np.isnan(data[1, 8:]).all()
+
+    data, index = load_roi_timeseries(store_path, subject="1", run=2)
+    assert data.shape == (1, 8, N_ROIS)
+    assert list(index["image"]) == ["sub-1_task-rest_run-2_bold"]
+
+
+def test_write_roi_shard_replaces_image(tmp_path):
+    shard_path = get_shard_path(tmp_path, "power", "1")
+
+    write_roi_shard(shard_path, [_record("sub-1_task-rest_bold", 5, 1)])
+    write_roi_shard(
+        shard_path,
+        [_record("sub-1_task-rest_bold", 5, 7), _record("sub-1_task-nback_bold", 5, 2)],
+    )
+
+    assert stored_images(shard_path) == {
+        "sub-1_task-rest_bold",
+        "sub-1_task-nback_bold",
+    }
+    data, _ = load_roi_timeseries(shard_path, task="rest")
+    assert np.all(data == 7)
+
+
+def test_merge_roi_shards_no_shards(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        merge_roi_shards(tmp_path, "power")